@@ -0,0 +1,445 @@
+# asgi.py
+"""
+Async serving mode:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+POST /translate, GET /synthesize, POST /recognize_speech and POST /login run on the event loop and
+talk to googletrans, gTTS, Google speech and SMTP through non-blocking clients, so one process keeps
+hundreds of those calls in flight instead of one per thread. Every other route (pages, admin,
+exports, batch) is the normal Flask app run in a thread pool, and `python app.py` / gunicorn keep
+serving everything synchronously as before.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from flask import request, session, jsonify, render_template, redirect, url_for, current_app
+
+from app import create_app
+from utils import get_idiom_matcher_and_version
+from pipeline import plan_translation, finish_translation
+from preprocess import preprocess
+from result_cache import RESULT_CACHE
+from metrics import span
+from mailer import MailQueueFull, send_mail_async, otp_message
+from routes import (feature_required, start_otp_login, history_row, save_history_entries, audio_cache_headers,
+                    login_error_page)
+from rate_limit import rate_limited
+from translation import make_async_translator, translate_many_async
+from audio_cache import AUDIO_CACHE, make_async_synthesizer
+from speech import SPEECH_MAX_UPLOAD_BYTES, AudioTooLarge, open_audio, transcribe_async, make_async_recognizer
+
+# Threads for the Flask routes and blocking bits of the async ones (DB writes, file reads)
+ASGI_THREADS = int(os.getenv("PAD_ASGI_THREADS", 16))
+# Shared by every outgoing googletrans / gTTS / speech call in this process
+ASYNC_HTTP_CONNECTIONS = int(os.getenv("PAD_ASYNC_HTTP_CONNECTIONS", 100))
+ASYNC_HTTP_TIMEOUT = float(os.getenv("PAD_ASYNC_HTTP_TIMEOUT", 30))
+
+# Request bodies bigger than this go to a temp file instead of memory
+_SPOOL_BYTES = 1024 * 1024
+# Chunks a streamed Flask response may run ahead of a slow client
+_STREAM_QUEUE = 8
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def read_body(receive, limit):
+    """Reads the request body into a spooled temp file, giving up as soon as it passes limit bytes."""
+    body = tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES)
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            body.close()
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            body.close()
+            raise BodyTooLarge()
+        body.write(chunk)
+        if not message.get("more_body"):
+            break
+    body.seek(0)
+    return body, size
+
+
+def wsgi_environ(scope, body, length):
+    """The WSGI environ for an ASGI http scope, so werkzeug/Flask see an ordinary request."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(length),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name == "CONTENT_TYPE":
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _header_list(headers):
+    return [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+
+async def send_plain(send, status, text, content_type="text/plain; charset=utf-8"):
+    body = text.encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsyncApp:
+    """
+    ASGI front end for the Flask app. The async views below mirror their main_bp counterparts
+    and run inside a normal Flask request context, so session, templates, before/after_request
+    hooks (metrics, session cookie) and error handlers all behave the same.
+    """
+
+    def __init__(self, flask_app=None):
+        self.flask_app = flask_app or create_app()
+        self.pool = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+        self.client = None
+        self.routes = {
+            ("POST", "/translate"): self.translate,
+            ("GET", "/synthesize"): self.synthesize,
+            ("POST", "/recognize_speech"): self.recognize_speech,
+            ("POST", "/login"): self.login,
+        }
+
+    # --- ASGI plumbing ---
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return  # no websockets here
+        handler = self.routes.get((scope["method"], scope["path"]))
+
+        limit = self.flask_app.config.get("MAX_CONTENT_LENGTH")
+        if handler == self.recognize_speech:
+            limit = SPEECH_MAX_UPLOAD_BYTES
+        declared = dict(scope.get("headers", [])).get(b"content-length")
+        try:
+            if limit is not None and declared and declared.isdigit() and int(declared) > limit:
+                raise BodyTooLarge()
+            body, length = await read_body(receive, limit)
+        except BodyTooLarge:
+            message = f"Upload is larger than {limit // (1024 * 1024)} MB" if limit >= 1024 * 1024 else "Request too large"
+            return await send_plain(send, 413, json.dumps({"error": message}), "application/json")
+        except ClientDisconnected:
+            return
+
+        try:
+            environ = wsgi_environ(scope, body, length)
+            if handler is None:
+                await self.call_wsgi(environ, send)
+            else:
+                await self.call_async(handler, environ, send)
+        finally:
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def start(self):
+        """One pooled HTTP client (and backends on top of it) for the whole process."""
+        if self.client is not None:
+            return
+        self.client = httpx.AsyncClient(
+            http2=True, timeout=ASYNC_HTTP_TIMEOUT,
+            pool_limits=httpx.PoolLimits(max_connections=ASYNC_HTTP_CONNECTIONS,
+                                         soft_limit=ASYNC_HTTP_CONNECTIONS),
+        )
+        self.translator = make_async_translator(self.client)
+        self.synthesizer = make_async_synthesizer(self.client)
+        self.recognizer = make_async_recognizer(self.client)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        self.pool.shutdown(wait=False)
+
+    async def run_sync(self, fn, *args):
+        """Runs blocking work in the thread pool, still inside this request's Flask contexts."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, context.run, fn, *args)
+
+    async def call_async(self, handler, environ, send):
+        """full_dispatch_request() with an awaited view in the middle."""
+        app = self.flask_app
+        self.start()  # servers that skip lifespan events
+        ctx = app.request_context(environ)
+        ctx.push()
+        try:
+            try:
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await handler()
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+
+            await send({"type": "http.response.start", "status": response.status_code,
+                        "headers": _header_list(response.headers.items())})
+            stream = getattr(response, "async_body", None)
+            if stream is None:
+                await send({"type": "http.response.body", "body": response.get_data()})
+            else:
+                try:
+                    async for chunk in stream:
+                        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+                finally:
+                    await stream.aclose()
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            ctx.pop()
+
+    async def call_wsgi(self, environ, send):
+        """
+        Runs the Flask app for one request on a pool thread. The whole response, streamed
+        exports included, is produced on that one thread (stream_with_context needs it);
+        chunks come back over a small queue, so a slow client slows the producer down.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=_STREAM_QUEUE)
+        gone = threading.Event()
+
+        def put(kind, payload=None):
+            asyncio.run_coroutine_threadsafe(queue.put((kind, payload)), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put("start", (int(status.split(" ", 1)[0]), headers))
+            return lambda data: put("body", data)
+
+        def run():
+            try:
+                iterable = self.flask_app(environ, start_response)
+                try:
+                    for chunk in iterable:
+                        if gone.is_set():
+                            break
+                        if chunk:
+                            put("body", chunk)
+                finally:
+                    if hasattr(iterable, "close"):
+                        iterable.close()
+                put("end")
+            except BaseException as e:
+                put("error", e)
+
+        loop.run_in_executor(self.pool, run)
+        started = False
+        while True:
+            kind, payload = await queue.get()
+            if kind == "end":
+                break
+            if kind == "error":
+                logging.error("Unhandled error in WSGI route", exc_info=payload)
+                if not started:
+                    await send_plain(send, 500, "Internal Server Error")
+                    return
+                break
+            if gone.is_set():
+                continue  # keep draining so the producer thread can finish
+            try:
+                if kind == "start":
+                    started = True
+                    await send({"type": "http.response.start", "status": payload[0],
+                                "headers": _header_list(payload[1])})
+                else:
+                    await send({"type": "http.response.body", "body": payload, "more_body": True})
+            except Exception:
+                gone.set()
+        if not gone.is_set():
+            await send({"type": "http.response.body", "body": b""})
+
+    # --- async views (keep in step with routes.py) ---
+
+    @rate_limited("translate")
+    async def translate(self):
+        data = request.get_json()
+        if not data or "sentence" not in data:
+            return jsonify({"error": "Invalid request"}), 400
+
+        sentence = data.get("sentence", "").strip()
+        if not sentence:
+            return jsonify({"error": "Empty sentence"}), 400
+
+        # Version poll (maybe a reload), langdetect, matching and the SQLite-backed result cache
+        # all block, so they run on the pool; only the translation fan-out is awaited here
+        version, normalized, cached, plan = await self.run_sync(_plan_or_cached, sentence)
+        if cached:
+            response, history = cached
+        else:
+            with span("translate_external"):
+                translated = await translate_many_async(plan["jobs"], self.translator, run_sync=self.run_sync)
+            with span("build_response"):
+                response, history = finish_translation(plan, translated)
+            if version is not None and not any(isinstance(v, Exception) for v in translated.values()):
+                await self.run_sync(RESULT_CACHE.set, normalized, version, response, history)
+
+        await self.run_sync(save_history_entries, [history_row(sentence, **history)])
+        return jsonify(response)
+
+    @feature_required("tts")
+    @rate_limited("synthesize")
+    async def synthesize(self):
+        text = (request.args.get("text") or "").strip()
+        lang = request.args.get("lang", "kn")
+        if not text: return jsonify({"error": "No text"}), 400
+
+        etag = AUDIO_CACHE.key(text, lang, self.synthesizer.name)
+        if etag in request.if_none_match:
+            return audio_cache_headers(current_app.response_class(status=304), etag)
+        try:
+            _, path, _ = await AUDIO_CACHE.get_or_create_async(text, lang, self.synthesizer)
+            audio = await self.run_sync(_read_file, path)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        response = current_app.response_class(audio, mimetype="audio/mpeg")
+        response.headers["Content-Disposition"] = "inline; filename=speech.mp3"
+        response = audio_cache_headers(response, etag)
+        # Range and If-Modified-Since handling, as send_file(conditional=True) does
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(audio))
+
+    @feature_required("speech")
+    @rate_limited("recognize_speech")
+    async def recognize_speech(self):
+        # Size was already capped while reading the body; parsing the form is disk/CPU work
+        request.max_content_length = SPEECH_MAX_UPLOAD_BYTES
+        files = await self.run_sync(lambda: request.files)
+        if "audio" not in files: return jsonify({"error": "No audio"}), 400
+        file = files["audio"]
+        if file.filename == "": return jsonify({"error": "No file"}), 400
+
+        try:
+            segments = transcribe_async(open_audio(file.stream), self.recognizer)
+        except AudioTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if request.args.get("stream") in ("1", "true"):
+            async def generate():
+                texts = []
+                try:
+                    async for segment in segments:
+                        if segment.get("text"):
+                            texts.append(segment["text"])
+                        yield json.dumps(segment, ensure_ascii=False) + "\n"
+                    yield json.dumps({"done": True, "text": " ".join(texts)}, ensure_ascii=False) + "\n"
+                except ValueError as e:
+                    yield json.dumps({"done": True, "error": str(e), "text": " ".join(texts)}, ensure_ascii=False) + "\n"
+                finally:
+                    await segments.aclose()
+
+            # No body of its own (so no Content-Length); call_async sends async_body instead
+            response = current_app.response_class(iter(()), mimetype="application/x-ndjson")
+            response.async_body = generate()
+            return response
+
+        try:
+            results = [segment async for segment in segments]
+        except AudioTooLarge as e:
+            return jsonify({"error": str(e)}), 413
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        text = " ".join(s["text"] for s in results if s.get("text"))
+        errors = [s["error"] for s in results if "error" in s]
+        if not text and errors:
+            return jsonify({"error": errors[0]}), 500
+        return jsonify({"text": text, "segments": results})
+
+    @rate_limited("login", methods=("POST",), render=login_error_page)
+    async def login(self):
+        email = request.form.get("email", "").strip()
+        if not email:
+            return render_template("login.html", error="Enter a valid email")
+
+        otp = start_otp_login(email)
+        dispatcher = current_app.extensions.get("mail_dispatcher")
+        try:
+            if dispatcher:
+                # Queuing never blocks, so the background senders serve this mode too
+                session["otp_mail"] = dispatcher.submit(email, otp_message(otp))
+            else:
+                await send_mail_async(email, otp_message(otp))
+        except MailQueueFull:
+            return render_template("login.html", error="Too many logins right now. Try again in a minute.")
+        except Exception:
+            logging.exception("Failed to send OTP via SMTP")
+            return render_template("login.html", error="Failed to send OTP. Check server logs.")
+
+        return redirect(url_for("main.verify_otp"))
+
+
+def _plan_or_cached(sentence):
+    """/translate up to the network: (version, normalized sentence, cached result or None, plan or None)."""
+    matcher, version = get_idiom_matcher_and_version()
+    normalized = preprocess(sentence).text
+    with span("result_cache"):
+        cached = RESULT_CACHE.get(normalized, version) if version is not None else None
+    return version, normalized, cached, None if cached else plan_translation(sentence, matcher)
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+app = AsyncApp()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.getenv("PORT", 5000)))
@@ -0,0 +1,335 @@
+# audio_cache.py
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import external_call
+
+AUDIO_CACHE_DIR = os.getenv("PAD_AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("PAD_AUDIO_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+# Cache-Control max-age for /synthesize responses; the ETag lets clients revalidate after it
+AUDIO_MAX_AGE = int(os.getenv("PAD_AUDIO_MAX_AGE", 7 * 24 * 60 * 60))
+
+# "gtts" for Google TTS, "stub" for the offline StubSynthesizer
+SYNTHESIZER_BACKEND = os.getenv("PAD_SYNTHESIZER_BACKEND", "gtts")
+AUDIO_PRERENDER_WORKERS = int(os.getenv("PAD_AUDIO_PRERENDER_WORKERS", 4))
+
+
+class GTTSSynthesizer:
+    name = "gtts"
+
+    def synthesize(self, text, lang):
+        from gtts import gTTS  # loaded on first use, see features.py
+        mp3_fp = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+
+class StubSynthesizer:
+    """Offline stand-in for gTTS. Returns a few deterministic bytes per (text, lang) after an optional delay."""
+    name = "stub"
+
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on or set()
+        self.calls = 0
+
+    def synthesize(self, text, lang):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if text in self.fail_on:
+            raise RuntimeError(f"Stub synthesizer refused '{text}'")
+        return b"ID3STUB" + f"{lang}:{text}".encode("utf-8")
+
+
+def make_synthesizer():
+    if SYNTHESIZER_BACKEND == "stub":
+        return StubSynthesizer()
+    return GTTSSynthesizer()
+
+
+class AsyncGTTSSynthesizer:
+    """
+    The async serving mode's gTTS: gTTS prepares the requests, a shared httpx.AsyncClient
+    sends them, and the audio is pulled out of the reply the same way gTTS does it.
+    Same name as GTTSSynthesizer, so both modes share cached files.
+    """
+    name = "gtts"
+    _AUDIO = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+    def __init__(self, client):
+        self.client = client
+
+    async def synthesize(self, text, lang):
+        from gtts import gTTS  # loaded on first use, see features.py
+        from gtts.tts import gTTSError
+        tts = gTTS(text=text, lang=lang)
+        audio = io.BytesIO()
+        # Long texts are split into several requests, one per part
+        for prepared in tts._prepare_requests():
+            headers = {k: v for k, v in prepared.headers.items() if k.lower() != "content-length"}
+            r = await self.client.post(prepared.url, data=prepared.body.encode("utf-8"), headers=headers)
+            if r.status_code != 200:
+                raise gTTSError(msg=f"{r.status_code} ({r.reason_phrase}) from TTS API")
+            for line in r.text.splitlines():
+                if "jQ1olc" in line:
+                    found = self._AUDIO.search(line)
+                    if not found:
+                        raise gTTSError(msg="No audio stream in response")
+                    audio.write(base64.b64decode(found.group(1).encode("ascii")))
+        return audio.getvalue()
+
+
+class AsyncStubSynthesizer(StubSynthesizer):
+    async def synthesize(self, text, lang):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if text in self.fail_on:
+            raise RuntimeError(f"Stub synthesizer refused '{text}'")
+        return b"ID3STUB" + f"{lang}:{text}".encode("utf-8")
+
+
+def make_async_synthesizer(client):
+    if SYNTHESIZER_BACKEND == "stub":
+        return AsyncStubSynthesizer()
+    return AsyncGTTSSynthesizer(client)
+
+
+class AudioCache:
+    """
+    Content-addressed MP3 files on disk, keyed by sha256(backend, lang, text).
+    Hits touch the file's mtime, so the oldest mtimes are the least recently used
+    and eviction works the same no matter which worker wrote or read a file. That
+    makes the mtime a last-used time, not a last-modified one: don't serve it as such.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # One lock per key being synthesized, so concurrent misses only call the backend once
+        self._pending = {}
+        # The same for the async serving mode: one task per key, awaited by every request that wants it
+        self._pending_async = {}
+        self._size = None
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "failures": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    @staticmethod
+    def key(text, lang, backend):
+        return hashlib.sha256(f"{backend}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def lookup(self, key):
+        """Path of the cached file for key (marking it recently used), or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_create(self, text, lang, synthesizer):
+        """Returns (key, path, hit), synthesizing and storing the audio on a miss."""
+        key = self.key(text, lang, synthesizer.name)
+        path = self.lookup(key)
+        if path:
+            self._count("hits")
+            return key, path, True
+
+        with self._lock:
+            key_lock = self._pending.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                # Another thread may have stored it while we waited
+                path = self.lookup(key)
+                if path:
+                    self._count("hits")
+                    return key, path, True
+                self._count("misses")
+                try:
+                    with external_call("tts"):
+                        audio = synthesizer.synthesize(text, lang)
+                except Exception:
+                    self._count("failures")
+                    raise
+                return key, self._store(key, audio), False
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+    async def get_or_create_async(self, text, lang, synthesizer):
+        """get_or_create() for the event loop, with an async synthesizer."""
+        key = self.key(text, lang, synthesizer.name)
+        # lookup() touches the file on disk, so it stays off the event loop too
+        path = await asyncio.get_running_loop().run_in_executor(None, self.lookup, key)
+        if path:
+            self._count("hits")
+            return key, path, True
+        task = self._pending_async.get(key)
+        if task is None:
+            task = self._pending_async[key] = asyncio.ensure_future(self._create_async(key, text, lang, synthesizer))
+            task.add_done_callback(lambda _: self._pending_async.pop(key, None))
+        # Shielded: one client going away must not cancel the synthesis others are waiting on
+        return key, await asyncio.shield(task), False
+
+    async def _create_async(self, key, text, lang, synthesizer):
+        self._count("misses")
+        try:
+            with external_call("tts"):
+                audio = await synthesizer.synthesize(text, lang)
+        except Exception:
+            self._count("failures")
+            raise
+        # Writing (and maybe evicting) touches the disk, so it runs off the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self._store, key, audio)
+
+    def _store(self, key, audio):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so other workers never serve a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        try:
+            # Rewriting a key (e.g. another worker stored it first) replaces the old file's bytes
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        self._count("stores")
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += len(audio) - replaced
+            over = self._size > self.max_bytes
+        if over:
+            self._evict()
+        return path
+
+    def _scan(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """Deletes least recently used files until the cache is back under 90% of max_bytes."""
+        with self._lock:
+            # Rescan: other workers share the directory, so the running total is only an estimate
+            files = sorted(self._scan(), key=lambda f: f[2])
+            size = sum(f[1] for f in files)
+            target = self.max_bytes * 0.9
+            evicted = 0
+            for path, file_size, _ in files:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+                evicted += 1
+            self._size = size
+            self.counters["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+AUDIO_CACHE = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+
+def idiom_audio_jobs(idioms):
+    """The (text, lang) clips worth having ready for each idiom: the phrase and both explanations."""
+    jobs = []
+    for idiom_obj in idioms:
+        for text, lang in ((idiom_obj.get("idiom"), "kn"),
+                           (idiom_obj.get("explanation_kannada"), "kn"),
+                           (idiom_obj.get("explanation_english"), "en")):
+            if text and text.strip():
+                jobs.append((text.strip(), lang))
+    return list(dict.fromkeys(jobs))
+
+
+class AudioPrerender:
+    """Renders a list of clips into the cache on a background thread; one run at a time."""
+
+    def __init__(self, cache, synthesizer_factory=None, workers=AUDIO_PRERENDER_WORKERS):
+        self.cache = cache
+        self.synthesizer_factory = synthesizer_factory or make_synthesizer
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {"running": False, "total": 0, "rendered": 0, "cached": 0, "failed": 0,
+                       "started_at": None, "finished_at": None}
+
+    def start(self, jobs):
+        """Starts rendering jobs; returns False if a run is already in progress."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {"running": True, "total": len(jobs), "rendered": 0, "cached": 0, "failed": 0,
+                           "started_at": time.time(), "finished_at": None}
+            self._thread = threading.Thread(target=self.run, args=(jobs,), name="audio-prerender", daemon=True)
+            self._thread.start()
+        return True
+
+    def run(self, jobs):
+        synthesizer = self.synthesizer_factory()
+
+        def render(job):
+            text, lang = job
+            try:
+                _, _, hit = self.cache.get_or_create(text, lang, synthesizer)
+                outcome = "cached" if hit else "rendered"
+            except Exception as e:
+                logging.error(f"Could not pre-render audio for '{text}': {e}")
+                outcome = "failed"
+            with self._lock:
+                self.status[outcome] += 1
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="prerender") as pool:
+            list(pool.map(render, jobs))
+        with self._lock:
+            self.status["running"] = False
+            self.status["finished_at"] = time.time()
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_status(self):
+        with self._lock:
+            return dict(self.status)
+
+
+AUDIO_PRERENDER = AudioPrerender(AUDIO_CACHE)
@@ -0,0 +1,105 @@
+# benchmarks/bench_exact_match.py
+"""
+Compares the old per-idiom `in` scan with the Aho-Corasick matcher.
+
+    python benchmarks/bench_exact_match.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import IdiomMatcher, match_priority, replace_spans
+
+# Kannada consonants and vowel signs, enough to build word-like strings
+CONSONANTS = [chr(c) for c in range(0x0C95, 0x0CB9) if chr(c).isalpha()]
+SIGNS = ["", "ಾ", "ಿ", "ೀ", "ು", "ೂ", "ೆ", "ೇ", "ೊ", "ೋ", "ಂ"]
+
+
+def random_word(rng):
+    return "".join(rng.choice(CONSONANTS) + rng.choice(SIGNS) for _ in range(rng.randint(2, 4)))
+
+
+def make_idioms(n, rng):
+    seen = set()
+    idioms = []
+    while len(idioms) < n:
+        phrase = " ".join(random_word(rng) for _ in range(rng.randint(2, 4)))
+        if phrase in seen:
+            continue
+        seen.add(phrase)
+        idioms.append({"idiom": phrase, "explanation_english": None, "explanation_kannada": random_word(rng)})
+    idioms.sort(key=match_priority)
+    return idioms
+
+
+def make_sentences(idioms, count, rng):
+    sentences = []
+    for i in range(count):
+        words = [random_word(rng) for _ in range(rng.randint(6, 14))]
+        # Half the corpus contains one or two real idioms
+        if i % 2 == 0:
+            for _ in range(rng.randint(1, 2)):
+                words.insert(rng.randint(0, len(words)), rng.choice(idioms)['idiom'])
+        sentences.append(" ".join(words))
+    return sentences
+
+
+def legacy_scan(idioms, sentence):
+    """The pre-automaton exact pass from routes.translate(), minus the translation calls."""
+    working = sentence
+    found = []
+    for idiom_obj in idioms:
+        phrase = idiom_obj['idiom'].strip()
+        if not phrase: continue
+        if phrase in working:
+            found.append(phrase)
+            working = working.replace(phrase, idiom_obj.get("explanation_kannada") or "")
+    return found, working
+
+
+def automaton_scan(matcher, sentence):
+    found = []
+    replacements = []
+    for idiom_obj, phrase, spans in matcher.find_exact(sentence):
+        found.append(phrase)
+        replacements.extend((s, e, idiom_obj.get("explanation_kannada") or "") for s, e in spans)
+    return found, replace_spans(sentence, replacements)
+
+
+def run(size, sentence_count, rng):
+    idioms = make_idioms(size, rng)
+    sentences = make_sentences(idioms, sentence_count, rng)
+
+    t0 = time.perf_counter()
+    matcher = IdiomMatcher(idioms)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    legacy = [legacy_scan(idioms, s) for s in sentences]
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = [automaton_scan(matcher, s) for s in sentences]
+    fast_s = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(legacy, fast) if a != b)
+    print(f"{size:>7} idioms | build {build_s * 1000:8.1f} ms | "
+          f"legacy {legacy_s / len(sentences) * 1000:8.3f} ms/sent | "
+          f"automaton {fast_s / len(sentences) * 1000:8.3f} ms/sent | "
+          f"speedup {legacy_s / fast_s:7.1f}x | mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sentences", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, args.sentences, rng)
@@ -0,0 +1,103 @@
+# benchmarks/bench_fuzzy_match.py
+"""
+Compares the old fuzzywuzzy window loop with the n-gram indexed matcher.
+
+    python benchmarks/bench_fuzzy_match.py [--sizes 1000 10000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz
+from matcher import IdiomMatcher
+from bench_exact_match import make_idioms, random_word, SIGNS
+
+FUZZY_MATCH_CONFIDENCE = 85
+
+
+def mutate(phrase, rng):
+    """Swaps one vowel sign so the phrase is close to, but not exactly, the idiom."""
+    chars = list(phrase)
+    i = rng.randrange(len(chars))
+    chars[i] = rng.choice([s for s in SIGNS if s]) if chars[i] != " " else " "
+    return "".join(chars)
+
+
+def make_sentences(idioms, count, rng):
+    sentences = []
+    for i in range(count):
+        words = [random_word(rng) for _ in range(rng.randint(6, 14))]
+        if i % 2 == 0:
+            words.insert(rng.randint(0, len(words)), mutate(rng.choice(idioms)['idiom'], rng))
+        sentences.append(" ".join(words))
+    return sentences
+
+
+def legacy_fuzzy(idioms, sentence):
+    """The pre-index fuzzy pass from routes.translate()."""
+    best_match_idiom = None
+    highest_score = 0
+    best_match_phrase = ""
+    sentence_tokens = sentence.split()
+    for idiom_obj in idioms:
+        idiom_phrase = idiom_obj['idiom'].strip()
+        idiom_tokens = idiom_phrase.split()
+        if not idiom_tokens or len(idiom_tokens) > len(sentence_tokens): continue
+        for i in range(len(sentence_tokens) - len(idiom_tokens) + 1):
+            window_phrase = " ".join(sentence_tokens[i : i + len(idiom_tokens)])
+            score = fuzz.token_sort_ratio(idiom_phrase, window_phrase)
+            if score > highest_score:
+                highest_score = score
+                best_match_idiom = idiom_obj
+                best_match_phrase = window_phrase
+    if highest_score >= FUZZY_MATCH_CONFIDENCE and best_match_idiom:
+        return best_match_idiom['idiom'], best_match_phrase, highest_score
+    return None
+
+
+def indexed_fuzzy(matcher, sentence):
+    match = matcher.find_fuzzy(sentence, FUZZY_MATCH_CONFIDENCE)
+    if match is None:
+        return None
+    idiom_obj, phrase, score = match
+    return idiom_obj['idiom'], phrase, score
+
+
+def run(size, sentence_count, rng):
+    idioms = make_idioms(size, rng)
+    sentences = make_sentences(idioms, sentence_count, rng)
+
+    t0 = time.perf_counter()
+    matcher = IdiomMatcher(idioms)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    legacy = [legacy_fuzzy(idioms, s) for s in sentences]
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = [indexed_fuzzy(matcher, s) for s in sentences]
+    fast_s = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(legacy, fast) if a != b)
+    hits = sum(1 for r in fast if r)
+    print(f"{size:>7} idioms | build {build_s * 1000:8.1f} ms | "
+          f"legacy {legacy_s / len(sentences) * 1000:9.3f} ms/sent | "
+          f"indexed {fast_s / len(sentences) * 1000:8.3f} ms/sent | "
+          f"speedup {legacy_s / fast_s:7.1f}x | hits {hits} | mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--sentences", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, args.sentences, rng)
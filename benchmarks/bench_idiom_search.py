@@ -0,0 +1,86 @@
+# benchmarks/bench_idiom_search.py
+"""
+Times /idioms/search lookups on the suffix-array index and checks them against a plain scan.
+
+    python benchmarks/bench_idiom_search.py [--sizes 1000 10000 100000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_exact_match import make_idioms
+from search_index import SEARCH_MODES, IdiomSearchIndex, search_key
+
+
+def scan(keys, uses, query, k, mode, ranking):
+    """What the index should return, by checking every idiom."""
+    def rank(i):
+        return (-uses[i], len(keys[i]), i) if ranking == "popularity" else (len(keys[i]), -uses[i], i)
+    prefix = sorted((i for i, key in enumerate(keys) if key.startswith(query)), key=rank)
+    inside = sorted((i for i, key in enumerate(keys) if query in key), key=rank)
+    if mode == "prefix":
+        return prefix[:k]
+    if mode == "substring":
+        return inside[:k]
+    taken = set(prefix)
+    return (prefix + [i for i in inside if i not in taken])[:k]
+
+
+def random_queries(keys, count, rng):
+    queries = []
+    for _ in range(count):
+        key = rng.choice(keys)
+        start = rng.randrange(len(key))
+        queries.append(key[start:start + rng.randint(1, 8)].strip() or key[:2])
+    return queries
+
+
+def run(size, query_count, checks, rng):
+    idioms = make_idioms(size, rng)
+    keys = [search_key(obj["idiom"]) for obj in idioms]
+    # A third of the idioms have been seen in History
+    popularity = {key: rng.randint(1, 50) for key in rng.sample(keys, size // 3)}
+
+    t0 = time.perf_counter()
+    index = IdiomSearchIndex(idioms, popularity)
+    build_s = time.perf_counter() - t0
+    uses = index.uses.tolist()
+
+    mismatches = 0
+    for query in random_queries(keys, checks, rng):
+        for mode in SEARCH_MODES:
+            for ranking in ("popularity", "length"):
+                got = [search_key(r["idiom"]) for r in index.search(query, 10, mode, ranking)]
+                mismatches += got != [keys[i] for i in scan(keys, uses, query, 10, mode, ranking)]
+
+    queries = random_queries(keys, query_count, rng)
+    timings = []
+    for mode in SEARCH_MODES:
+        latencies = []
+        for query in queries:
+            t0 = time.perf_counter()
+            index.search(query, 10, mode)
+            latencies.append(time.perf_counter() - t0)
+        latencies.sort()
+        timings.append(f"{mode} p50 {latencies[len(latencies) // 2] * 1e6:5.0f} us "
+                       f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:5.0f} us")
+    print(f"{size:>7} idioms | build {build_s * 1000:8.1f} ms | " + " | ".join(timings)
+          + f" | mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--checks", type=int, default=20, help="queries compared with a full scan")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        run(size, args.queries, args.checks, rng)
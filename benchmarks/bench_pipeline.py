@@ -0,0 +1,284 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark / load test: idiom cache loading, /translate (exact, fuzzy and
+no-match paths) and the history exports, against a throwaway SQLite database with
+googletrans and gTTS stubbed out. Prints one JSON document so runs can be diffed across commits.
+
+    python benchmarks/bench_pipeline.py [--sizes 1000 10000] [--requests 300] [--concurrency 1 8]
+    python benchmarks/bench_pipeline.py --http                 # real HTTP against a local threaded server
+    python benchmarks/bench_pipeline.py --http --url http://127.0.0.1:5000 --db /tmp/bench.db --sizes 10000
+        # drive an external server started with DATABASE_URL=sqlite:////tmp/bench.db (seeded by this script)
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from bench_exact_match import make_idioms, random_word, SIGNS
+
+
+def mutate(phrase, rng):
+    """Swaps one vowel sign so the phrase is close to, but not exactly, the idiom."""
+    chars = list(phrase)
+    i = rng.randrange(len(chars))
+    if chars[i] != " ":
+        chars[i] = rng.choice([s for s in SIGNS if s])
+    return "".join(chars)
+
+
+def make_corpus(idioms, kind, count, rng):
+    """Unique sentences that take the exact, fuzzy or no-match path through translate()."""
+    sentences = set()
+    while len(sentences) < count:
+        words = [random_word(rng) for _ in range(rng.randint(6, 14))]
+        if kind == "exact":
+            words.insert(rng.randint(0, len(words)), rng.choice(idioms)['idiom'])
+        elif kind == "fuzzy":
+            words.insert(rng.randint(0, len(words)), mutate(rng.choice(idioms)['idiom'], rng))
+        sentences.add(" ".join(words))
+    return sorted(sentences)
+
+
+def summarize(latencies, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(float(ms.mean()), 3),
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p90": round(float(np.percentile(ms, 90)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "max": round(float(ms.max()), 3),
+        },
+    }
+
+
+def run_load(send, sentences, concurrency):
+    """Sends every sentence through send(sentence) -> (status, match_type) from `concurrency` threads."""
+    latencies = []
+    statuses = {}
+    match_types = {}
+    lock = threading.Lock()
+
+    def one(sentence):
+        t0 = time.perf_counter()
+        status, match_type = send(sentence)
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+            statuses[status] = statuses.get(status, 0) + 1
+            match_types[match_type] = match_types.get(match_type, 0) + 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, sentences))
+    result = summarize(latencies, time.perf_counter() - t0)
+    result["status_codes"] = statuses
+    result["match_types"] = match_types
+    return result
+
+
+def test_client_sender(app):
+    local = threading.local()
+
+    def send(sentence):
+        # Test clients keep per-instance state, so one per thread
+        client = getattr(local, "client", None) or app.test_client()
+        local.client = client
+        r = client.post("/translate", json={"sentence": sentence})
+        body = r.get_json(silent=True) or {}
+        return r.status_code, body.get("match_type") or body.get("status")
+    return send
+
+
+def http_sender(base_url):
+    def send(sentence):
+        req = urllib.request.Request(f"{base_url}/translate", data=json.dumps({"sentence": sentence}).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                body = json.loads(r.read())
+                return r.status, body.get("match_type") or body.get("status")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+    return send
+
+
+def seed(app, idioms, history_rows, rng):
+    from extensions import db
+    from models import Idiom, History
+    with app.app_context():
+        db.session.execute(db.delete(History))
+        db.session.execute(db.delete(Idiom))
+        db.session.execute(db.insert(Idiom), idioms)
+        start = datetime(2025, 1, 1)
+        rows = [{
+            "email": f"user{i % 50}@example.com", "original_sentence": random_word(rng) + " " + random_word(rng),
+            "status": "idiom_detected" if i % 2 else "no_idiom_detected", "match_type": "exact_multiple" if i % 2 else "",
+            "idiom": "", "confidence": None, "translation": random_word(rng),
+            "timestamp": start + timedelta(seconds=i),
+        } for i in range(history_rows)]
+        for i in range(0, len(rows), 5000):
+            db.session.execute(db.insert(History), rows[i:i + 5000])
+        from utils import bump_idiom_version
+        bump_idiom_version()
+        db.session.commit()
+
+
+def bench_cache_load(app, repeat):
+    import utils
+    from snapshot import IdiomSnapshot
+    results = {}
+    with app.app_context():
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            utils.refresh_idiom_cache()
+            timings.append(time.perf_counter() - t0)
+        results["refresh_from_db_ms"] = round(min(timings) * 1000, 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "idioms.snapshot")
+            t0 = time.perf_counter()
+            utils.build_idiom_snapshot(path)
+            results["snapshot_build_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            timings = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                IdiomSnapshot(path).matcher()
+                timings.append(time.perf_counter() - t0)
+            results["snapshot_load_ms"] = round(min(timings) * 1000, 1)
+        utils.refresh_idiom_cache()
+    return results
+
+
+def bench_exports(app, history_rows):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    results = {}
+    for name, url in (("tsv", "/admin/export/tsv"), ("json", "/admin/export/json"),
+                      ("tsv_gzip", "/admin/export/tsv?gzip=1")):
+        t0 = time.perf_counter()
+        r = client.get(url, buffered=False)
+        size = sum(len(chunk) for chunk in r.response)
+        elapsed = time.perf_counter() - t0
+        results[name] = {"status": r.status_code, "rows": history_rows, "bytes": size,
+                         "seconds": round(elapsed, 3), "rows_per_s": round(history_rows / elapsed, 1)}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="idiom dictionary sizes")
+    parser.add_argument("--requests", type=int, default=300, help="requests per path and concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--history-rows", type=int, default=20000, help="history rows to export")
+    parser.add_argument("--translate-delay", type=float, default=0.0,
+                        help="seconds each stubbed translation sleeps, to mimic googletrans latency")
+    parser.add_argument("--http", action="store_true", help="drive real HTTP instead of the Flask test client")
+    parser.add_argument("--url", help="with --http: an already running server instead of a local one")
+    parser.add_argument("--db", help="SQLite file to seed (default: a temp file)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="padapunja-bench-")
+    db_path = os.path.abspath(args.db or os.path.join(tmp, "bench.db"))
+    # Everything external is stubbed; set before the app modules read their config
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "PAD_TRANSLATOR_BACKEND": "stub",
+        "PAD_SYNTHESIZER_BACKEND": "stub",
+        "PAD_RECOGNIZER_BACKEND": "stub",
+        "PAD_TRANSLATION_CACHE_PATH": os.path.join(tmp, "translation_cache.sqlite3"),
+        "PAD_AUDIO_CACHE_DIR": os.path.join(tmp, "audio_cache"),
+        "PAD_IDIOM_SNAPSHOT_PATH": "",
+        "PAD_RESULT_CACHE_SHARED_PATH": "",
+        # One client hammering /translate is what's being measured, not what the limiter is for
+        "PAD_RATE_LIMIT": "false",
+    })
+    import logging
+    logging.disable(logging.WARNING)
+    import translation
+    from app import create_app
+    from result_cache import RESULT_CACHE
+
+    delay = args.translate_delay
+    translation.make_translator = lambda: translation.StubTranslator(delay=delay)
+
+    app = create_app()
+    rng = random.Random(args.seed)
+    report = {
+        "meta": {
+            "commit": git_commit(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "driver": "http" if args.http else "test_client", "args": vars(args),
+        },
+        "results": [],
+    }
+
+    server = None
+    if args.http and not args.url:
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = args.url or (f"http://127.0.0.1:{server.server_port}" if server else None)
+    send = http_sender(base_url) if args.http else test_client_sender(app)
+
+    try:
+        for size in args.sizes:
+            idioms = make_idioms(size, rng)
+            seed(app, idioms, args.history_rows, rng)
+            entry = {"size": size, "cache_load": bench_cache_load(app, repeat=3), "translate": {}}
+            if args.url:
+                # Let the external server notice the new idioms (it polls the version row)
+                time.sleep(float(os.getenv("PAD_IDIOM_VERSION_POLL_SECONDS", 5)) + 1)
+            for kind in ("exact", "fuzzy", "none"):
+                for concurrency in args.concurrency:
+                    # Fresh sentences each run, and no result cache, so every request does the full work
+                    RESULT_CACHE.clear()
+                    corpus = make_corpus(idioms, kind, args.requests, rng)
+                    entry["translate"][f"{kind}@{concurrency}"] = run_load(send, corpus, concurrency)
+            writer = app.extensions.get("history_writer")
+            if writer:
+                writer.flush(timeout=30)
+            entry["exports"] = bench_exports(app, args.history_rows)
+            report["results"].append(entry)
+            print(f"size {size} done", file=sys.stderr)
+    finally:
+        if server:
+            server.shutdown()
+
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_snapshot_load.py
+"""
+Compares building the idiom matcher from records (what each worker did at startup)
+with loading it from a precompiled snapshot, and checks both give the same matches.
+
+    python benchmarks/bench_snapshot_load.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import IdiomMatcher
+from snapshot import IdiomSnapshot, write_snapshot
+from bench_exact_match import make_idioms, make_sentences
+
+
+def run(size, sentence_count, rng, path):
+    idioms = make_idioms(size, rng)
+    sentences = make_sentences(idioms, sentence_count, rng)
+
+    t0 = time.perf_counter()
+    built = IdiomMatcher(idioms)
+    build_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    write_snapshot(path, idioms, idiom_version=1)
+    write_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    loaded = IdiomSnapshot(path).matcher()
+    load_s = time.perf_counter() - t0
+
+    mismatches = 0
+    for sentence in sentences:
+        # Fuzzy-match a slightly damaged copy so the fuzzy index gets exercised too
+        damaged = sentence[:-1]
+        if (built.find_exact(sentence) != loaded.find_exact(sentence)
+                or built.find_fuzzy(damaged, 85) != loaded.find_fuzzy(damaged, 85)):
+            mismatches += 1
+
+    print(f"{size:>7} idioms | build {build_s * 1000:8.1f} ms | "
+          f"write {write_s * 1000:8.1f} ms ({os.path.getsize(path) / 1e6:6.1f} MB) | "
+          f"load {load_s * 1000:8.1f} ms | speedup {build_s / load_s:5.1f}x | mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--sentences", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            run(size, args.sentences, rng, os.path.join(tmp, f"idioms-{size}.snapshot"))
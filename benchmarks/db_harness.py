@@ -0,0 +1,149 @@
+# benchmarks/db_harness.py
+"""
+Exercises the database setup on SQLite files: read/write splitting (with and without a
+replica), pool exhaustion under concurrent history listings, and the statement timeout.
+The primary and replica get different history rows, so each response shows which one served it.
+Prints a JSON report and exits non-zero if any check fails.
+
+    python benchmarks/db_harness.py [--pool-size 2] [--threads 16] [--timeout-ms 200]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(url, marker, rows):
+    """Creates the history table in a standalone SQLite file with rows tagged by marker."""
+    import sqlalchemy as sa
+    from extensions import db
+    engine = sa.create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.text("DELETE FROM history"))
+        conn.execute(sa.text(
+            "INSERT INTO history (email, original_sentence, status, match_type, idiom, translation, timestamp)"
+            " VALUES (:email, :s, 'no_idiom_detected', '', '', :s, :ts)"
+        ), [{"email": f"{marker}@example.com", "s": f"{marker} {i}", "ts": datetime(2025, 1, 1, 0, 0, i % 60)}
+            for i in range(rows)])
+    engine.dispose()
+
+
+def served_by(app):
+    """Which database answered /history, /admin/export/json and a plain ORM read."""
+    from extensions import db
+    from models import History
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    listing = client.get("/history?limit=1").get_json()["items"][0]["email"].split("@")[0]
+    export = json.loads(client.get("/admin/export/json").get_data())[0]["email"].split("@")[0]
+    with app.app_context():
+        plain = History.query.first().email.split("@")[0]
+        db.session.remove()
+    return {"history_listing": listing, "export": export, "unmarked_query": plain}
+
+
+def pool_pressure(app, threads, requests):
+    """Concurrent /history calls against a small pool; counts pool timeouts instead of failing."""
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(_):
+        client = app.test_client()
+        try:
+            status = str(client.get("/history?limit=50").status_code)
+        except Exception as e:
+            status = type(e).__name__
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests)))
+    return {"statuses": statuses, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def statement_timeout(app):
+    """A runaway recursive query must be interrupted; the export override must not be."""
+    from sqlalchemy.exc import OperationalError
+    from extensions import db
+    slow = db.text("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 50000000)"
+                   " SELECT COUNT(*) FROM n")
+    result = {}
+    with app.app_context():
+        t0 = time.perf_counter()
+        try:
+            db.session.execute(slow)
+            result["interrupted"] = False
+        except OperationalError as e:
+            result["interrupted"] = "interrupted" in str(e)
+        result["seconds"] = round(time.perf_counter() - t0, 3)
+        db.session.rollback()
+        quick = db.text("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 200000)"
+                        " SELECT COUNT(*) FROM n")
+        result["override_ok"] = db.session.execute(quick.execution_options(statement_timeout_ms=0)).scalar() == 200000
+        db.session.remove()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--timeout-ms", type=int, default=200, help="statement timeout to test")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="padapunja-db-")
+    primary = f"sqlite:///{os.path.join(tmp, 'primary.db')}"
+    replica = f"sqlite:///{os.path.join(tmp, 'replica.db')}"
+    os.environ.update({
+        "DATABASE_URL": primary,
+        "PAD_DB_POOL_SIZE": str(args.pool_size),
+        "PAD_DB_MAX_OVERFLOW": "0",
+        "PAD_DB_POOL_TIMEOUT": "1",
+        "PAD_DB_STATEMENT_TIMEOUT_MS": str(args.timeout_ms),
+        "PAD_TRANSLATOR_BACKEND": "stub",
+        "PAD_IDIOM_SNAPSHOT_PATH": "",
+        "PAD_TRANSLATION_CACHE_PATH": os.path.join(tmp, "translation_cache.sqlite3"),
+        "PAD_HISTORY_WRITE_MODE": "sync",
+    })
+    import logging
+    logging.disable(logging.WARNING)
+    from app import create_app
+
+    seed(primary, "primary", 500)
+    seed(replica, "replica", 500)
+
+    report = {"pool_size": args.pool_size, "checks": {}}
+    os.environ.pop("DATABASE_REPLICA_URL", None)
+    report["without_replica"] = served_by(create_app())
+    os.environ["DATABASE_REPLICA_URL"] = replica
+    app = create_app()
+    report["with_replica"] = served_by(app)
+    report["pool_pressure"] = pool_pressure(app, args.threads, args.requests)
+    report["statement_timeout"] = statement_timeout(app)
+
+    checks = report["checks"]
+    checks["no_replica_reads_primary"] = set(report["without_replica"].values()) == {"primary"}
+    checks["replica_serves_listing_and_export"] = (report["with_replica"]["history_listing"] == "replica"
+                                                   and report["with_replica"]["export"] == "replica")
+    checks["unmarked_reads_stay_on_primary"] = report["with_replica"]["unmarked_query"] == "primary"
+    checks["runaway_statement_interrupted"] = report["statement_timeout"]["interrupted"]
+    checks["export_override_not_interrupted"] = report["statement_timeout"]["override_ok"]
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# benchmarks/mail_harness.py
+"""
+Runs a burst of /login requests against a local debugging SMTP server (started here, no
+auth/TLS) and checks that logins return without waiting on SMTP, every OTP arrives, the
+senders reuse a handful of connections, and transient failures and dropped connections are
+retried. Prints a JSON report and exits non-zero if any check fails.
+
+    python benchmarks/mail_harness.py [--logins 200] [--threads 16] [--smtp-delay 0.05]
+                                      [--fail-first 5] [--drop-every 20]
+
+Against a real debugging server instead:
+    python -m smtpd -n -c DebuggingServer localhost:1025   (Python <= 3.11; or aiosmtpd)
+    PAD_SMTP_SERVER=localhost PAD_SMTP_PORT=1025 PAD_SMTP_STARTTLS=false python app.py
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Just enough SMTP to accept mail, count connections and inject failures."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay=0.0, fail_first=0, drop_every=0):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.delay = delay
+        self.fail_left = fail_first
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.recipients = []
+
+    def take_failure(self):
+        with self.lock:
+            if self.fail_left > 0:
+                self.fail_left -= 1
+                return True
+            return False
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 sink ESMTP")
+        delivered = 0
+        to = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("utf-8", "replace").strip()
+            verb = cmd[:4].upper()
+            if verb == "EHLO":
+                self.reply("250-sink")
+                self.reply("250 8BITMIME")
+            elif verb == "MAIL":
+                to = []
+                self.reply("451 4.3.0 Try again later" if server.take_failure() else "250 OK")
+            elif verb == "RCPT":
+                to.append(cmd.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(server.delay)
+                with server.lock:
+                    server.recipients.extend(to)
+                self.reply("250 OK queued")
+                delivered += 1
+                if server.drop_every and delivered >= server.drop_every:
+                    return  # hang up without a word, like an idle-timeout on the provider side
+            elif verb in ("RSET", "NOOP", "HELO"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def login_burst(app, count, threads):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(i):
+        client = app.test_client()
+        t0 = time.perf_counter()
+        r = client.post("/login", data={"email": f"user{i}@example.com"})
+        dt = time.perf_counter() - t0
+        status = client.get("/login/status").get_json()["status"]
+        with lock:
+            latencies.append(dt)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        return client, status
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        clients = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return clients, {
+        "logins": count, "seconds": round(elapsed, 3), "status_codes": statuses,
+        "login_ms": {"p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                     "max": round(latencies[-1] * 1000, 2)},
+        "first_poll": sorted({status for _, status in clients}),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2, help="background mail senders")
+    parser.add_argument("--smtp-delay", type=float, default=0.05, help="seconds the server takes per message")
+    parser.add_argument("--fail-first", type=int, default=5, help="reject this many MAIL commands with 451")
+    parser.add_argument("--drop-every", type=int, default=20, help="hang up after this many messages per connection")
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.smtp_delay, args.fail_first, args.drop_every)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+
+    tmp = tempfile.mkdtemp(prefix="padapunja-mail-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'mail.db')}",
+        "PAD_TRANSLATOR_BACKEND": "stub",
+        "PAD_IDIOM_SNAPSHOT_PATH": "",
+        "PAD_TRANSLATION_CACHE_PATH": os.path.join(tmp, "translation_cache.sqlite3"),
+        "PAD_SMTP_SERVER": "127.0.0.1",
+        "PAD_SMTP_PORT": str(sink.server_address[1]),
+        "PAD_SMTP_STARTTLS": "false",
+        "PAD_SENDER_PASS": "",
+        "PAD_MAIL_MODE": "async",
+        "PAD_MAIL_WORKERS": str(args.workers),
+        "PAD_MAIL_RETRY_BACKOFF": "0.1",
+        # Every login comes from one address, which the /login limit would otherwise turn away
+        "PAD_RATE_LIMIT": "false",
+    })
+    import logging
+    logging.disable(logging.ERROR)
+    from app import create_app
+
+    app = create_app()
+    dispatcher = app.extensions["mail_dispatcher"]
+    clients, burst = login_burst(app, args.logins, args.threads)
+    t0 = time.perf_counter()
+    drained = dispatcher.flush(timeout=120)
+    burst["drain_seconds"] = round(time.perf_counter() - t0, 3)
+    final = {}
+    for client, _ in clients:
+        status = client.get("/login/status").get_json()["status"]
+        final[status] = final.get(status, 0) + 1
+    dispatcher.stop()
+    sink.shutdown()
+
+    report = {
+        "burst": burst,
+        "final_status": final,
+        "dispatcher": dispatcher.stats(),
+        "server": {"connections": sink.connections, "messages": len(sink.recipients),
+                   "unique_recipients": len(set(sink.recipients))},
+        "checks": {},
+    }
+    checks = report["checks"]
+    checks["drained"] = drained
+    checks["all_delivered"] = final == {"sent": args.logins} and len(set(sink.recipients)) == args.logins
+    # A login answered slower than one SMTP round trip would mean it waited on the mail
+    checks["login_did_not_wait"] = burst["login_ms"]["p50"] < args.smtp_delay * 1000 or args.smtp_delay == 0
+    # One connection per sender, plus one after each hang-up and each failed attempt
+    checks["connections_reused"] = sink.connections <= (args.workers + dispatcher.counters["reconnects"]
+                                                        + dispatcher.counters["retried"])
+    checks["transient_failures_retried"] = dispatcher.counters["retried"] >= min(args.fail_first, args.logins)
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/rate_limit_harness.py
+"""
+Checks the per-client token buckets: /translate/batch is charged one token per sentence and
+answered 429 with Retry-After once a client's bucket is spent, and a request turned away by one
+of its buckets (the session email's) leaves the others (the shared IP's) as they were. Prints a
+JSON report and exits non-zero if any check fails.
+
+    python benchmarks/rate_limit_harness.py [--burst 20] [--batch 8] [--redis redis://localhost:6379/15]
+
+With --redis the bucket checks also run against that server (keys under a throwaway prefix).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def batch_until_limited(app, batch, attempts):
+    """Posts batches of `batch` sentences from one signed-in client until one is turned away."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess["email"] = "batch@example.com"
+    sentences = [f"sentence {i}" for i in range(batch)]
+    statuses = []
+    for _ in range(attempts):
+        r = client.post("/translate/batch", json={"sentences": sentences})
+        r.get_data()
+        r.close()  # as the server would once the stream is sent, which frees the concurrency slot
+        statuses.append(r.status_code)
+        if r.status_code == 429:
+            return statuses, r
+    return statuses, None
+
+
+def all_or_nothing(backend, burst):
+    """Spends one client's email bucket, then checks a rejected request leaves the IP bucket alone."""
+    from rate_limit import RateLimited, RateLimiter, Policy
+
+    # A slow refill so the buckets don't visibly move while the check runs
+    limiter = RateLimiter(backend, policies={"t": Policy(per_minute=0.6, burst=burst, concurrency=0, queue=0)})
+    run = uuid.uuid4().hex[:8]
+    ip_key, email_key, probe_key = f"t:ip:{run}", f"t:email:{run}", f"t:ip:{run}-probe"
+    limiter.check_rate("t", [email_key], cost=burst)  # the email bucket is now empty
+    rejected = False
+    try:
+        limiter.check_rate("t", [ip_key, email_key])
+    except RateLimited:
+        rejected = True
+    # The IP bucket must still hold a full burst: all of it can be taken at once
+    try:
+        limiter.check_rate("t", [ip_key], cost=burst)
+        ip_untouched = True
+    except RateLimited:
+        ip_untouched = False
+    # Control: a fresh bucket one token short of the burst can't serve a full one
+    limiter.check_rate("t", [probe_key])
+    try:
+        limiter.check_rate("t", [probe_key], cost=burst)
+        probe_limited = False
+    except RateLimited:
+        probe_limited = True
+    return {"rejected": rejected, "ip_bucket_untouched": ip_untouched, "control_limited": probe_limited}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=20, help="translate_batch burst (tokens = sentences)")
+    parser.add_argument("--batch", type=int, default=8, help="sentences per batch")
+    parser.add_argument("--redis", default=None, help="also check the Redis buckets at this URL")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="padapunja-ratelimit-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'ratelimit.db')}",
+        "PAD_TRANSLATOR_BACKEND": "stub",
+        "PAD_IDIOM_SNAPSHOT_PATH": "",
+        "PAD_TRANSLATION_CACHE_PATH": os.path.join(tmp, "translation_cache.sqlite3"),
+        "PAD_HISTORY_WRITE_MODE": "sync",
+        "PAD_RATE_LIMIT": "true",
+        "PAD_RATE_LIMIT_BACKEND": "memory",
+        # Slow refill: the run is over long before a single token comes back
+        "PAD_LIMIT_TRANSLATE_BATCH_PER_MINUTE": "1",
+        "PAD_LIMIT_TRANSLATE_BATCH_BURST": str(args.burst),
+    })
+    import logging
+    logging.disable(logging.ERROR)
+    from app import create_app
+    from rate_limit import MemoryBuckets, make_rate_limit_backend
+
+    app = create_app()
+    limiter = app.extensions["rate_limiter"]
+    statuses, limited = batch_until_limited(app, args.batch, args.burst + 2)
+
+    report = {
+        "batch": {"burst": args.burst, "sentences": args.batch, "statuses": statuses,
+                  "retry_after": limited.headers.get("Retry-After") if limited else None,
+                  "limiter": limiter.stats().get("translate_batch")},
+        "buckets": {"memory": all_or_nothing(MemoryBuckets(), args.burst)},
+        "checks": {},
+    }
+    if args.redis:
+        report["buckets"]["redis"] = all_or_nothing(make_rate_limit_backend(args.redis), args.burst)
+
+    checks = report["checks"]
+    checks["batch_limited"] = limited is not None
+    checks["batch_retry_after"] = bool(limited) and int(limited.headers.get("Retry-After", 0)) > 0
+    # Charged per sentence: exactly as many whole batches as the burst covers get through
+    checks["batch_charged_per_sentence"] = statuses.count(200) == args.burst // args.batch
+    checks["batch_slots_released"] = report["batch"]["limiter"]["active"] == 0
+    for name, result in report["buckets"].items():
+        checks[f"{name}_all_or_nothing"] = all(result.values())
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# benchmarks/rollup_harness.py
+"""
+Checks that rebuild_rollup() can run while History is being written, on a SQLite file. First a
+writer's insert + record_rollup() is fired at each step of a rebuild (right after it clears the
+rollup rows and right after it reads History), then /translate traffic runs against a loop of
+rebuilds. Each time the rollup must come out equal to History re-aggregated, with no write or
+rebuild failing. Prints a JSON report and exits non-zero if any check fails.
+
+    python benchmarks/rollup_harness.py [--write-mode async|sync] [--threads 8] [--requests 400] [--rebuilds 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rollup_matches_history():
+    """True when every rollup row equals History aggregated from scratch (needs an app context)."""
+    from extensions import db
+    from history_rollup import rollup_counts
+    from models import History, HistoryRollup
+    expected = rollup_counts(dict(row._mapping) for row in db.session.execute(
+        db.select(History.timestamp, History.idiom, History.match_type, History.confidence)))
+    actual = {(r.day, r.idiom, r.match_type): [r.count, r.confidence_sum, r.confidence_count]
+              for r in db.session.execute(db.select(HistoryRollup)).scalars() if r.count}
+    db.session.rollback()
+    return expected == actual
+
+
+def write_history(app, sentence):
+    """One sync-mode save: a History row and its rollup increment in one transaction."""
+    from extensions import db
+    from history_rollup import record_rollup
+    from models import History
+    row = {"email": "rollup@example.com", "original_sentence": sentence, "status": "idiom_detected",
+           "match_type": "fuzzy", "idiom": "ಕೈ ಕೊಡು", "confidence": 90, "translation": sentence,
+           "timestamp": datetime.now()}
+    with app.app_context():
+        try:
+            db.session.execute(db.insert(History), [row])
+            record_rollup([row])
+            db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def interleaved_rebuild(app, marker):
+    """
+    Runs a rebuild that starts a concurrent write right after its first statement containing
+    `marker`, giving the write a moment to land before the rebuild carries on.
+    """
+    from sqlalchemy import event
+    from extensions import db
+    from history_rollup import rebuild_rollup
+
+    rebuilding = threading.get_ident()
+    writer = threading.Thread(target=write_history, args=(app, f"written mid-rebuild ({marker})"))
+    errors = []
+
+    def fire(conn, cursor, statement, *args):
+        if threading.get_ident() == rebuilding and marker in statement and not writer.is_alive() \
+                and not writer.ident:
+            writer.start()
+            writer.join(0.5)  # blocked on the rebuild's lock when the rebuild is safe
+
+    with app.app_context():
+        event.listen(db.engine, "after_cursor_execute", fire)
+        try:
+            rebuild_rollup()
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            event.remove(db.engine, "after_cursor_execute", fire)
+        writer.join()
+        return {"fired": bool(writer.ident), "errors": errors, "matches_history": rollup_matches_history()}
+
+
+def traffic_with_rebuilds(app, threads, requests, rebuilds):
+    """/translate requests from `threads` clients while rebuild_rollup() runs `rebuilds` times."""
+    from history_rollup import rebuild_rollup
+    sentences = ["ಅವನು ಕೈ ಕೊಡು ಎಂದ", "ಅವನು ಕೈ ಕೊಡುು ಎಂದ", "ಏನೂ ಇಲ್ಲ"]
+    statuses = {}
+    errors = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def translate(i):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess["email"] = f"user{i % threads}@example.com"
+        status = client.post("/translate", json={"sentence": sentences[i % len(sentences)]}).status_code
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def rebuild_loop():
+        count = 0
+        while count < rebuilds and not done.is_set():
+            with app.app_context():
+                try:
+                    rebuild_rollup()
+                except Exception as e:
+                    errors.append(repr(e))
+            count += 1
+        return count
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads + 1) as pool:
+        rebuilder = pool.submit(rebuild_loop)
+        list(pool.map(translate, range(requests)))
+        done.set()
+        ran = rebuilder.result()
+    return {"requests": requests, "status_codes": statuses, "rebuilds": ran, "rebuild_errors": errors,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--write-mode", choices=["async", "sync"], default="async", help="how /translate saves history")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--rebuilds", type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="padapunja-rollup-")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'rollup.db')}",
+        "PAD_TRANSLATOR_BACKEND": "stub",
+        "PAD_IDIOM_SNAPSHOT_PATH": "",
+        "PAD_TRANSLATION_CACHE_PATH": os.path.join(tmp, "translation_cache.sqlite3"),
+        "PAD_HISTORY_WRITE_MODE": args.write_mode,
+        "PAD_HISTORY_FLUSH_INTERVAL": "0.05",
+        # All the traffic comes from one address
+        "PAD_RATE_LIMIT": "false",
+    })
+    import logging
+    logging.disable(logging.ERROR)
+    from app import create_app
+    from extensions import db
+    from models import History, Idiom
+    import utils
+
+    app = create_app()
+    with app.app_context():
+        db.session.add(Idiom(idiom="ಕೈ ಕೊಡು", explanation_kannada="ಮೋಸ ಮಾಡು"))
+        utils.bump_idiom_version()
+        db.session.commit()
+        utils.refresh_idiom_cache()
+
+    report = {
+        "interleaved": {
+            # Between clearing the rollup rows and writing the recomputed ones
+            "after_clear": interleaved_rebuild(app, "DELETE FROM history_rollup"),
+            # Between reading History and writing the rollup
+            "after_read": interleaved_rebuild(app, "GROUP BY"),
+        },
+        "traffic": traffic_with_rebuilds(app, args.threads, args.requests, args.rebuilds),
+        "checks": {},
+    }
+    writer = app.extensions.get("history_writer")
+    if writer:
+        writer.flush(timeout=30)
+        report["writer"] = writer.stats()
+    with app.app_context():
+        final_matches = rollup_matches_history()
+        # A failed save in sync mode is only logged, so count what reached History
+        report["history_rows"] = db.session.query(History).count()
+
+    checks = report["checks"]
+    for step, result in report["interleaved"].items():
+        checks[f"{step}_write_counted"] = result["fired"] and not result["errors"] and result["matches_history"]
+    checks["traffic_all_ok"] = report["traffic"]["status_codes"] == {200: args.requests}
+    checks["rebuilds_never_failed"] = not report["traffic"]["rebuild_errors"]
+    checks["writes_never_failed"] = not writer or report["writer"]["failed"] == 0
+    checks["every_write_saved"] = report["history_rows"] == args.requests + len(report["interleaved"])
+    checks["rollup_matches_history"] = final_matches
+
+    print(json.dumps(report, indent=2, default=str))
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# database.py
+import logging
+import os
+import time
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DB_POOL_SIZE = int(os.getenv("PAD_DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("PAD_DB_MAX_OVERFLOW", 20))
+# Whole seconds a request waits for a free connection before failing (engine_from_config truncates floats)
+DB_POOL_TIMEOUT = int(os.getenv("PAD_DB_POOL_TIMEOUT", 10))
+# Reconnect before MySQL's wait_timeout (or a proxy's idle cutoff) silently drops the connection
+DB_POOL_RECYCLE = int(os.getenv("PAD_DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("PAD_DB_POOL_PRE_PING", "true").lower() == "true"
+# Per-statement limit in milliseconds (0 = none). Queries can override it with
+# .execution_options(statement_timeout_ms=...), e.g. exports that legitimately stream for minutes.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("PAD_DB_STATEMENT_TIMEOUT_MS", 0))
+
+REPLICA_BIND = "replica"
+# SQLite runs the progress handler every this many VM instructions
+_SQLITE_PROGRESS_STEPS = 1000
+
+
+def engine_options(url):
+    """Pool settings for an engine; in-memory SQLite gets a single static connection, so it gets none."""
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+def replica_bind(url):
+    """SQLALCHEMY_BINDS entry for a read replica, or {} when there isn't one."""
+    if not url:
+        return {}
+    return {REPLICA_BIND: dict(engine_options(url), url=url)}
+
+
+class RoutingSession(Session):
+    """
+    Sends queries marked .execution_options(replica=True) to the replica bind when one is
+    configured, and everything else to the primary. Only read paths that can live with a
+    little replication lag (history listing and exports) are marked.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None and clause._execution_options.get("replica"):
+            engine = self._db.engines.get(REPLICA_BIND)
+            # Once this session has written something, reads stay on the primary so they see it
+            if engine is not None and not self.new and not self.dirty and not self.deleted:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def install_statement_timeout(engine, default_ms):
+    """
+    Applies a per-statement time limit on every connection of engine: max_execution_time on MySQL
+    (SELECTs only, which is what runs long here) and an interrupting progress handler on SQLite.
+    """
+    dialect = engine.dialect.name
+    if dialect not in ("mysql", "sqlite"):
+        if default_ms:
+            logging.warning(f"Statement timeouts aren't supported on {dialect}; ignoring PAD_DB_STATEMENT_TIMEOUT_MS")
+        return
+
+    if dialect == "sqlite":
+        event.listen(engine, "after_cursor_execute", _clear_sqlite_deadline)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+        wanted = context.execution_options.get("statement_timeout_ms", default_ms) if context else default_ms
+        info = conn.info
+        if dialect == "sqlite":
+            deadline = info.get("statement_deadline")
+            if deadline is None:
+                deadline = info["statement_deadline"] = [None]
+                conn.connection.dbapi_connection.set_progress_handler(
+                    lambda: int(deadline[0] is not None and time.monotonic() > deadline[0]), _SQLITE_PROGRESS_STEPS
+                )
+            deadline[0] = time.monotonic() + wanted / 1000 if wanted else None
+            return
+        # MySQL keeps the setting per session, so only send it when it changes
+        if info.get("statement_timeout_ms", 0) != wanted:
+            with conn.connection.dbapi_connection.cursor() as c:
+                c.execute(f"SET SESSION max_execution_time = {int(wanted)}")
+            info["statement_timeout_ms"] = wanted
+
+
+def _clear_sqlite_deadline(conn, *args):
+    # Rows fetched later and COMMITs don't count against the statement that just ran
+    deadline = conn.info.get("statement_deadline")
+    if deadline is not None:
+        deadline[0] = None
+
+
+def init_database(app, db):
+    """Hooks the statement timeout into every engine (primary and replica)."""
+    with app.app_context():
+        for engine in db.engines.values():
+            install_statement_timeout(engine, app.config.get("DB_STATEMENT_TIMEOUT_MS", 0))
@@ -1,5 +1,7 @@
 # extensions.py
 from flask_sqlalchemy import SQLAlchemy
+from database import RoutingSession
 
 # Initialize the database object here, but don't connect it yet.
-db = SQLAlchemy()
\ No newline at end of file
+# Reads marked replica=True go to the replica bind when DATABASE_REPLICA_URL is set (see database.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
@@ -0,0 +1,99 @@
+# features.py
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+
+# Heavy third-party libraries per optional subsystem. Routes import these on first use;
+# PAD_PRELOAD_FEATURES can pull them in at startup instead (e.g. under gunicorn --preload).
+FEATURE_MODULES = {
+    "translation": ["googletrans"],
+    "langdetect": ["langdetect"],
+    "tts": ["gtts"],
+    "speech": ["speech_recognition"],
+}
+
+# What `flask profile-startup` measures: the optional features plus the always-loaded core
+PROFILE_SUBSYSTEMS = {
+    "web": ["flask", "flask_cors", "flask_sqlalchemy"],
+    "matching": ["numpy", "rapidfuzz", "matcher"],
+    **FEATURE_MODULES,
+    "app": ["app"],
+}
+
+_PROFILE_SCRIPT = r"""
+import importlib, json, os, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+    except ImportError:
+        return None
+
+before_rss = rss_kb()
+before_modules = set(sys.modules)
+t0 = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - t0
+after_rss = rss_kb()
+print(json.dumps({
+    "import_ms": round(elapsed * 1000, 1),
+    "rss_kb": after_rss - before_rss if before_rss is not None else None,
+    "modules": sorted(set(sys.modules) - before_modules),
+}))
+"""
+
+
+def parse_features(value):
+    names = [n.strip() for n in (value or "").split(",") if n.strip()]
+    unknown = [n for n in names if n not in FEATURE_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}; expected some of {sorted(FEATURE_MODULES)}")
+    return names
+
+
+def preload_features(names):
+    """Imports the libraries behind each named feature now rather than on first request."""
+    for name in names:
+        for module in FEATURE_MODULES[name]:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logging.error(f"Could not preload {module} for '{name}': {e}")
+
+
+def profile_subsystem(modules, cwd=None):
+    """Imports modules in a fresh interpreter; returns its import time, RSS growth and the modules it loaded."""
+    result = subprocess.run([sys.executable, "-c", _PROFILE_SCRIPT, *modules],
+                            cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": (result.stderr.strip().splitlines() or ["import failed"])[-1]}
+    return json.loads(result.stdout)
+
+
+def profile_startup(subsystems=None, cwd=None):
+    """
+    {subsystem: profile} with each subsystem measured in isolation, so shared dependencies
+    count toward every subsystem that needs them. "app" also reports which feature
+    libraries a bare `import app` drags in; that list should stay empty.
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    report = {}
+    for name in subsystems or PROFILE_SUBSYSTEMS:
+        report[name] = profile_subsystem(PROFILE_SUBSYSTEMS[name], cwd)
+    if "modules" in report.get("app", {}):
+        heavy = {m for modules in FEATURE_MODULES.values() for m in modules}
+        report["app"]["eager_features"] = sorted(m for m in report["app"]["modules"] if m in heavy)
+    for profile in report.values():
+        profile.pop("modules", None)
+    return report
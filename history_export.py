@@ -0,0 +1,48 @@
+# history_export.py
+import csv
+import io
+import json
+import zlib
+
+# Same columns (and order) the old export got from sorted(to_dict().keys())
+TSV_FIELDS = sorted(["id", "email", "original_sentence", "status", "match_type",
+                     "idiom", "confidence", "translation", "timestamp"])
+
+
+def iter_tsv(entries, rows_per_chunk=500):
+    """Yields the TSV export as UTF-8 chunks, a few hundred rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=TSV_FIELDS, delimiter='\t')
+    writer.writeheader()
+    for n, entry in enumerate(entries, 1):
+        writer.writerow(entry.to_dict())
+        if n % rows_per_chunk == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_json(entries, rows_per_chunk=500):
+    """Yields the same text json.dumps(list, ensure_ascii=False, indent=2) would, incrementally."""
+    parts = []
+    first = True
+    for n, entry in enumerate(entries, 1):
+        item = json.dumps(entry.to_dict(), ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        parts.append(("[\n  " if first else ",\n  ") + item)
+        first = False
+        if n % rows_per_chunk == 0:
+            yield "".join(parts).encode('utf-8')
+            parts = []
+    parts.append("[]" if first else "\n]")
+    yield "".join(parts).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Compresses a byte stream into gzip format on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
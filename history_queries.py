@@ -0,0 +1,90 @@
+# history_queries.py
+import base64
+from datetime import datetime, timedelta
+from extensions import db
+from models import History
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+HISTORY_FILTERS = ("email", "status", "match_type")
+HISTORY_EXPORT_CHUNK_SIZE = 1000
+
+
+def encode_cursor(entry):
+    raw = f"{entry.timestamp.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, id), or raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts, entry_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(entry_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def filtered_history(args):
+    """History query narrowed by the email/status/match_type request args."""
+    # Listings and exports tolerate replication lag, so they may be served by the replica
+    query = History.query.execution_options(replica=True)
+    for name in HISTORY_FILTERS:
+        value = args.get(name)
+        if value is not None and value != "":
+            query = query.filter(getattr(History, name) == value)
+    return query
+
+
+def history_page(args):
+    """
+    One newest-first page of history using keyset pagination on (timestamp, id).
+    Returns (entries, next_cursor); next_cursor is None on the last page.
+    """
+    try:
+        limit = int(args.get("limit", HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    query = filtered_history(args)
+    cursor = args.get("cursor")
+    if cursor:
+        ts, entry_id = decode_cursor(cursor)
+        # Expanded form of (timestamp, id) < (ts, entry_id) so MySQL can range-scan the index
+        query = query.filter(db.or_(
+            History.timestamp < ts,
+            db.and_(History.timestamp == ts, History.id < entry_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    entries = query.order_by(History.timestamp.desc(), History.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+
+def _parse_bound(value, end=False):
+    parsed = datetime.fromisoformat(value)
+    # A bare date as the end bound means "through the end of that day"
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def history_export_query(args):
+    """
+    Filtered history for exports, oldest first (walks the timestamp index), read from the server in chunks.
+    `start` (inclusive) and `end` (exclusive, or the whole day for a bare date) limit the range.
+    """
+    query = filtered_history(args)
+    try:
+        if args.get("start"):
+            query = query.filter(History.timestamp >= _parse_bound(args["start"]))
+        if args.get("end"):
+            query = query.filter(History.timestamp < _parse_bound(args["end"], end=True))
+    except ValueError:
+        raise ValueError("Dates must be YYYY-MM-DD or ISO 8601")
+    # Streaming a big export can outlast the statement timeout meant for request queries
+    return (query.order_by(History.timestamp, History.id)
+            .execution_options(statement_timeout_ms=0)
+            .yield_per(HISTORY_EXPORT_CHUNK_SIZE))
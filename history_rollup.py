@@ -0,0 +1,224 @@
+# history_rollup.py
+from datetime import date, datetime, timedelta
+from extensions import db
+from models import History, HistoryRollup
+
+HISTORY_STATS_DAYS = 30
+HISTORY_STATS_MAX_DAYS = 366
+HISTORY_STATS_TOP_IDIOMS = 10
+# Rollup rows per multi-row upsert in a rebuild (6 bind parameters each)
+REBUILD_CHUNK_SIZE = 1000
+
+
+def rollup_counts(rows, sign=1):
+    """
+    Folds History row dicts into {(day, idiom, match_type): [count, confidence_sum, confidence_count]}.
+    sign=-1 gives the amounts to take off for rows that are being changed.
+    """
+    counts = {}
+    for row in rows:
+        timestamp = row.get("timestamp") or datetime.now()
+        key = (timestamp.date(), row.get("idiom") or "", row.get("match_type") or "")
+        entry = counts.setdefault(key, [0, 0, 0])
+        entry[0] += sign
+        if row.get("confidence") is not None:
+            entry[1] += sign * row["confidence"]
+            entry[2] += sign
+    return counts
+
+
+def _upsert_statement(dialect, values, replace=False):
+    """
+    INSERT ... that adds to an existing rollup row instead of failing (or overwrites it, with
+    replace=True), or None if the dialect can't.
+    """
+    def merged(current, incoming):
+        return {name: getattr(incoming, name) if replace else getattr(current, name) + getattr(incoming, name)
+                for name in ("count", "confidence_sum", "confidence_count")}
+
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(HistoryRollup).values(values)
+        return stmt.on_duplicate_key_update(**merged(HistoryRollup, stmt.inserted))
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(HistoryRollup).values(values)
+        return stmt.on_conflict_do_update(index_elements=["day", "idiom", "match_type"],
+                                          set_=merged(HistoryRollup, stmt.excluded))
+    return None
+
+
+def record_rollup(rows, replaced=()):
+    """
+    Adds freshly inserted History rows to the rollup inside the caller's transaction
+    (the caller commits), so the rollup never disagrees with History. For rows updated in
+    place, pass their old values as `replaced` and they are taken off in the same statement.
+    """
+    counts = rollup_counts(rows)
+    for key, (count, conf_sum, conf_count) in rollup_counts(replaced, sign=-1).items():
+        entry = counts.setdefault(key, [0, 0, 0])
+        entry[0] += count
+        entry[1] += conf_sum
+        entry[2] += conf_count
+    counts = {key: entry for key, entry in counts.items() if any(entry)}
+    if not counts:
+        return
+    # Sorted so concurrent writers lock rollup rows in the same order and can't deadlock
+    values = [
+        {"day": day, "idiom": idiom, "match_type": match_type,
+         "count": count, "confidence_sum": conf_sum, "confidence_count": conf_count}
+        for (day, idiom, match_type), (count, conf_sum, conf_count) in sorted(counts.items())
+    ]
+    stmt = _upsert_statement(db.engine.dialect.name, values)
+    if stmt is not None:
+        db.session.execute(stmt)
+        return
+    for value in values:
+        result = db.session.execute(
+            db.update(HistoryRollup)
+            .where(HistoryRollup.day == value["day"], HistoryRollup.idiom == value["idiom"],
+                   HistoryRollup.match_type == value["match_type"])
+            .values(count=HistoryRollup.count + value["count"],
+                    confidence_sum=HistoryRollup.confidence_sum + value["confidence_sum"],
+                    confidence_count=HistoryRollup.confidence_count + value["confidence_count"])
+        )
+        if result.rowcount == 0:
+            db.session.execute(db.insert(HistoryRollup), [value])
+
+
+def clear_rollup():
+    """Empties the rollup along with History (caller commits)."""
+    db.session.query(HistoryRollup).delete()
+
+
+def _lock_rollup(since):
+    """
+    Makes writers' record_rollup() wait for this transaction from here on (for the days from
+    `since`, or all of them), and waits out the ones already in flight.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        # Conflicts with the lock every INSERT/upsert takes, even on rows that don't exist yet
+        db.session.execute(db.text(f"LOCK TABLE {HistoryRollup.__tablename__} IN SHARE ROW EXCLUSIVE MODE"))
+    elif dialect == "mysql":
+        # Next-key locks on the (day, ...) primary key cover the gaps too, so no new rows either
+        query = db.select(HistoryRollup.day).with_for_update()
+        if since is not None:
+            query = query.where(HistoryRollup.day >= since)
+        db.session.execute(query).all()
+    # SQLite has one writer at a time: the DELETE that follows takes the lock for the whole file
+
+
+def rebuild_rollup(since=None):
+    """
+    Recomputes the rollup from History for every day from `since` (all days if None) and
+    commits. For backfilling an existing table or repairing drift; safe while the app is
+    writing, which waits on the rebuild's lock. Returns the number of rollup rows.
+    """
+    day = db.func.date(History.timestamp)
+    query = (
+        db.select(day, History.idiom, History.match_type, db.func.count(),
+                  db.func.coalesce(db.func.sum(History.confidence), 0), db.func.count(History.confidence))
+        .group_by(day, History.idiom, History.match_type)
+        # A full GROUP BY over History legitimately runs long
+        .execution_options(statement_timeout_ms=0)
+    )
+    delete = db.delete(HistoryRollup)
+    if since is not None:
+        query = query.where(History.timestamp >= datetime.combine(since, datetime.min.time()))
+        delete = delete.where(HistoryRollup.day >= since)
+
+    try:
+        # Locked before History is read: a row committed after the read can't have its rollup
+        # increment wiped by the write below, and one committed before it is in the read
+        _lock_rollup(since)
+        db.session.execute(delete)
+        counts = {}
+        for row_day, idiom, match_type, count, conf_sum, conf_count in db.session.execute(query):
+            if isinstance(row_day, str):  # SQLite's date() returns text
+                row_day = date.fromisoformat(row_day)
+            # NULL and '' land in the same rollup row, as record_rollup() does
+            entry = counts.setdefault((row_day, idiom or "", match_type or ""), [0, 0, 0])
+            entry[0] += count
+            entry[1] += int(conf_sum)
+            entry[2] += conf_count
+        values = [
+            {"day": d, "idiom": i, "match_type": m, "count": c, "confidence_sum": s, "confidence_count": n}
+            for (d, i, m), (c, s, n) in sorted(counts.items())
+        ]
+        for start in range(0, len(values), REBUILD_CHUNK_SIZE):
+            chunk = values[start:start + REBUILD_CHUNK_SIZE]
+            # Replacing on conflict, so a rollup row that appears anyway can't fail the rebuild
+            stmt = _upsert_statement(db.engine.dialect.name, chunk, replace=True)
+            db.session.execute(stmt if stmt is not None else db.insert(HistoryRollup).values(chunk))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(counts)
+
+
+def history_stats(days=HISTORY_STATS_DAYS, top=HISTORY_STATS_TOP_IDIOMS):
+    """
+    Translation volume, match-type split, average fuzzy confidence and top idioms over the
+    last `days` days, read from the rollup (a few rows per day) rather than History.
+    """
+    if not 1 <= days <= HISTORY_STATS_MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {HISTORY_STATS_MAX_DAYS}")
+    since = date.today() - timedelta(days=days - 1)
+    rows = db.session.execute(
+        db.select(HistoryRollup).where(HistoryRollup.day >= since).execution_options(replica=True)
+    ).scalars()
+
+    daily = {since + timedelta(days=i): {} for i in range(days)}
+    match_types = {}  # match type -> [count, confidence_sum, confidence_count]
+    idioms = {}       # idiom -> [count, confidence_sum, confidence_count]
+    for row in rows:
+        if not row.count:
+            continue  # emptied by reprocessing
+        label = row.match_type or "no_match"
+        per_day = daily.setdefault(row.day, {})
+        per_day[label] = per_day.get(label, 0) + row.count
+        totals = [(match_types, label)]
+        # A sentence with several idioms counts once for each of them
+        totals += [(idioms, idiom) for idiom in row.idiom.split(", ") if idiom]
+        for table, key in totals:
+            entry = table.setdefault(key, [0, 0, 0])
+            entry[0] += row.count
+            entry[1] += row.confidence_sum
+            entry[2] += row.confidence_count
+
+    def average(entry):
+        return round(entry[1] / entry[2], 1) if entry[2] else None
+
+    total = sum(entry[0] for entry in match_types.values())
+    top_idioms = sorted(idioms.items(), key=lambda item: (-item[1][0], item[0]))[:top]
+    return {
+        "since": since.isoformat(),
+        "days": days,
+        "total": total,
+        "match_types": {
+            label: {"count": entry[0], "share": round(entry[0] / total, 3), "avg_confidence": average(entry)}
+            for label, entry in sorted(match_types.items(), key=lambda item: -item[1][0])
+        },
+        "daily": [{"day": day.isoformat(), "total": sum(counts.values()), "match_types": counts}
+                  for day, counts in sorted(daily.items())],
+        "top_idioms": [{"idiom": idiom, "count": entry[0], "avg_confidence": average(entry)}
+                       for idiom, entry in top_idioms],
+    }
+
+
+def idiom_counts():
+    """All-time detections per idiom (a multi-idiom sentence counts for each), from the rollup."""
+    rows = db.session.execute(
+        db.select(HistoryRollup.idiom, db.func.sum(HistoryRollup.count))
+        .where(HistoryRollup.idiom != "").group_by(HistoryRollup.idiom).execution_options(replica=True)
+    )
+    counts = {}
+    for idioms, count in rows:
+        for idiom in idioms.split(", "):
+            counts[idiom] = counts.get(idiom, 0) + int(count)
+    return counts
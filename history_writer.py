@@ -0,0 +1,135 @@
+# history_writer.py
+import atexit
+import logging
+import queue
+import threading
+import time
+from extensions import db
+from metrics import span
+from models import History
+from history_rollup import record_rollup
+
+
+class HistoryWriter:
+    """
+    Write-behind buffer for History rows.
+    Request threads enqueue plain dicts; a background thread inserts them in bulk
+    once batch_size rows are waiting or flush_interval seconds have passed.
+    """
+
+    def __init__(self, app, batch_size=100, flush_interval=2.0, max_queue=10000, enqueue_timeout=0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def submit(self, row):
+        """Queues a row. Blocks briefly when the queue is full, then drops it (backpressure)."""
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("dropped")
+            logging.warning("History queue full, dropping row")
+            return False
+        self._count("queued")
+        return True
+
+    def flush(self, timeout=None):
+        """Waits until every queued row has been written (or failed)."""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=10):
+        """Writes out whatever is still queued and stops the background thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)  # sentinel wakes the thread up
+        except queue.Full:
+            logging.error("History queue still full at shutdown; unwritten rows are lost")
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while True:
+            rows = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                # Once stopping, drain without waiting on the interval
+                remaining = 0 if stopping else deadline - time.monotonic()
+                try:
+                    row = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    self._queue.task_done()
+                    stopping = True
+                    continue
+                rows.append(row)
+
+            self._write(rows)
+            if stopping and self._queue.empty():
+                return
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self.app.app_context(), span("history_flush"):
+            try:
+                db.session.execute(db.insert(History), rows)
+                record_rollup(rows)
+                db.session.commit()
+                self._count("written", len(rows))
+            except Exception as e:
+                db.session.rollback()
+                self._count("failed", len(rows))
+                logging.error(f"History flush failed ({len(rows)} rows): {e}")
+            finally:
+                db.session.remove()
+        self._count("flushes")
+        for _ in rows:
+            self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+def init_history_writer(app):
+    """Starts the write-behind writer unless HISTORY_WRITE_MODE is 'sync'."""
+    if app.config.get("HISTORY_WRITE_MODE", "async") == "sync":
+        return None
+    writer = HistoryWriter(
+        app,
+        batch_size=app.config.get("HISTORY_BATCH_SIZE", 100),
+        flush_interval=app.config.get("HISTORY_FLUSH_INTERVAL", 2.0),
+        max_queue=app.config.get("HISTORY_QUEUE_SIZE", 10000),
+        enqueue_timeout=app.config.get("HISTORY_ENQUEUE_TIMEOUT", 0.05),
+    )
+    writer.start()
+    app.extensions["history_writer"] = writer
+    return writer
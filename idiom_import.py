@@ -0,0 +1,292 @@
+# idiom_import.py
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from extensions import db
+from models import Idiom
+from preprocess import normalize_text
+from metrics import external_call
+from translation import TRANSLATION_CACHE, make_translator
+from utils import bump_idiom_version, refresh_idiom_cache
+
+# Rows per SELECT/INSERT/UPDATE round trip (and per commit)
+IMPORT_CHUNK_SIZE = int(os.getenv("PAD_IMPORT_CHUNK_SIZE", 1000))
+# Concurrent googletrans calls filling in missing English explanations
+IMPORT_TRANSLATE_WORKERS = int(os.getenv("PAD_IMPORT_TRANSLATE_WORKERS", 4))
+IMPORT_MAX_UPLOAD_BYTES = int(os.getenv("PAD_IMPORT_MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+
+COLUMNS = ("idiom", "explanation_kannada", "explanation_english")
+# Header names accepted for each column; files without a header use COLUMNS order,
+# which is also the order schema.sql's LOAD DATA expects (idiom, Kannada explanation)
+_HEADER_ALIASES = {
+    "idiom": "idiom", "idioms": "idiom", "phrase": "idiom",
+    "explanation_kannada": "explanation_kannada", "kannada": "explanation_kannada", "meaning_kn": "explanation_kannada",
+    "explanation_english": "explanation_english", "english": "explanation_english", "meaning_en": "explanation_english",
+}
+_IDIOM_MAX_LENGTH = Idiom.__table__.c.idiom.type.length
+
+
+def read_rows(stream, delimiter=None):
+    """
+    Yields (line number, row dict) from a TSV or CSV byte/text stream without loading it all.
+    The delimiter is sniffed from the first line (tab wins) unless given; a first row naming
+    the columns is used as the header.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    first = stream.readline()
+    if delimiter is None:
+        delimiter = "\t" if "\t" in first else ","
+    # TSV dumps (like the LOAD DATA source) don't quote; CSVs from spreadsheets do
+    quoting = csv.QUOTE_NONE if delimiter == "\t" else csv.QUOTE_MINIMAL
+
+    def lines():
+        yield first
+        yield from stream
+    reader = csv.reader(lines(), delimiter=delimiter, quoting=quoting)
+
+    columns = COLUMNS
+    for line_no, values in enumerate(reader, start=1):
+        if line_no == 1:
+            names = [_HEADER_ALIASES.get(v.strip().lower()) for v in values]
+            if "idiom" in names:
+                columns = names
+                continue
+        if not any(v.strip() for v in values):
+            continue
+        yield line_no, {name: value for name, value in zip(columns, values) if name}
+
+
+def clean_row(row):
+    """Normalizes a parsed row; returns (row, None) or (None, reason it was rejected)."""
+    idiom = normalize_text(row.get("idiom"))
+    if not idiom:
+        return None, "missing idiom"
+    if len(idiom) > _IDIOM_MAX_LENGTH:
+        return None, f"idiom longer than {_IDIOM_MAX_LENGTH} characters"
+    return {
+        "idiom": idiom,
+        "explanation_kannada": normalize_text(row.get("explanation_kannada")) or None,
+        "explanation_english": normalize_text(row.get("explanation_english")) or None,
+    }, None
+
+
+class IdiomImport:
+    """
+    Streams an idiom file into the idioms table: rows are normalized and deduplicated
+    (first occurrence wins), compared with what is stored, and written in chunked bulk
+    INSERTs/UPDATEs, one commit per chunk. Missing English explanations are translated by a
+    small pool of workers. The idiom version is bumped once at the end, so every worker
+    reloads its cache one time instead of once per row.
+    """
+
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE, translate_workers=IMPORT_TRANSLATE_WORKERS,
+                 translate=True, translator_factory=None, progress=None):
+        self.chunk_size = chunk_size
+        self.translate_workers = translate_workers
+        self.translate = translate
+        self.translator_factory = translator_factory or make_translator
+        self.progress = progress
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"read": 0, "inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0,
+                      "rejected": 0, "translated": 0, "translation_failed": 0,
+                      "elapsed": 0.0, "rows_per_s": 0.0, "cache_rebuild_s": 0.0}
+        self.errors = []  # first few rejected lines, for the report
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def run(self, stream, delimiter=None):
+        """Imports everything in stream (needs an app context). Returns the stats dict."""
+        started = time.perf_counter()
+        seen = set()
+        chunk = []
+        changed = False
+        with ThreadPoolExecutor(max_workers=self.translate_workers, thread_name_prefix="import-translate") as pool:
+            try:
+                for line_no, raw in read_rows(stream, delimiter):
+                    self._count("read")
+                    row, problem = clean_row(raw)
+                    if problem:
+                        self._reject(line_no, problem)
+                        continue
+                    if row["idiom"] in seen:
+                        self._count("duplicates")
+                        continue
+                    seen.add(row["idiom"])
+                    chunk.append(row)
+                    if len(chunk) >= self.chunk_size:
+                        changed |= self._write_chunk(chunk, pool)
+                        chunk = []
+                        self._report(started)
+                if chunk:
+                    changed |= self._write_chunk(chunk, pool)
+            finally:
+                self._report(started)
+                # Whatever was committed before a failure still gets picked up
+                if changed:
+                    t0 = time.perf_counter()
+                    bump_idiom_version()
+                    db.session.commit()
+                    refresh_idiom_cache()
+                    with self._lock:
+                        self.stats["cache_rebuild_s"] = round(time.perf_counter() - t0, 3)
+                    if self.progress:
+                        self.progress(dict(self.stats))
+        return dict(self.stats)
+
+    def _reject(self, line_no, problem):
+        self._count("rejected")
+        if len(self.errors) < 20:
+            self.errors.append(f"line {line_no}: {problem}")
+
+    def _report(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.stats["elapsed"] = round(elapsed, 3)
+            self.stats["rows_per_s"] = round(self.stats["read"] / elapsed, 1) if elapsed else 0.0
+            stats = dict(self.stats)
+        if self.progress:
+            self.progress(stats)
+
+    def _write_chunk(self, rows, pool):
+        """Writes one chunk in a single transaction. Returns True if anything changed."""
+        # Keyed by normalized text: rows loaded by schema.sql may carry stray spaces that MySQL's
+        # collation ignores, so they match here and get updated under their stored key
+        existing = {
+            normalize_text(r.idiom): r for r in db.session.execute(
+                db.select(Idiom.idiom, Idiom.explanation_kannada, Idiom.explanation_english)
+                .where(Idiom.idiom.in_([row["idiom"] for row in rows]))
+            )
+        }
+        db.session.rollback()  # nothing written yet; don't hold the read transaction open while translating
+        inserts, updates = [], []
+        for row in rows:
+            old = existing.get(row["idiom"])
+            if old is not None:
+                # An explanation left empty in the file keeps the stored one
+                row["explanation_kannada"] = row["explanation_kannada"] or old.explanation_kannada
+                if not row["explanation_english"] and row["explanation_kannada"] == old.explanation_kannada:
+                    row["explanation_english"] = old.explanation_english
+                if (row["explanation_kannada"], row["explanation_english"]) == (old.explanation_kannada,
+                                                                                old.explanation_english):
+                    self._count("unchanged")
+                    continue
+            if old is not None:
+                updates.append(dict(row, idiom=old.idiom))
+            else:
+                inserts.append(row)
+
+        if self.translate:
+            self._fill_english([row for row in inserts + updates
+                                if not row["explanation_english"] and row["explanation_kannada"]], pool)
+        try:
+            if inserts:
+                db.session.execute(db.insert(Idiom), inserts)
+            if updates:
+                # executemany UPDATE ... WHERE idiom = ? (bulk update by primary key)
+                db.session.execute(db.update(Idiom), updates)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._count("inserted", len(inserts))
+        self._count("updated", len(updates))
+        return bool(inserts or updates)
+
+    def _translator(self):
+        # One per pool thread keeps its HTTP connection alive between calls
+        translator = getattr(self._local, "translator", None)
+        if translator is None:
+            translator = self._local.translator = self.translator_factory()
+        return translator
+
+    def _fill_english(self, rows, pool):
+        pending = {}  # Kannada explanation -> rows waiting for its English
+        for row in rows:
+            text = row["explanation_kannada"]
+            cached = TRANSLATION_CACHE.get(text, "kn", "en") if text not in pending else None
+            if cached is not None:
+                row["explanation_english"] = cached
+                self._count("translated")
+            else:
+                pending.setdefault(text, []).append(row)
+
+        def translate(text):
+            try:
+                with external_call("translate"):
+                    return text, self._translator().translate(text, src="kn", dest="en").text
+            except Exception as e:
+                # Left empty; /translate translates (and caches) it on first use instead
+                logging.warning(f"Could not translate explanation '{text}': {e}")
+                return text, None
+
+        stored = []
+        for text, result in pool.map(translate, pending):
+            waiting = pending[text]
+            if result is None:
+                self._count("translation_failed", len(waiting))
+                continue
+            for row in waiting:
+                row["explanation_english"] = result
+            self._count("translated", len(waiting))
+            stored.append(((text, "kn", "en"), result))
+        # One cache commit per chunk rather than one per explanation
+        TRANSLATION_CACHE.set_many(stored)
+
+
+class IdiomImportJob:
+    """Runs one IdiomImport at a time on a background thread, for the admin upload."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {"running": False}
+
+    def start(self, app, path, filename, **options):
+        """Imports the file at path (deleted afterwards); returns False if an import is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self.status = {"running": True, "file": filename, "started_at": time.time(), "finished_at": None,
+                           "error": None, "rejected_lines": []}
+            self._thread = threading.Thread(target=self._run, args=(app, path, options),
+                                            name="idiom-import", daemon=True)
+            self._thread.start()
+        return True
+
+    def _update(self, stats):
+        with self._lock:
+            self.status.update(stats)
+
+    def _run(self, app, path, options):
+        job = IdiomImport(progress=self._update, **options)
+        try:
+            with app.app_context(), open(path, "rb") as f:
+                job.run(f)
+        except Exception as e:
+            logging.exception("Idiom import failed")
+            with self._lock:
+                self.status["error"] = str(e)
+        finally:
+            os.remove(path)
+            with self._lock:
+                self.status.update(running=False, finished_at=time.time(), rejected_lines=list(job.errors))
+
+    def wait(self, timeout=None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_status(self):
+        with self._lock:
+            return dict(self.status)
+
+
+IDIOM_IMPORT = IdiomImportJob()
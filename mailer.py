@@ -0,0 +1,280 @@
+# mailer.py
+import atexit
+import logging
+import os
+import queue
+import random
+import secrets
+import smtplib
+import threading
+import time
+from metrics import external_call
+
+SMTP_SERVER = os.getenv("PAD_SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("PAD_SMTP_PORT", 587))
+SENDER_EMAIL = os.getenv("PAD_SENDER_EMAIL")
+SENDER_PASSWORD = os.getenv("PAD_SENDER_PASS")
+SMTP_TIMEOUT = float(os.getenv("PAD_SMTP_TIMEOUT", 10))
+# Off for a local debugging server, e.g. PAD_SMTP_SERVER=localhost PAD_SMTP_PORT=1025 PAD_SMTP_STARTTLS=false
+SMTP_STARTTLS = os.getenv("PAD_SMTP_STARTTLS", "true").lower() == "true"
+MAIL_FROM = os.getenv("PAD_MAIL_FROM") or SENDER_EMAIL or "padapunja@localhost"
+# A pooled connection is closed after sitting idle this long (servers drop idle ones anyway)
+SMTP_IDLE_SECONDS = float(os.getenv("PAD_SMTP_IDLE_SECONDS", 30))
+# ...and after this many messages; providers cap messages per connection
+SMTP_MESSAGES_PER_CONNECTION = int(os.getenv("PAD_SMTP_MESSAGES_PER_CONNECTION", 50))
+
+
+def otp_message(otp):
+    subject = "Padapunja OTP Login"
+    return f"Subject: {subject}\n\nYour OTP for Padapunja is: {otp}\nThis OTP expires in 5 minutes."
+
+
+def open_smtp():
+    """An SMTP connection that is ready to send: STARTTLS and login done (when configured)."""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SENDER_PASSWORD:
+            server.login(SENDER_EMAIL, SENDER_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def send_mail(to, message):
+    """Sends one message over a fresh connection. Raises on any SMTP error."""
+    with external_call("smtp"):
+        server = open_smtp()
+        server.sendmail(MAIL_FROM, to, message)
+        server.quit()
+
+
+async def send_mail_async(to, message):
+    """send_mail() for the async serving mode; the event loop keeps running while the server talks."""
+    import aiosmtplib  # only the ASGI mode needs it
+    with external_call("smtp"):
+        await aiosmtplib.send(
+            message.encode("utf-8"), sender=MAIL_FROM, recipients=[to],
+            hostname=SMTP_SERVER, port=SMTP_PORT, start_tls=SMTP_STARTTLS,
+            username=SENDER_EMAIL if SENDER_PASSWORD else None, password=SENDER_PASSWORD, timeout=SMTP_TIMEOUT,
+        )
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+def is_permanent(error):
+    """5xx replies (bad address, rejected credentials) won't go away on retry; 4xx and network errors might."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class MailDispatcher:
+    """
+    Sends queued mail from background threads so /login never waits on SMTP.
+    Each sender thread keeps one authenticated connection open and reuses it across messages,
+    so a login burst costs `workers` connections instead of one per OTP. Transient failures
+    are retried with exponential backoff; status(job_id) reports progress for the UI to poll.
+    """
+
+    def __init__(self, workers=2, max_queue=1000, retries=3, backoff=2.0, status_ttl=600):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.status_ttl = status_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._jobs = {}  # job id -> {"status", "attempts", "error", "updated"}
+        self._retry_timers = {}  # timer -> job waiting for its next attempt
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._pruned = time.monotonic()
+        self.counters = {"queued": 0, "sent": 0, "retried": 0, "failed": 0, "dropped": 0,
+                         "connections": 0, "reconnects": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"mail-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def submit(self, to, message):
+        """Queues a message and returns its job id. Raises MailQueueFull instead of waiting."""
+        job_id = secrets.token_urlsafe(12)
+        job = {"id": job_id, "to": to, "message": message}
+        self._set_status(job_id, "queued", attempts=0)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._count("dropped")
+            raise MailQueueFull("Mail queue is full")
+        self._count("queued")
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _set_status(self, job_id, status, **fields):
+        now = time.monotonic()
+        with self._lock:
+            job = self._jobs.setdefault(job_id, {"attempts": 0, "error": None})
+            job.update(fields, status=status, updated=now)
+            # Now and then, forget finished jobs nobody polled for a while
+            if now - self._pruned > 60:
+                self._pruned = now
+                for key in [k for k, v in self._jobs.items()
+                            if v["status"] in ("sent", "failed") and now - v["updated"] > self.status_ttl]:
+                    del self._jobs[key]
+
+    def flush(self, timeout=None):
+        """Waits until every queued message (retries included) has been sent or given up on."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                idle = not self._retry_timers
+            if idle and self._queue.unfinished_tasks == 0:
+                return True
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.02)
+
+    def stop(self, timeout=10):
+        """Sends what is already queued, drops pending retries and closes the connections."""
+        if not self._threads:
+            return
+        self._stopping = True
+        with self._lock:
+            timers, self._retry_timers = self._retry_timers, {}
+        for timer, job in timers.items():
+            timer.cancel()
+            self._set_status(job["id"], "failed", error="Server shut down before the retry")
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logging.error("Mail queue still full at shutdown; unsent mail is lost")
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        conn = None
+        sent_on_conn = 0
+        while True:
+            try:
+                job = self._queue.get(timeout=SMTP_IDLE_SECONDS if conn else None)
+            except queue.Empty:
+                conn = _quit(conn)
+                continue
+            if job is None:
+                self._queue.task_done()
+                _quit(conn)
+                return
+
+            if conn is not None and sent_on_conn >= SMTP_MESSAGES_PER_CONNECTION:
+                conn = _quit(conn)
+            attempts = self.status(job["id"])["attempts"] + 1
+            self._set_status(job["id"], "sending", attempts=attempts)
+            try:
+                with external_call("smtp"):
+                    reused = conn is not None
+                    if not reused:
+                        conn, sent_on_conn = self._connect(), 0
+                    try:
+                        conn.sendmail(MAIL_FROM, job["to"], job["message"])
+                    except (smtplib.SMTPServerDisconnected, ConnectionError):
+                        if not reused:
+                            raise
+                        # The pooled connection went stale; reconnecting once doesn't count as a retry
+                        conn = _quit(conn)
+                        self._count("reconnects")
+                        conn, sent_on_conn = self._connect(), 0
+                        conn.sendmail(MAIL_FROM, job["to"], job["message"])
+                sent_on_conn += 1
+                self._set_status(job["id"], "sent", error=None)
+                self._count("sent")
+            except Exception as e:
+                if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                    conn = _quit(conn)  # unknown state; start clean next time
+                self._failed(job, attempts, e)
+            finally:
+                self._queue.task_done()
+
+    def _connect(self):
+        conn = open_smtp()
+        self._count("connections")
+        return conn
+
+    def _failed(self, job, attempts, error):
+        if self._stopping or is_permanent(error) or attempts > self.retries:
+            logging.error(f"Giving up on mail to {job['to']} after {attempts} attempt(s): {error}")
+            self._set_status(job["id"], "failed", error=str(error))
+            self._count("failed")
+            return
+        delay = self.backoff * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+        logging.warning(f"Mail to {job['to']} failed ({error}); retrying in {delay:.1f}s")
+        self._set_status(job["id"], "retrying", error=str(error))
+        self._count("retried")
+
+        def requeue():
+            with self._lock:
+                if self._retry_timers.pop(timer, None) is None:
+                    return  # cancelled by stop()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._set_status(job["id"], "failed", error="Mail queue is full")
+                self._count("failed")
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        with self._lock:
+            self._retry_timers[timer] = job
+        timer.start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+def _quit(conn):
+    """Closes a pooled connection, politely if it still answers. Always returns None."""
+    if conn is not None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+    return None
+
+
+def init_mail_dispatcher(app):
+    """Starts the background mail senders unless MAIL_MODE is 'sync'."""
+    if app.config.get("MAIL_MODE", "async") == "sync":
+        return None
+    dispatcher = MailDispatcher(
+        workers=app.config.get("MAIL_WORKERS", 2),
+        max_queue=app.config.get("MAIL_QUEUE_SIZE", 1000),
+        retries=app.config.get("MAIL_RETRIES", 3),
+        backoff=app.config.get("MAIL_RETRY_BACKOFF", 2.0),
+    )
+    dispatcher.start()
+    app.extensions["mail_dispatcher"] = dispatcher
+    return dispatcher
@@ -0,0 +1,491 @@
+# matcher.py
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, deque
+import numpy as np
+from rapidfuzz import fuzz, process
+from preprocess import normalize_text
+
+NGRAM_SIZE = 2
+_NON_WORD = re.compile(r"(?ui)\W")
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher. Finds every pattern occurrence in one pass."""
+
+    def __init__(self, patterns):
+        # patterns: iterable of (pattern_id, pattern)
+        self.patterns = dict(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        # Link to the nearest suffix state that ends a pattern (saves copying outputs)
+        self._dict_link = [0]
+
+        for pid, pattern in self.patterns.items():
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._dict_link.append(0)
+                state = nxt
+            self._out[state].append(pid)
+
+        self._build_links()
+
+    def _build_links(self):
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[nxt] = f
+                dict_link[nxt] = f if out[f] else dict_link[f]
+
+    def iter_matches(self, text):
+        """Yields (start, end, pattern_id) for every occurrence in text."""
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        patterns = self.patterns
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] else dict_link[state]
+            while s:
+                for pid in out[s]:
+                    yield i + 1 - len(patterns[pid]), i + 1, pid
+                s = dict_link[s]
+
+    def to_arrays(self):
+        """
+        Flattens the trie and links into numpy arrays: edges stored CSR-style per state and
+        sorted by character, plus each pattern's length indexed by its (integer) pid.
+        """
+        edge_offsets, chars, targets, out_offsets, outs = [0], [], [], [0], []
+        for edges, pids in zip(self._goto, self._out):
+            for ch, nxt in sorted(edges.items()):
+                chars.append(ord(ch))
+                targets.append(nxt)
+            edge_offsets.append(len(chars))
+            outs.extend(pids)
+            out_offsets.append(len(outs))
+        pattern_lens = np.zeros(max(self.patterns, default=-1) + 1, dtype=np.int32)
+        for pid, pattern in self.patterns.items():
+            pattern_lens[pid] = len(pattern)
+        return {
+            "edge_offsets": np.array(edge_offsets, dtype=np.int64),
+            "edge_chars": np.array(chars, dtype=np.uint32),
+            "edge_targets": np.array(targets, dtype=np.int32),
+            "fail": np.array(self._fail, dtype=np.int32),
+            "dict_link": np.array(self._dict_link, dtype=np.int32),
+            "out_offsets": np.array(out_offsets, dtype=np.int64),
+            "out": np.array(outs, dtype=np.int64),
+            "pattern_lens": pattern_lens,
+        }
+
+
+class ArrayAhoCorasick:
+    """
+    The same automaton run directly off AhoCorasick.to_arrays() output, with nothing rebuilt.
+    Over arrays backed by an mmap, every process shares one copy of the trie. Each step
+    bisects the state's sorted edges, which is about 1.5x slower than the dict walk.
+    """
+
+    def __init__(self, arrays):
+        def view(name, code):
+            # Plain memoryviews: indexing one gives a Python int without a numpy scalar in between
+            return memoryview(np.ascontiguousarray(arrays[name])).cast("B").cast(code)
+        self._edge_offsets = view("edge_offsets", "q")
+        self._chars = view("edge_chars", "I")
+        self._targets = view("edge_targets", "i")
+        self._fail = view("fail", "i")
+        self._dict_link = view("dict_link", "i")
+        self._out_offsets = view("out_offsets", "q")
+        self._out = view("out", "q")
+        self._pattern_lens = view("pattern_lens", "i")
+
+    def iter_matches(self, text):
+        """Yields (start, end, pattern_id) for every occurrence in text."""
+        edge_offsets, chars, targets = self._edge_offsets, self._chars, self._targets
+        fail, dict_link, out_offsets, out = self._fail, self._dict_link, self._out_offsets, self._out
+        pattern_lens = self._pattern_lens
+        state = 0
+        for i, ch in enumerate(text):
+            code = ord(ch)
+            while True:
+                a, b = edge_offsets[state], edge_offsets[state + 1]
+                edge = bisect_left(chars, code, a, b)
+                if edge < b and chars[edge] == code:
+                    state = targets[edge]
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            s = state if out_offsets[state] != out_offsets[state + 1] else dict_link[state]
+            while s:
+                for k in range(out_offsets[s], out_offsets[s + 1]):
+                    pid = out[k]
+                    yield i + 1 - pattern_lens[pid], i + 1, pid
+                s = dict_link[s]
+
+
+def fuzzy_key(text):
+    """The string fuzzywuzzy's token_sort_ratio really compares: cleaned, lowercased, sorted tokens."""
+    return " ".join(sorted(_NON_WORD.sub(" ", text).lower().split()))
+
+
+def _ngrams(key):
+    return Counter(key[i:i + NGRAM_SIZE] for i in range(len(key) - NGRAM_SIZE + 1))
+
+
+class FuzzyIndex:
+    """
+    Character n-gram inverted index over idiom keys, grouped by token count.
+    Only idioms sharing enough n-grams with a window to reach the cutoff get scored.
+    """
+
+    def __init__(self, entries):
+        # entries: (pid, idiom_obj) pairs in match priority order
+        self.keys = {}
+        groups = {}
+        for pid, idiom_obj in entries:
+            phrase = match_pattern(idiom_obj)
+            n_tokens = len(phrase.split())
+            if not n_tokens:
+                continue
+            key = fuzzy_key(phrase)
+            self.keys[pid] = key
+            groups.setdefault(n_tokens, []).append(pid)
+
+        # token_count -> (pids, key lengths, {ngram: (row indexes, counts)})
+        self._groups = {}
+        for n_tokens, pids in groups.items():
+            postings = {}
+            for row, pid in enumerate(pids):
+                for gram, count in _ngrams(self.keys[pid]).items():
+                    rows, counts = postings.setdefault(gram, ([], []))
+                    rows.append(row)
+                    counts.append(count)
+            postings = {g: (np.array(r, dtype=np.int32), np.array(c, dtype=np.int32))
+                        for g, (r, c) in postings.items()}
+            lens = np.array([len(self.keys[p]) for p in pids], dtype=np.int32)
+            self._groups[n_tokens] = (np.array(pids, dtype=np.int64), lens, postings)
+        self.token_counts = sorted(self._groups)
+
+    def to_arrays(self):
+        """Returns ({token_count: grams}, {name: array}); postings are flattened per group, grams sorted."""
+        grams_by_group = {}
+        arrays = {}
+        for n_tokens, (pids, lens, postings) in self._groups.items():
+            grams = sorted(postings)
+            offsets = np.cumsum([0] + [len(postings[g][0]) for g in grams], dtype=np.int64)
+            empty = np.array([], dtype=np.int32)
+            grams_by_group[n_tokens] = grams
+            arrays[f"{n_tokens}_pids"] = pids
+            arrays[f"{n_tokens}_lens"] = lens
+            arrays[f"{n_tokens}_gram_offsets"] = offsets
+            arrays[f"{n_tokens}_rows"] = np.concatenate([postings[g][0] for g in grams] or [empty])
+            arrays[f"{n_tokens}_counts"] = np.concatenate([postings[g][1] for g in grams] or [empty])
+        return grams_by_group, arrays
+
+    @classmethod
+    def from_arrays(cls, keys, grams_by_group, arrays):
+        """
+        Rebuilds an index from to_arrays() output. The postings are slices of the
+        given arrays, so arrays backed by an mmap stay shared instead of being copied.
+        """
+        index = cls.__new__(cls)
+        index.keys = dict(keys)
+        index._groups = {}
+        for n_tokens, grams in grams_by_group.items():
+            offsets = arrays[f"{n_tokens}_gram_offsets"].tolist()
+            rows, counts = arrays[f"{n_tokens}_rows"], arrays[f"{n_tokens}_counts"]
+            postings = {g: (rows[a:b], counts[a:b]) for g, a, b in zip(grams, offsets, offsets[1:])}
+            index._groups[n_tokens] = (arrays[f"{n_tokens}_pids"], arrays[f"{n_tokens}_lens"], postings)
+        index.token_counts = sorted(index._groups)
+        return index
+
+    def candidates(self, n_tokens, window_keys, cutoff, dead=()):
+        """Pids (priority order) with n_tokens words that could reach cutoff against at least one window."""
+        pids, la, postings = self._groups[n_tokens]
+        # Per n-gram, the most any single window has of it
+        window_grams = Counter()
+        for key in window_keys:
+            for gram, count in _ngrams(key).items():
+                if count > window_grams[gram]:
+                    window_grams[gram] = count
+        shared = np.zeros(len(pids), dtype=np.int32)
+        for gram, count in window_grams.items():
+            if gram in postings:
+                rows, counts = postings[gram]
+                shared[rows] += np.minimum(counts, count)
+
+        # Keys too short to have n-grams can't be filtered, so they always stay
+        keep = la < NGRAM_SIZE
+        for lb in {len(key) for key in window_keys}:
+            total = la + lb
+            # Length filter: Indel ratio is at most 2*min/(la+lb)
+            length_ok = 200 * np.minimum(la, lb) >= cutoff * total
+            # Count filter: each insert/delete destroys at most NGRAM_SIZE n-grams
+            max_dist = np.floor((100 - cutoff) * total / 100 + 1e-9)
+            count_ok = shared >= np.maximum(la, lb) - NGRAM_SIZE + 1 - NGRAM_SIZE * max_dist
+            keep |= length_ok & count_ok
+        if dead:
+            keep &= ~np.isin(pids, list(dead))
+        return pids[keep].tolist()
+
+    def best_match(self, sentence, min_score, rank, dead=()):
+        """
+        Returns (sort_key, pid, window_phrase, score) for the best window scoring >= min_score, else None.
+        Ties go to the idiom with the lower rank(pid), then the earlier window, like the old nested loop.
+        """
+        tokens = sentence.split()
+        # Scores are rounded to ints, so anything >= min_score - 0.5 can still qualify
+        cutoff = min_score - 0.5
+        best = None
+        for n_tokens in self.token_counts:
+            if n_tokens > len(tokens):
+                break
+            windows = [" ".join(tokens[i:i + n_tokens]) for i in range(len(tokens) - n_tokens + 1)]
+            window_keys = [fuzzy_key(w) for w in windows]
+            pids = self.candidates(n_tokens, window_keys, cutoff, dead)
+            if not pids:
+                continue
+            # One bulk call scores every (candidate, window) pair
+            scores = np.rint(process.cdist([self.keys[p] for p in pids], window_keys,
+                                           scorer=fuzz.ratio, score_cutoff=cutoff))
+            top = int(scores.max())
+            if top < min_score:
+                continue
+            # Rows are in priority order and argwhere walks row-major,
+            # so the first hit is the top priority idiom at its earliest window
+            row, col = np.argwhere(scores == top)[0]
+            sort_key = (-top, rank(pids[row]), int(col))
+            if best is None or sort_key < best[0]:
+                best = (sort_key, pids[row], windows[col], top)
+        return best
+
+
+def match_pattern(idiom_obj):
+    """The text both matchers look for: the idiom as normalize_text() leaves it."""
+    return normalize_text(idiom_obj['idiom'])
+
+
+def match_priority(idiom_obj):
+    """Longest idioms first; equal lengths by text so full and incremental builds agree."""
+    return (-len(idiom_obj['idiom']), idiom_obj['idiom'])
+
+
+class _Segment:
+    """An immutable automaton + fuzzy index over a fixed set of pids."""
+
+    def __init__(self, entries):
+        # entries: (pid, idiom_obj) pairs in priority order
+        self.pids = [pid for pid, _ in entries]
+        self.automaton = AhoCorasick((pid, match_pattern(obj)) for pid, obj in entries)
+        self.fuzzy_index = FuzzyIndex(entries)
+
+    @classmethod
+    def prebuilt(cls, pids, automaton, fuzzy_index):
+        segment = cls.__new__(cls)
+        segment.pids = list(pids)
+        segment.automaton = automaton
+        segment.fuzzy_index = fuzzy_index
+        return segment
+
+
+class IdiomMatcher:
+    """
+    Exact + fuzzy idiom matcher over the idiom cache.
+    A large base segment is built once; new idioms go into a small delta segment
+    that is rebuilt on each change, and deletes are tombstoned. Once either grows
+    past COMPACT_RATIO of the base, everything is folded back into the base.
+    Writers swap in a new state tuple under the write lock, so readers never see a
+    half-applied change; nothing else ever assigns the state.
+    """
+
+    COMPACT_MIN = 256
+    COMPACT_RATIO = 0.05
+
+    def __init__(self, idioms):
+        self._next_pid = 0
+        self._write_lock = threading.Lock()
+        entries = {}
+        for idiom_obj in idioms:
+            entries[self._new_pid()] = idiom_obj
+        self._compact(entries)
+
+    def _new_pid(self):
+        pid = self._next_pid
+        self._next_pid += 1
+        return pid
+
+    @classmethod
+    def from_segment(cls, idioms, base):
+        """
+        Wraps a prebuilt base segment (e.g. loaded from a snapshot).
+        idioms must already be in priority order, and base's pids index into it.
+        """
+        matcher = cls.__new__(cls)
+        matcher._next_pid = len(idioms)
+        matcher._write_lock = threading.Lock()
+        matcher._install(list(enumerate(idioms)), base)
+        return matcher
+
+    def _compact(self, entries, dead=frozenset()):
+        live = sorted(((pid, obj) for pid, obj in entries.items() if pid not in dead),
+                      key=lambda e: match_priority(e[1]))
+        self._install(live, _Segment(live))
+
+    def _install(self, live, base):
+        # (entries, pid by idiom text, base, delta, tombstones)
+        self._state = (dict(live), {obj['idiom']: pid for pid, obj in live}, base, _Segment([]), frozenset())
+        # live is already in priority order, so the sorted list comes for free here
+        self._ordered = (self._state, [obj for _, obj in live])
+
+    def _too_big(self, n, base):
+        return n > max(self.COMPACT_MIN, self.COMPACT_RATIO * len(base.pids))
+
+    def __len__(self):
+        return len(self._state[1])
+
+    def pinned(self):
+        """A read-only matcher over the current idioms; later upserts and deletes don't show through."""
+        view = IdiomMatcher.__new__(IdiomMatcher)
+        view._state = self._state
+        view._ordered = self._ordered
+        return view
+
+    @property
+    def idioms(self):
+        """Live idiom dicts, longest first (the old IDIOM_CACHE order)."""
+        state = self._state
+        cached_state, ordered = self._ordered
+        if cached_state is not state:
+            entries, by_idiom = state[0], state[1]
+            ordered = sorted((entries[pid] for pid in by_idiom.values()), key=match_priority)
+            # Keyed by the state it was sorted from: a reader that lost a race with a writer
+            # only leaves a list no later state will match
+            self._ordered = (state, ordered)
+        return ordered
+
+    def upsert(self, idiom_obj):
+        """Adds or replaces one idiom in place."""
+        with self._write_lock:
+            self._upsert(idiom_obj)
+
+    def _upsert(self, idiom_obj):
+        entries, by_idiom, base, delta, dead = self._state
+        entries = dict(entries)
+        pid = by_idiom.get(idiom_obj['idiom'])
+        if pid is not None:
+            # Same text means the same patterns; only the payload changes
+            entries[pid] = idiom_obj
+            self._state = (entries, by_idiom, base, delta, dead)
+            return
+
+        pid = self._new_pid()
+        entries[pid] = idiom_obj
+        by_idiom = dict(by_idiom)
+        by_idiom[idiom_obj['idiom']] = pid
+        delta_pids = delta.pids + [pid]
+        if self._too_big(len(delta_pids), base):
+            self._compact(entries, dead)
+            return
+        delta = _Segment(sorted(((p, entries[p]) for p in delta_pids), key=lambda e: match_priority(e[1])))
+        self._state = (entries, by_idiom, base, delta, dead)
+
+    def delete(self, idiom):
+        """Removes one idiom by its text. Returns False if it wasn't cached."""
+        with self._write_lock:
+            return self._delete(idiom)
+
+    def _delete(self, idiom):
+        entries, by_idiom, base, delta, dead = self._state
+        pid = by_idiom.get(idiom)
+        if pid is None:
+            return False
+        by_idiom = {k: v for k, v in by_idiom.items() if k != idiom}
+        # The entry stays until compaction so in-flight lookups of its pid still resolve
+        dead = dead | {pid}
+        if self._too_big(len(dead), base):
+            self._compact(entries, dead)
+        else:
+            self._state = (entries, by_idiom, base, delta, dead)
+        return True
+
+    def find_exact(self, sentence, boundaries=None):
+        """
+        Returns [(idiom_obj, phrase, [(start, end), ...]), ...] in priority order.
+        Longer idioms claim their spans first; overlapping shorter hits are dropped.
+        With boundaries (see preprocess.grapheme_boundaries), hits that start or end
+        inside a grapheme cluster, e.g. a consonant that really carries a vowel sign, are ignored.
+        """
+        entries, _, base, delta, dead = self._state
+        hits = {}
+        patterns = {}
+        for segment in (base, delta):
+            for start, end, pid in segment.automaton.iter_matches(sentence):
+                if pid in dead:
+                    continue
+                if boundaries is not None and (start not in boundaries or end not in boundaries):
+                    continue
+                hits.setdefault(pid, []).append((start, end))
+                # An exact hit's text is the pattern itself
+                patterns[pid] = sentence[start:end]
+
+        taken = []
+        results = []
+        for pid in sorted(hits, key=lambda p: match_priority(entries[p])):
+            spans = []
+            last_end = -1
+            for start, end in sorted(hits[pid]):
+                # Same idiom overlapping itself: keep the leftmost, like str.replace
+                if start < last_end:
+                    continue
+                if any(start < t_end and t_start < end for t_start, t_end in taken):
+                    continue
+                spans.append((start, end))
+                last_end = end
+            if spans:
+                taken.extend(spans)
+                results.append((entries[pid], patterns[pid], spans))
+        return results
+
+    def find_fuzzy(self, sentence, min_score):
+        """Returns (idiom_obj, window_phrase, score) for the best fuzzy window, or None."""
+        entries, _, base, delta, dead = self._state
+        rank = lambda pid: match_priority(entries[pid])
+        matches = [segment.fuzzy_index.best_match(sentence, min_score, rank, dead)
+                   for segment in (base, delta)]
+        matches = [m for m in matches if m]
+        if not matches:
+            return None
+        _, pid, window_phrase, score = min(matches)
+        return entries[pid], window_phrase, score
+
+
+def replace_spans(sentence, replacements):
+    """Rewrites sentence given [(start, end, new_text), ...] non-overlapping spans."""
+    parts = []
+    pos = 0
+    for start, end, new_text in sorted(replacements):
+        parts.append(sentence[pos:start])
+        parts.append(new_text)
+        pos = end
+    parts.append(sentence[pos:])
+    return "".join(parts)
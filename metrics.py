@@ -0,0 +1,179 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+
+# Seconds; spans a sub-millisecond exact scan up to a googletrans call hitting its deadline
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """
+    Counters and histograms for this process, rendered in the Prometheus text format.
+    Every worker process keeps its own; Prometheus sums them across scrape targets.
+    Collectors add point-in-time samples (cache stats and the like) at scrape time.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}     # name -> {label pairs: value}
+        self._histograms = {}   # name -> {label pairs: [count per bucket..., count above the last, sum]}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, n=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + n
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        # Prometheus buckets are "less than or equal"
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def add_collector(self, collector):
+        """collector() returns [(name, kind, help, labels dict, value), ...] when scraped."""
+        self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: list(c) for k, c in series.items()} for name, series in self._histograms.items()}
+
+        lines = []
+
+        def header(name, kind, help_text=None):
+            help_text = help_text or self._help.get(name, (kind, name))[1]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, counts in sorted(histograms[name].items()):
+                running = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                    running += count
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {running}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+                lines.append(f"{name}_count{_format_labels(key)} {running}")
+
+        samples = {}
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                samples.setdefault(name, (kind, help_text, []))[2].append((tuple(sorted(labels.items())), value))
+        for name in sorted(samples):
+            kind, help_text, series = samples[name]
+            header(name, kind, help_text)
+            for key, value in series:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry()
+METRICS.describe("pad_stage_seconds", "histogram", "Time spent in each stage of translation, history writes and idiom loading")
+METRICS.describe("pad_request_seconds", "histogram", "Time to produce a response (headers only for streamed ones)")
+METRICS.describe("pad_external_call_seconds", "histogram", "Duration of calls to googletrans, gTTS, speech recognition and SMTP")
+METRICS.describe("pad_external_calls_total", "counter", "Calls to external services by outcome")
+
+
+@contextmanager
+def span(stage):
+    """Times a block into pad_stage_seconds and, inside a request, into its Server-Timing header."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        METRICS.observe("pad_stage_seconds", elapsed, stage=stage)
+        if has_request_context():
+            timings = g.setdefault("timings", {})
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def external_call(service):
+    """Counts and times one call to an outside service; exceptions count as errors and propagate."""
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        METRICS.observe("pad_external_call_seconds", time.perf_counter() - t0, service=service)
+        METRICS.inc("pad_external_calls_total", service=service, outcome=outcome)
+
+
+def stats_samples(prefix, stats, help_text, **labels):
+    """
+    Turns a stats() dict into samples: hit_rate becomes a ratio gauge, *_entries/bytes/pending/active/waiting
+    become gauges, every other number a counter labelled with its key.
+    """
+    samples = []
+    for key, value in stats.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if key == "hit_rate":
+            samples.append((f"{prefix}_hit_ratio", "gauge", f"{help_text}: hit ratio", labels, value))
+        elif key.endswith("entries") or key in ("bytes", "pending", "active", "waiting"):
+            samples.append((f"{prefix}_{key}", "gauge", f"{help_text}: {key.replace('_', ' ')}", labels, value))
+        else:
+            samples.append((f"{prefix}_events_total", "counter", f"{help_text}: events", dict(labels, event=key), value))
+    return samples
+
+
+def init_metrics(app):
+    """Times every request and, with SERVER_TIMING on, reports its stages in a Server-Timing header."""
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        METRICS.observe("pad_request_seconds", elapsed, endpoint=request.endpoint or "unmatched",
+                        method=request.method, status=str(response.status_code))
+        if app.config.get("SERVER_TIMING"):
+            parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in g.get("timings", {}).items()]
+            parts.append(f"total;dur={elapsed * 1000:.2f}")
+            response.headers["Server-Timing"] = ", ".join(parts)
+        return response
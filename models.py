@@ -15,8 +15,22 @@ class Idiom(db.Model):
             "explanation_kannada": self.explanation_kannada
         }
 
+class IdiomVersion(db.Model):
+    """Single row (id=1) bumped on every idiom change so workers know when to reload their cache"""
+    __tablename__ = 'idiom_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
 class History(db.Model):
     __tablename__ = 'history'
+    # Keyset pagination walks (timestamp, id); the filtered listings lead with their filter column
+    __table_args__ = (
+        db.Index('ix_history_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_history_email_timestamp_id', 'email', 'timestamp', 'id'),
+        db.Index('ix_history_status_timestamp_id', 'status', 'timestamp', 'id'),
+        db.Index('ix_history_match_type_timestamp_id', 'match_type', 'timestamp', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), index=True)
     original_sentence = db.Column(db.Text)
@@ -40,6 +54,18 @@ class History(db.Model):
             "timestamp": self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+class HistoryRollup(db.Model):
+    """Per-day History counts by idiom and match type, kept up to date as history is written (see history_rollup.py)"""
+    __tablename__ = 'history_rollup'
+    day = db.Column(db.Date, primary_key=True)
+    # The History values as written ('' for no idiom / no match); idiom may list several, joined by ', '
+    idiom = db.Column(db.String(255), primary_key=True)
+    match_type = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # Only fuzzy matches have a confidence, so the average is confidence_sum / confidence_count
+    confidence_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    confidence_count = db.Column(db.Integer, nullable=False, default=0)
+
 class Suggestion(db.Model):
     __tablename__ = 'suggestions'
     id = db.Column(db.Integer, primary_key=True)
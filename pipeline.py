@@ -0,0 +1,188 @@
+# pipeline.py
+import re
+from matcher import IdiomMatcher, replace_spans
+from metrics import span
+from preprocess import preprocess
+
+FUZZY_MATCH_CONFIDENCE = 85
+
+# Sentence ends: Latin/Devanagari punctuation followed by space, or a line break
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?।॥])\s+|\s*\n+\s*")
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_BREAK.split(text) if s and s.strip()]
+
+
+def plan_translation(sentence, matcher):
+    """
+    Detects idioms in a sentence and lists the external translations its response needs.
+    No network calls happen here, so many plans can share one translate_many() fan-out.
+    """
+    original = sentence
+    # Normalized text (NFC, no ZWJ/ZWNJ, single spaces) is what gets matched and translated
+    with span("preprocess"):
+        sentence, lang, boundaries = preprocess(sentence)
+
+    # Exact Match Pass (single scan of the sentence, longest idioms win, whole graphemes only)
+    with span("exact_match"):
+        exact_matches = matcher.find_exact(sentence, boundaries)
+
+    # Fuzzy Match Pass (n-gram index narrows candidates, RapidFuzz scores them)
+    fuzzy_match = None
+    if not exact_matches:
+        with span("fuzzy_match"):
+            fuzzy_match = matcher.find_fuzzy(sentence, FUZZY_MATCH_CONFIDENCE)
+
+    jobs = {}
+    if lang == "kn":
+        jobs["literal"] = (sentence, "kn", "en")
+
+    detected = []
+    full_sentence_kn = sentence
+    if exact_matches:
+        replacements = []
+        for idiom_obj, idiom_phrase, spans in exact_matches:
+            # Use .copy() to avoid modifying the global cache
+            idiom_dict = idiom_obj.copy()
+            kannada_expl = idiom_dict.get("explanation_kannada") or ""
+
+            # Auto-translate missing fields
+            if not idiom_dict.get("explanation_english") and kannada_expl:
+                jobs[("explanation", len(detected))] = (kannada_expl, "kn", "en")
+            jobs[("phrase", len(detected))] = (idiom_phrase, "kn", "en")
+
+            detected.append((idiom_dict, idiom_phrase))
+            replacements.extend((start, end, kannada_expl) for start, end in spans)
+
+        full_sentence_kn = replace_spans(sentence, replacements)
+        jobs["full"] = (full_sentence_kn, "kn", "en")
+
+    elif fuzzy_match:
+        best_match_idiom, best_match_phrase, _ = fuzzy_match
+        idiom_dict = best_match_idiom.copy()
+        kannada_expl = idiom_dict.get("explanation_kannada") or ""
+
+        # Translate missing parts
+        if not idiom_dict.get("explanation_english") and kannada_expl:
+            jobs[("explanation", 0)] = (kannada_expl, "kn", "en")
+
+        detected.append((idiom_dict, best_match_phrase))
+        full_sentence_kn = sentence.replace(best_match_phrase, kannada_expl)
+        jobs["full"] = (full_sentence_kn, "kn", "en")
+
+    elif lang == "en":
+        jobs["literal_kn"] = (sentence, "en", "kn")
+
+    return {
+        "sentence": original,
+        "normalized": sentence,
+        "lang": lang,
+        "exact": bool(exact_matches),
+        "fuzzy_match": fuzzy_match,
+        "detected": detected,
+        "full_sentence_kn": full_sentence_kn,
+        "jobs": jobs,
+    }
+
+
+def affected_by_idiom(idiom_obj):
+    """
+    Predicate over normalized sentences: could adding or changing idiom_obj alter their plan?
+    True when the idiom alone matches the sentence exactly or fuzzily (it may or may not win then).
+    """
+    probe = IdiomMatcher([idiom_obj])
+
+    def affected(sentence):
+        text, _, boundaries = preprocess(sentence)
+        return bool(probe.find_exact(text, boundaries)) or probe.find_fuzzy(text, FUZZY_MATCH_CONFIDENCE) is not None
+    return affected
+
+
+def detection_fields(plan):
+    """The History fields a plan decides on its own, without any translation: status, match_type, idiom, confidence."""
+    if plan["exact"]:
+        return {"status": "idiom_detected", "match_type": "exact_multiple",
+                "idiom": ", ".join(phrase for _, phrase in plan["detected"]), "confidence": None}
+    if plan["fuzzy_match"]:
+        return {"status": "idiom_detected", "match_type": "fuzzy_single",
+                "idiom": plan["detected"][0][0]["idiom"], "confidence": plan["fuzzy_match"][2]}
+    return {"status": "no_idiom_detected", "match_type": "", "idiom": "", "confidence": None}
+
+
+def finish_translation(plan, translated):
+    """
+    Builds the /translate response from a plan and its translate_many() results.
+    Returns (response, history) where history holds the save_history_entry() fields.
+    """
+    sentence = plan["normalized"]
+    jobs = plan["jobs"]
+
+    # Failed or timed-out calls come back as exceptions; fall back per field
+    def translated_or(key, fallback):
+        value = translated.get(key)
+        return fallback if value is None or isinstance(value, Exception) else value
+
+    literal_meaning_en = translated.get("literal", sentence)
+    if isinstance(literal_meaning_en, Exception):
+        literal_meaning_en = f"Translation failed: {literal_meaning_en}"
+
+    detected = [(idiom_dict.copy(), phrase) for idiom_dict, phrase in plan["detected"]]
+    for i, (idiom_dict, _) in enumerate(detected):
+        if ("explanation", i) in jobs:
+            idiom_dict["explanation_english"] = translated_or(("explanation", i), "---")
+
+    # Exact Matches
+    if plan["exact"]:
+        full_sentence_en = translated["full"]
+        if isinstance(full_sentence_en, Exception):
+            full_sentence_en = f"Error: {full_sentence_en}"
+
+        detected_results = [{
+            "result": idiom_dict,
+            "idiom_english_translation": translated_or(("phrase", i), idiom_phrase),
+            "matched_phrase": idiom_phrase
+        } for i, (idiom_dict, idiom_phrase) in enumerate(detected)]
+
+        response = {
+            "status": "idiom_detected",
+            "match_type": "exact_multiple",
+            "literal_meaning_en": literal_meaning_en,
+            "results_list": detected_results,
+            "full_sentence_kannada": plan["full_sentence_kn"],
+            "full_sentence_english": full_sentence_en
+        }
+        history = dict(detection_fields(plan), translation=full_sentence_en)
+        return response, history
+
+    # Fuzzy Match
+    if plan["fuzzy_match"]:
+        _, best_match_phrase, highest_score = plan["fuzzy_match"]
+        idiom_dict = detected[0][0]
+        full_sentence_en = translated_or("full", "Translation Error")
+
+        response = {
+            "status": "idiom_detected",
+            "match_type": "fuzzy_single",
+            "confidence": highest_score,
+            "literal_meaning_en": literal_meaning_en,
+            "results_list": [{
+                "result": idiom_dict,
+                "idiom_english_translation": idiom_dict.get('idiom'), # Simplified for brevity
+                "matched_phrase": best_match_phrase
+            }],
+            "full_sentence_kannada": plan["full_sentence_kn"],
+            "full_sentence_english": full_sentence_en
+        }
+        history = dict(detection_fields(plan), translation=full_sentence_en)
+        return response, history
+
+    # No Idiom Found
+    response = {
+        "status": "no_idiom_detected",
+        "literal_meaning_en": literal_meaning_en,
+        "literal_meaning_kn": translated_or("literal_kn", sentence),
+        "normal_translation": literal_meaning_en
+    }
+    history = dict(detection_fields(plan), translation=literal_meaning_en)
+    return response, history
@@ -0,0 +1,93 @@
+# preprocess.py
+import os
+import re
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+
+PREPROCESS_CACHE_SIZE = int(os.getenv("PAD_PREPROCESS_CACHE_SIZE", 10000))
+# Share of letters that must be Kannada (or not) before the script heuristic trusts itself
+KANNADA_RATIO_SURE = 0.6
+
+# ZWJ/ZWNJ only steer how conjuncts are drawn; ZWSP/BOM/word joiner never carry meaning
+_INVISIBLE = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_WHITESPACE = re.compile(r"\s+")
+
+_VIRAMA = "\u0ccd"
+
+Preprocessed = namedtuple("Preprocessed", ["text", "lang", "boundaries"])
+
+
+def normalize_text(text):
+    """NFC, invisible joiners removed, whitespace collapsed. Idioms and sentences go through the same path."""
+    text = unicodedata.normalize("NFC", text or "")
+    return _WHITESPACE.sub(" ", _INVISIBLE.sub("", text)).strip()
+
+
+def _is_kannada(ch):
+    return "\u0c80" <= ch <= "\u0cff"
+
+
+def _is_consonant(ch):
+    return "\u0c95" <= ch <= "\u0cb9" and unicodedata.category(ch) == "Lo"
+
+
+def graphemes(text):
+    """
+    Splits text into user-perceived characters: a base plus its combining marks, with
+    Kannada conjuncts (consonant + virama + consonant ...) kept together as one cluster.
+    """
+    clusters = []
+    for ch in text:
+        if clusters and (unicodedata.category(ch) in ("Mn", "Mc", "Me")
+                         or (clusters[-1][-1] == _VIRAMA and _is_consonant(ch))):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+
+def grapheme_boundaries(text):
+    """Offsets where a grapheme starts, plus len(text). Matches must start and end on one of these."""
+    bounds = {0}
+    pos = 0
+    for cluster in graphemes(text):
+        pos += len(cluster)
+        bounds.add(pos)
+    return frozenset(bounds)
+
+
+def _script_guess(text):
+    """'kn' or None, from the share of letters written in Kannada script."""
+    kannada = letters = 0
+    for ch in text:
+        if ch.isalpha() or unicodedata.category(ch) in ("Mn", "Mc"):
+            letters += 1
+            kannada += _is_kannada(ch)
+    if not letters:
+        # Digits/punctuation only; langdetect used to raise here, which meant "kn"
+        return "kn"
+    if kannada / letters >= KANNADA_RATIO_SURE:
+        return "kn"
+    return None
+
+
+def detect_language(text):
+    """Script heuristic first; langdetect only for mixed or non-Kannada text."""
+    guess = _script_guess(text)
+    if guess:
+        return guess
+    from langdetect import DetectorFactory, detect, LangDetectException  # loaded on first use, see features.py
+    # langdetect is randomized; a fixed seed makes the same sentence always get the same answer
+    DetectorFactory.seed = 0
+    try:
+        return detect(text)
+    except LangDetectException:
+        return "kn"
+
+
+@lru_cache(maxsize=PREPROCESS_CACHE_SIZE)
+def preprocess(sentence):
+    """Normalized text, language and grapheme boundaries for a sentence. Memoized."""
+    text = normalize_text(sentence)
+    return Preprocessed(text, detect_language(text), grapheme_boundaries(text))
@@ -0,0 +1,407 @@
+# rate_limit.py
+import asyncio
+import inspect
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from functools import wraps
+from flask import current_app, jsonify, request, session
+
+# Token buckets live here: "memory" (per process) or a redis:// URL shared by every worker
+RATE_LIMIT_BACKEND = os.getenv("PAD_RATE_LIMIT_BACKEND", "memory")
+# How many reverse proxies in front of the app append to X-Forwarded-For (0 = none: key on the
+# socket address). The client is the entry the outermost of them appended, i.e. the Nth from the
+# right; anything further left was written by the client itself and is ignored.
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("PAD_RATE_LIMIT_PROXY_HOPS", 0))
+# Longest a request waits in an endpoint's queue for a free slot before it is turned away
+RATE_LIMIT_QUEUE_WAIT = float(os.getenv("PAD_RATE_LIMIT_QUEUE_WAIT", 5))
+
+Policy = namedtuple("Policy", "per_minute burst concurrency queue")
+
+
+def _policy(name, per_minute, burst, concurrency, queue):
+    """Defaults for one endpoint, each overridable with PAD_LIMIT_<NAME>_<FIELD> (0 = no limit)."""
+    prefix = f"PAD_LIMIT_{name.upper()}_"
+    return Policy(
+        per_minute=float(os.getenv(prefix + "PER_MINUTE", per_minute)),
+        burst=int(os.getenv(prefix + "BURST", burst)),
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", concurrency)),
+        queue=int(os.getenv(prefix + "QUEUE", queue)),
+    )
+
+
+# Requests per minute (with bursts) per client, and per-process concurrency with a bounded wait queue.
+# /translate fires on every typing pause, so it gets the most room; each /login sends a mail.
+RATE_LIMIT_POLICIES = {
+    "translate": _policy("translate", 120, 30, 32, 64),
+    # Charged per sentence, so the burst has to cover one full batch (PAD_BATCH_MAX_SENTENCES)
+    "translate_batch": _policy("translate_batch", 1000, 2000, 4, 8),
+    "synthesize": _policy("synthesize", 30, 10, 16, 32),
+    "recognize_speech": _policy("recognize_speech", 10, 3, 4, 8),
+    "login": _policy("login", 5, 5, 8, 16),
+}
+
+
+class RateLimited(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ServerBusy(RateLimited):
+    """The endpoint's concurrency slots and wait queue are full, or the wait timed out."""
+
+    def __init__(self):
+        super().__init__("Server busy", 1)
+
+
+class MemoryBuckets:
+    """Token buckets in this process. Each gunicorn worker counts on its own, so limits are per worker."""
+    blocking = False
+
+    def __init__(self, prune_every=60):
+        self._buckets = {}  # key -> (tokens, updated, when it will be full again)
+        self._lock = threading.Lock()
+        self._prune_every = prune_every
+        self._pruned = time.monotonic()
+
+    def take(self, keys, rate, burst, cost=1.0):
+        """
+        Takes cost tokens from every key's bucket, or from none of them. Returns 0 if allowed,
+        else seconds until all of them would have enough.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = {}
+            for key in keys:
+                tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+                levels[key] = min(burst, tokens + (now - updated) * rate)
+            wait = max((cost - tokens) / rate if tokens < cost else 0.0 for tokens in levels.values()) if levels else 0.0
+            for key, tokens in levels.items():
+                if not wait:
+                    tokens -= cost
+                self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if now - self._pruned > self._prune_every:
+                self._pruned = now
+                # A bucket that has refilled completely is the same as no bucket
+                for k in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                    del self._buckets[k]
+        return wait
+
+
+class RedisBuckets:
+    """
+    Token buckets in Redis, shared by every worker and server. One atomic script call per check
+    covers all of a request's keys, so they are charged together or not at all.
+    """
+    blocking = True
+
+    _SCRIPT = """
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local levels = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local state = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        if tokens < cost then wait = math.max(wait, (cost - tokens) / rate) end
+        levels[i] = tokens
+    end
+    for i, key in ipairs(KEYS) do
+        local tokens = levels[i]
+        if wait == 0 then tokens = tokens - cost end
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+    end
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix="pad:rate:"):
+        import redis  # only needed with a shared backend
+        self.client = redis.Redis.from_url(url, socket_timeout=1)
+        self.prefix = prefix
+        self._take = self.client.register_script(self._SCRIPT)
+
+    def take(self, keys, rate, burst, cost=1.0):
+        try:
+            return float(self._take(keys=[self.prefix + key for key in keys], args=[rate, burst, cost]))
+        except Exception as e:
+            # Failing open: a Redis outage shouldn't take the translator down with it
+            logging.warning(f"Rate limit backend unavailable, allowing request: {e}")
+            return 0.0
+
+
+def make_rate_limit_backend(url=RATE_LIMIT_BACKEND):
+    if url == "memory":
+        return MemoryBuckets()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBuckets(url)
+    raise ValueError(f"Unknown rate limit backend {url!r}; use 'memory' or a redis:// URL")
+
+
+class ConcurrencyLimit:
+    """
+    At most `limit` requests inside an endpoint at once, with up to `queue` more waiting their
+    turn in arrival order. Thread and asyncio callers share the same slots and queue.
+    """
+
+    def __init__(self, limit, queue, max_wait):
+        self.limit = limit
+        self.queue = queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()  # threading.Event or (loop, future), first in line first
+        self._lock = threading.Lock()
+
+    def _try_enter(self, waiter):
+        """Returns True with a slot taken, False after queueing waiter, or raises RateLimited when full."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            if len(self._waiters) >= self.queue:
+                raise ServerBusy()
+            self._waiters.append(waiter)
+            return False
+
+    def _give_up(self, waiter):
+        """Leaves the queue after a timeout. Returns False if a slot was handed over meanwhile."""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+                return True
+            except ValueError:
+                return False
+
+    def acquire(self):
+        """Blocks until a slot is free (returns True if it had to wait), or raises RateLimited."""
+        event = threading.Event()
+        if self._try_enter(event):
+            return False
+        if not event.wait(self.max_wait) and self._give_up(event):
+            raise ServerBusy()
+        return True
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        if self._try_enter(waiter):
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._give_up(waiter):
+                raise ServerBusy()
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot we may have been handed
+            if not self._give_up(waiter):
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            # The slot goes straight to the next in line, so active stays the same
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    def waiting(self):
+        with self._lock:
+            return len(self._waiters)
+
+
+class RateLimiter:
+    """
+    Admission control for the expensive endpoints: a token bucket per client (session email and
+    client IP, both must have a token) and then a per-endpoint concurrency cap. Over the rate, or
+    with the queue full or the wait too long, a request is answered 429 with Retry-After.
+    """
+
+    def __init__(self, backend, policies=None, max_wait=RATE_LIMIT_QUEUE_WAIT, proxy_hops=0):
+        self.backend = backend
+        self.policies = policies or RATE_LIMIT_POLICIES
+        self.proxy_hops = proxy_hops
+        self.slots = {name: ConcurrencyLimit(p.concurrency, p.queue, max_wait)
+                      for name, p in self.policies.items() if p.concurrency}
+        self._lock = threading.Lock()
+        self.counters = {name: {"admitted": 0, "queued": 0, "rejected_rate": 0, "rejected_busy": 0}
+                         for name in self.policies}
+
+    def _count(self, name, event):
+        with self._lock:
+            self.counters[name][event] += 1
+
+    def client_ip(self):
+        """The address the outermost trusted proxy saw, as werkzeug's ProxyFix(x_for=proxy_hops) picks it."""
+        if self.proxy_hops:
+            forwarded = [a.strip() for a in request.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+            # Fewer entries than proxies: the request skipped them, so the header is the client's own
+            if len(forwarded) >= self.proxy_hops:
+                return forwarded[-self.proxy_hops]
+        return request.remote_addr
+
+    def client_keys(self, name):
+        """Bucket keys for this request: its IP, plus the email it is for when there is one."""
+        keys = [f"{name}:ip:{self.client_ip()}"]
+        # /login has no session email yet; limiting the address it mails stops OTP floods to one inbox
+        email = session.get("email") if name != "login" else request.form.get("email", "").strip().lower()
+        if email:
+            keys.append(f"{name}:email:{email}")
+        return keys
+
+    def check_rate(self, name, keys, cost=1):
+        """
+        Charges cost tokens to every key, or to none when any of them is short: a client retrying
+        against its own empty bucket must not drain the IP bucket it shares with others.
+        """
+        policy = self.policies[name]
+        if not policy.per_minute:
+            return
+        # More than a full bucket could never be admitted; the biggest request costs exactly a full one
+        wait = self.backend.take(keys, policy.per_minute / 60, policy.burst, min(cost, policy.burst))
+        if wait:
+            self._count(name, "rejected_rate")
+            raise RateLimited("Too many requests", wait)
+
+    def admit(self, name, cost=1):
+        """Checks the rate and takes a concurrency slot; call release(name) when done. Raises RateLimited."""
+        self.check_rate(name, self.client_keys(name), cost)
+        self._entered(name, self.slots[name].acquire() if name in self.slots else False)
+
+    async def admit_async(self, name, cost=1):
+        keys = self.client_keys(name)
+        if self.backend.blocking:
+            await asyncio.to_thread(self.check_rate, name, keys, cost)
+        else:
+            self.check_rate(name, keys, cost)
+        self._entered(name, await self.slots[name].acquire_async() if name in self.slots else False)
+
+    def _entered(self, name, waited):
+        if waited:
+            self._count(name, "queued")
+        self._count(name, "admitted")
+
+    def release(self, name):
+        if name in self.slots:
+            self.slots[name].release()
+
+    def busy(self, name):
+        """Counts a request turned away by the concurrency cap."""
+        self._count(name, "rejected_busy")
+
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self.counters.items()}
+        for name, limit in self.slots.items():
+            stats[name].update(active=limit.active, waiting=limit.waiting())
+        return stats
+
+
+def too_many_requests(error, render=None):
+    """The 429 response: JSON by default, or whatever render(message) returns (e.g. a page)."""
+    retry_after = max(1, math.ceil(error.retry_after))
+    message = f"{error}. Try again in {retry_after}s."
+    rv = render(message) if render else jsonify({"error": message})
+    response = current_app.make_response(rv)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def rate_limited(name, methods=None, render=None, cost=None):
+    """
+    Puts a view behind the limiter under policy `name`. The slot is held until a streamed response
+    finishes. Only `methods` are limited when given. cost() sizes a request in tokens (default 1).
+    Works on async views too (the ASGI mode).
+    """
+    def limiter():
+        if methods and request.method not in methods:
+            return None
+        return current_app.extensions.get("rate_limiter")
+
+    def rejected(limits, error):
+        if isinstance(error, ServerBusy):
+            limits.busy(name)
+        return too_many_requests(error, render)
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                limits = limiter()
+                if limits is None:
+                    return await f(*args, **kwargs)
+                try:
+                    await limits.admit_async(name, cost() if cost else 1)
+                except RateLimited as e:
+                    return rejected(limits, e)
+                try:
+                    response = current_app.make_response(await f(*args, **kwargs))
+                except BaseException:
+                    limits.release(name)
+                    raise
+                stream = getattr(response, "async_body", None)
+                if stream is None:
+                    limits.release(name)
+                else:
+                    response.async_body = _release_after(stream, lambda: limits.release(name))
+                return response
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limits = limiter()
+            if limits is None:
+                return f(*args, **kwargs)
+            try:
+                limits.admit(name, cost() if cost else 1)
+            except RateLimited as e:
+                return rejected(limits, e)
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+            except BaseException:
+                limits.release(name)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: limits.release(name))
+            else:
+                limits.release(name)
+            return response
+        return decorated_function
+    return decorator
+
+
+async def _release_after(stream, release):
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+        release()
+
+
+def init_rate_limiter(app):
+    """Sets up the limiter unless RATE_LIMIT is off."""
+    if not app.config.get("RATE_LIMIT", True):
+        return None
+    limiter = RateLimiter(
+        make_rate_limit_backend(app.config.get("RATE_LIMIT_BACKEND", RATE_LIMIT_BACKEND)),
+        max_wait=app.config.get("RATE_LIMIT_QUEUE_WAIT", RATE_LIMIT_QUEUE_WAIT),
+        proxy_hops=app.config.get("RATE_LIMIT_PROXY_HOPS", RATE_LIMIT_PROXY_HOPS),
+    )
+    app.extensions["rate_limiter"] = limiter
+    return limiter
@@ -0,0 +1,199 @@
+# reprocess.py
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from extensions import db
+from models import History
+from pipeline import plan_translation, detection_fields
+from history_rollup import record_rollup
+from snapshot import IdiomSnapshot
+
+# History rows per read, per task handed to a worker, and per UPDATE/commit
+REPROCESS_CHUNK_SIZE = int(os.getenv("PAD_REPROCESS_CHUNK_SIZE", 2000))
+REPROCESS_WORKERS = int(os.getenv("PAD_REPROCESS_WORKERS", os.cpu_count() or 1))
+
+_DETECTED = ("status", "match_type", "idiom", "confidence")
+
+# Set in each worker process by _init_worker
+_MATCHER = None
+
+
+def _init_worker(snapshot_path):
+    # The automaton and fuzzy postings run off the mmapped snapshot, so every worker shares one
+    # page-cache copy of them; each still parses its own idiom records and fuzzy keys
+    global _MATCHER
+    _MATCHER = IdiomSnapshot(snapshot_path).matcher()
+
+
+def _ready(delay):
+    # Holding each worker a moment makes the pool start all of them before timing begins
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _detect_chunk(chunk):
+    return [(row_id, detection_fields(plan_translation(sentence or "", _MATCHER))) for row_id, sentence in chunk]
+
+
+def detection_pool(snapshot_path, workers):
+    """A process pool whose workers each map the snapshot at snapshot_path. Spawned, not forked:
+    the app's writer and mail threads don't survive a fork, and spawn behaves the same on every OS."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(snapshot_path,))
+
+
+def start_workers(pool, workers):
+    """Blocks until all workers are up and have their matcher loaded."""
+    list(pool.map(_ready, [0.2] * workers))
+
+
+def history_chunks(chunk_size, since=None, limit=None):
+    """Yields lists of History rows (as dicts) in id order, reading one keyset page at a time."""
+    last_id = 0
+    left = limit
+    while left is None or left > 0:
+        size = chunk_size if left is None else min(chunk_size, left)
+        query = (
+            db.select(History.id, History.original_sentence, History.timestamp,
+                      History.status, History.match_type, History.idiom, History.confidence)
+            .where(History.id > last_id).order_by(History.id).limit(size)
+        )
+        if since is not None:
+            query = query.where(History.timestamp >= datetime.combine(since, datetime.min.time()))
+        rows = [dict(row._mapping) for row in db.session.execute(query)]
+        # Don't hold the read transaction open while the workers are busy
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if left is not None:
+            left -= len(rows)
+
+
+class HistoryReprocess:
+    """
+    Re-runs idiom detection over stored History sentences after the dictionary changed, on a pool
+    of worker processes (detection is pure Python, so threads would share one core). Rows whose
+    status, match type, idiom or confidence come out different are updated in bulk, one commit per
+    chunk, with the rollup adjusted in the same transaction. Stored translations are left alone:
+    redoing them would mean one googletrans call per row.
+    """
+
+    def __init__(self, snapshot_path, workers=REPROCESS_WORKERS, chunk_size=REPROCESS_CHUNK_SIZE,
+                 dry_run=False, progress=None):
+        self.snapshot_path = snapshot_path
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.progress = progress
+        self.transitions = {}  # (old match type, new match type) -> rows
+        self.stats = {"scanned": 0, "changed": 0, "elapsed": 0.0, "rows_per_s": 0.0, "startup_s": 0.0}
+
+    def run(self, since=None, limit=None):
+        """Reprocesses matching rows (needs an app context). Returns the stats dict."""
+        started = time.perf_counter()
+        with detection_pool(self.snapshot_path, self.workers) as pool:
+            start_workers(pool, self.workers)
+            self.stats["startup_s"] = round(time.perf_counter() - started, 3)
+            timed_from = time.perf_counter()
+            # A couple of chunks queued per worker keeps them busy while this process writes
+            pending = deque()
+            for rows in history_chunks(self.chunk_size, since, limit):
+                pending.append((rows, pool.submit(_detect_chunk, [(r["id"], r["original_sentence"]) for r in rows])))
+                if len(pending) >= 2 * self.workers:
+                    self._apply(*pending.popleft())
+                    self._report(timed_from)
+            while pending:
+                self._apply(*pending.popleft())
+                self._report(timed_from)
+        self._report(timed_from)
+        return dict(self.stats)
+
+    def _report(self, timed_from):
+        elapsed = time.perf_counter() - timed_from
+        self.stats["elapsed"] = round(elapsed, 3)
+        self.stats["rows_per_s"] = round(self.stats["scanned"] / elapsed, 1) if elapsed else 0.0
+        if self.progress:
+            self.progress(dict(self.stats))
+
+    def _apply(self, rows, future):
+        detected = dict(future.result())
+        updates, old_rows, new_rows = [], [], []
+        for row in rows:
+            fields = detected[row["id"]]
+            if all(row[name] == fields[name] for name in _DETECTED):
+                continue
+            key = (row["match_type"] or "no_match", fields["match_type"] or "no_match")
+            self.transitions[key] = self.transitions.get(key, 0) + 1
+            updates.append(dict(fields, id=row["id"]))
+            old_rows.append(row)
+            new_rows.append(dict(fields, timestamp=row["timestamp"]))
+        self.stats["scanned"] += len(rows)
+        self.stats["changed"] += len(updates)
+        if not updates or self.dry_run:
+            return
+        try:
+            # executemany UPDATE ... WHERE id = ? (bulk update by primary key)
+            db.session.execute(db.update(History), updates)
+            record_rollup(new_rows, replaced=old_rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def measure_scaling(snapshot_path, sentences, worker_counts, chunk_size=REPROCESS_CHUNK_SIZE):
+    """
+    Detection throughput over the same sentences for each pool size (nothing is written).
+    Returns one dict per size with rows/s, speedup over the first size and efficiency per worker.
+    """
+    chunks = [list(enumerate(sentences[i:i + chunk_size])) for i in range(0, len(sentences), chunk_size)]
+    results = []
+    for workers in worker_counts:
+        with detection_pool(snapshot_path, workers) as pool:
+            t0 = time.perf_counter()
+            start_workers(pool, workers)
+            startup = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for _ in pool.map(_detect_chunk, chunks):
+                pass
+            elapsed = time.perf_counter() - t0
+        rate = len(sentences) / elapsed if elapsed else 0.0
+        base = results[0] if results else None
+        speedup = rate / base["rows_per_s"] if base and base["rows_per_s"] else 1.0
+        results.append({
+            "workers": workers, "seconds": round(elapsed, 3), "startup_s": round(startup, 3),
+            "rows_per_s": round(rate, 1), "speedup": round(speedup, 2),
+            # Relative to perfect scaling from the first size
+            "efficiency": round(speedup * (base["workers"] if base else workers) / workers, 2),
+        })
+    return results
+
+
+def default_worker_counts(workers):
+    """1, 2, 4, ... up to workers (always ending with workers itself)."""
+    counts = []
+    n = 1
+    while n < workers:
+        counts.append(n)
+        n *= 2
+    return counts + [workers]
+
+
+def snapshot_for_run(version):
+    """
+    Path of a snapshot matching the DB at `version`: the configured one when it is current,
+    otherwise a fresh one in a temp file. Returns (path, is_temporary).
+    """
+    from utils import IDIOM_SNAPSHOT_PATH, build_idiom_snapshot, load_idiom_snapshot
+    if load_idiom_snapshot(version) is not None:
+        return IDIOM_SNAPSHOT_PATH, False
+    fd, path = tempfile.mkstemp(prefix="padapunja-reprocess-", suffix=".snapshot")
+    os.close(fd)
+    build_idiom_snapshot(path)
+    return path, True
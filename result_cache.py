@@ -0,0 +1,202 @@
+# result_cache.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.getenv("PAD_RESULT_CACHE_SIZE", 2000))
+RESULT_CACHE_TTL = int(os.getenv("PAD_RESULT_CACHE_TTL", 24 * 60 * 60))
+# Optional SQLite file shared by every worker on the host; empty keeps the cache per process
+RESULT_CACHE_SHARED_PATH = os.getenv("PAD_RESULT_CACHE_SHARED_PATH", "")
+RESULT_CACHE_SHARED_SIZE = int(os.getenv("PAD_RESULT_CACHE_SHARED_SIZE", 50000))
+
+
+class SQLiteResultStore:
+    """
+    Shared backend for ResultCache. Anything with the same get/set/carry_forward/clear
+    methods (e.g. a Redis wrapper) can stand in for it.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_evict = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            # Several workers write to the same file
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " sentence TEXT NOT NULL, version INTEGER NOT NULL, payload TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, PRIMARY KEY (sentence, version))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_results_version ON results (version)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, sentence, version):
+        """Returns (payload, expires_at) or None."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT payload, expires_at FROM results WHERE sentence=? AND version=? AND expires_at>?",
+                (sentence, version, time.time())
+            ).fetchone()
+        return row
+
+    def set(self, sentence, version, payload, expires_at):
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (sentence, version, payload, expires_at))
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= max(1, self.max_entries // 100):
+                self._evict(db)
+            db.commit()
+
+    def _evict(self, db):
+        self._writes_since_evict = 0
+        db.execute("DELETE FROM results WHERE expires_at<=?", (time.time(),))
+        (count,) = db.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            # Stale versions go first, then whatever expires soonest
+            db.execute("DELETE FROM results WHERE rowid IN"
+                       " (SELECT rowid FROM results ORDER BY version, expires_at LIMIT ?)",
+                       (count - self.max_entries,))
+
+    def carry_forward(self, old_version, new_version, is_affected):
+        """Moves old_version rows to new_version, dropping those is_affected(sentence) says changed."""
+        with self._lock:
+            sentences = [s for (s,) in self._db().execute("SELECT sentence FROM results WHERE version=?",
+                                                          (old_version,))]
+        # Checked without the lock held; only rows checked here move, anything else at old_version is dropped
+        keep = [(new_version, s, old_version) for s in sentences if not is_affected(s)]
+        with self._lock:
+            db = self._db()
+            db.executemany("UPDATE OR IGNORE results SET version=? WHERE sentence=? AND version=?", keep)
+            db.execute("DELETE FROM results WHERE version<=?", (old_version,))
+            db.commit()
+        return len(keep), len(sentences) - len(keep)
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM results")
+            self._db().commit()
+
+
+class ResultCache:
+    """
+    Finished /translate results keyed by (normalized sentence, idiom cache version).
+    An in-process LRU sits in front of an optional shared store. Bumping the idiom
+    version makes every older entry unreachable; carry_forward() rescues the ones
+    a change provably didn't touch.
+    """
+
+    def __init__(self, memory_size, ttl, shared=None):
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.shared = shared
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0,
+                         "carried": 0, "invalidated": 0}
+
+    def _remember(self, key, payload, expires_at):
+        self._memory[key] = (payload, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, sentence, version):
+        """Returns (response, history) or None. Each hit gets fresh copies."""
+        key = (sentence, version)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return json.loads(entry[0])
+            self._memory.pop(key, None)
+
+        if self.shared is not None:
+            try:
+                row = self.shared.get(sentence, version)
+            except Exception as e:
+                logging.error(f"Result cache read failed: {e}")
+                row = None
+            if row:
+                with self._lock:
+                    self._remember(key, *row)
+                    self.counters["shared_hits"] += 1
+                return json.loads(row[0])
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def set(self, sentence, version, response, history):
+        payload = json.dumps([response, history], ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember((sentence, version), payload, expires_at)
+            self.counters["stores"] += 1
+        if self.shared is not None:
+            try:
+                self.shared.set(sentence, version, payload, expires_at)
+            except Exception as e:
+                logging.error(f"Result cache write failed: {e}")
+
+    def carry_forward(self, old_version, new_version, is_affected):
+        """
+        After an idiom change moved the version from old_version to new_version, keeps
+        the old entries that is_affected(sentence) clears and drops the rest.
+        """
+        with self._lock:
+            sentences = [sentence for sentence, version in self._memory if version == old_version]
+        # Probing can take a while for a big cache, so requests keep being served meanwhile
+        affected = {sentence for sentence in sentences if is_affected(sentence)}
+        carried = invalidated = 0
+        with self._lock:
+            for sentence in sentences:
+                entry = self._memory.pop((sentence, old_version), None)
+                if entry is None:
+                    continue
+                if sentence in affected:
+                    invalidated += 1
+                else:
+                    self._memory.setdefault((sentence, new_version), entry)
+                    carried += 1
+            self.counters["carried"] += carried
+            self.counters["invalidated"] += invalidated
+        if self.shared is not None:
+            try:
+                self.shared.carry_forward(old_version, new_version, is_affected)
+            except Exception as e:
+                logging.error(f"Result cache carry-forward failed: {e}")
+        return carried, invalidated
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+
+RESULT_CACHE = ResultCache(
+    RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    SQLiteResultStore(RESULT_CACHE_SHARED_PATH, RESULT_CACHE_SHARED_SIZE) if RESULT_CACHE_SHARED_PATH else None,
+)
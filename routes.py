@@ -1,34 +1,42 @@
-from flask import Blueprint, request, jsonify, session, redirect, url_for, render_template, send_file, current_app
+from flask import Blueprint, request, jsonify, session, redirect, url_for, render_template, send_file, current_app, Response, stream_with_context, g
 from extensions import db
 from models import Idiom, History, Suggestion, Feedback
-from utils import get_cached_idioms, refresh_idiom_cache
+from utils import get_idiom_matcher, get_idiom_matcher_and_version, get_cached_idioms, bump_idiom_version, upsert_cached_idiom, delete_cached_idiom, get_idiom_search_index
+from search_index import SEARCH_MODES, SEARCH_RANKINGS, SEARCH_MAX_RESULTS
+from history_queries import history_page, history_export_query
+from history_rollup import record_rollup, clear_rollup, history_stats, HISTORY_STATS_DAYS
+from history_export import iter_tsv, iter_json, gzip_stream
+from pipeline import plan_translation, finish_translation, split_sentences, affected_by_idiom
+from preprocess import normalize_text, preprocess
+from result_cache import RESULT_CACHE
+from metrics import METRICS, span, stats_samples
+from mailer import MailQueueFull, send_mail, otp_message
+from translation import TRANSLATION_CACHE, translate_text, translate_many, warm_idiom_translations
+from speech import SPEECH_MAX_UPLOAD_BYTES, AudioTooLarge, open_audio, transcribe
+from audio_cache import AUDIO_CACHE, AUDIO_MAX_AGE, AUDIO_PRERENDER, make_synthesizer, idiom_audio_jobs
+from idiom_import import IDIOM_IMPORT, IMPORT_MAX_UPLOAD_BYTES
+from rate_limit import rate_limited
 from datetime import datetime, timedelta
-from googletrans import Translator
-from fuzzywuzzy import fuzz
 from functools import wraps
-from gtts import gTTS
-import speech_recognition as sr
-from pydub import AudioSegment
-import smtplib
+import inspect
 import random
+import shutil
+import tempfile
 import io
 import os
-import csv
 import json
 import time
 import logging
-from langdetect import detect, LangDetectException
 
 # Create the Blueprint
 main_bp = Blueprint('main', __name__)
 
 # --- Configuration Constants (Loaded from Env) ---
-SMTP_SERVER = os.getenv("PAD_SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("PAD_SMTP_PORT", 587))
-SENDER_EMAIL = os.getenv("PAD_SENDER_EMAIL")
-SENDER_PASSWORD = os.getenv("PAD_SENDER_PASS")
 OTP_EXPIRY_SECONDS = 5 * 60
-FUZZY_MATCH_CONFIDENCE = 85
+BATCH_MAX_SENTENCES = int(os.getenv("PAD_BATCH_MAX_SENTENCES", 2000))
+# Request body cap for /translate/batch (JSON or upload); 2000 long Kannada sentences fit well inside it
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("PAD_BATCH_MAX_UPLOAD_BYTES", 2 * 1024 * 1024))
+BATCH_CHUNK_SIZE = int(os.getenv("PAD_BATCH_CHUNK_SIZE", 50))
 
 # --- Helper Decorator ---
 def admin_required(f):
@@ -39,29 +47,48 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def feature_required(name):
+    """404s when app.config['ENABLE_<NAME>'] is off, so its libraries are never imported. Works on async views too."""
+    def disabled():
+        if not current_app.config.get(f"ENABLE_{name.upper()}", True):
+            return jsonify({"error": f"{name} is disabled on this server"}), 404
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                return disabled() or await f(*args, **kwargs)
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return disabled() or f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 # =================== AUTH ROUTES ====================
 
+def login_error_page(message):
+    return render_template("login.html", error=message)
+
 @main_bp.route("/login", methods=["GET", "POST"])
+@rate_limited("login", methods=("POST",), render=login_error_page)
 def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip()
         if not email:
             return render_template("login.html", error="Enter a valid email")
 
-        otp = f"{random.randint(100000, 999999):06d}"
-        session["otp"] = otp
-        session["otp_time"] = time.time()
-        session["email"] = email
-
-        subject = "Padapunja OTP Login"
-        message = f"Subject: {subject}\n\nYour OTP for Padapunja is: {otp}\nThis OTP expires in 5 minutes."
-
+        otp = start_otp_login(email)
+        dispatcher = current_app.extensions.get("mail_dispatcher")
         try:
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=10)
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, email, message)
-            server.quit()
+            if dispatcher:
+                # Sent in the background; the verify page polls /login/status
+                session["otp_mail"] = dispatcher.submit(email, otp_message(otp))
+            else:
+                send_mail(email, otp_message(otp))
+        except MailQueueFull:
+            return render_template("login.html", error="Too many logins right now. Try again in a minute.")
         except Exception as e:
             logging.exception("Failed to send OTP via SMTP")
             return render_template("login.html", error=f"Failed to send OTP. Check server logs.")
@@ -70,6 +97,29 @@ def login():
 
     return render_template("login.html")
 
+@main_bp.route("/login/status", methods=["GET"])
+def login_status():
+    """Delivery state of this session's OTP mail: queued, sending, retrying, sent or failed."""
+    if not session.get("otp"):
+        return jsonify({"status": "none"})
+    job_id = session.get("otp_mail")
+    if not job_id:
+        return jsonify({"status": "sent"})  # sent inline (MAIL_MODE=sync)
+    dispatcher = current_app.extensions.get("mail_dispatcher")
+    job = dispatcher.status(job_id) if dispatcher else None
+    if job is None:
+        # Queued by another worker process; it's on its way or already there
+        return jsonify({"status": "unknown"})
+    return jsonify({"status": job["status"], "attempts": job["attempts"]})
+
+def start_otp_login(email):
+    """Stores a fresh OTP for email in the session and returns it"""
+    otp = f"{random.randint(100000, 999999):06d}"
+    session["otp"] = otp
+    session["otp_time"] = time.time()
+    session["email"] = email
+    return otp
+
 @main_bp.route("/verify", methods=["GET", "POST"])
 def verify_otp():
     if request.method == "POST":
@@ -97,6 +147,7 @@ def verify_otp():
                 session["admin_logged_in"] = False
 
             session.pop("otp", None)
+            session.pop("otp_mail", None)
             return redirect(url_for("main.home"))
         else:
             return render_template("verify.html", error="Invalid OTP.")
@@ -117,6 +168,7 @@ def home():
     return render_template("index.html")
 
 @main_bp.route("/translate", methods=["POST"])
+@rate_limited("translate")
 def translate():
     data = request.get_json()
     if not data or "sentence" not in data:
@@ -126,180 +178,192 @@ def translate():
     if not sentence:
         return jsonify({"error": "Empty sentence"}), 400
 
-    translator = Translator()
-
-    # 1. Literal Translation
+    # A result only depends on the normalized sentence and which idioms are loaded
+    matcher, version = get_idiom_matcher_and_version()
+    normalized = preprocess(sentence).text
+    with span("result_cache"):
+        cached = RESULT_CACHE.get(normalized, version) if version is not None else None
+    if cached:
+        response, history = cached
+    else:
+        # Detection runs first; every external translation then goes out in one fan-out
+        plan = plan_translation(sentence, matcher)
+        with span("translate_external"):
+            translated = translate_many(plan["jobs"])
+        with span("build_response"):
+            response, history = finish_translation(plan, translated)
+        # Failed or timed-out translations get retried next time instead of being cached
+        if version is not None and not any(isinstance(v, Exception) for v in translated.values()):
+            RESULT_CACHE.set(normalized, version, response, history)
+
+    # Hits are still recorded
+    save_history_entry(sentence, **history)
+    return jsonify(response)
+
+@main_bp.route("/idioms/search", methods=["GET"])
+def search_idioms():
+    """Autocomplete: ?q=&mode=auto|prefix|substring&rank=popularity|length&limit="""
+    query = request.args.get("q", "")
+    mode = request.args.get("mode", "auto")
+    ranking = request.args.get("rank", "popularity")
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    if ranking not in SEARCH_RANKINGS:
+        return jsonify({"error": f"rank must be one of {', '.join(SEARCH_RANKINGS)}"}), 400
     try:
-        lang = detect(sentence)
-    except LangDetectException:
-        lang = "kn"
-
-    try:
-        if lang == "kn":
-            literal_meaning_en = translator.translate(sentence, src="kn", dest="en").text
-        else:
-            literal_meaning_en = sentence
-    except Exception as e:
-        literal_meaning_en = f"Translation failed: {e}"
-
-    # 2. PERFORMANCE FIX: Use Cache
-    all_idioms_sorted = get_cached_idioms()
-
-    detected_results = []
-    working_sentence_kn = sentence
-    status = "no_idiom_detected"
-    match_type = "none"
-
-    # 3. Exact Match Pass
-    for idiom_obj in all_idioms_sorted:
-        idiom_phrase = idiom_obj['idiom'].strip()
-        if not idiom_phrase: continue
-
-        if idiom_phrase in working_sentence_kn:
-            status = "idiom_detected"
-            match_type = "exact_multiple"
-            
-            # Use .copy() to avoid modifying the global cache
-            idiom_dict = idiom_obj.copy()
-            kannada_expl = idiom_dict.get("explanation_kannada") or ""
-
-            # Auto-translate missing fields
-            if not idiom_dict.get("explanation_english") and kannada_expl:
-                try:
-                    idiom_dict["explanation_english"] = translator.translate(kannada_expl, src="kn", dest="en").text
-                except:
-                    idiom_dict["explanation_english"] = "---"
-            
-            try:
-                idiom_phrase_en = translator.translate(idiom_phrase, src="kn", dest="en").text
-            except:
-                idiom_phrase_en = idiom_phrase
-
-            detected_results.append({
-                "result": idiom_dict,
-                "idiom_english_translation": idiom_phrase_en,
-                "matched_phrase": idiom_phrase
-            })
-            
-            working_sentence_kn = working_sentence_kn.replace(idiom_phrase, kannada_expl)
-
-    # 4. Return Exact Matches
-    if status == "idiom_detected":
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if not 1 <= limit <= SEARCH_MAX_RESULTS:
+        return jsonify({"error": f"limit must be between 1 and {SEARCH_MAX_RESULTS}"}), 400
+
+    index = get_idiom_search_index()
+    with span("idiom_search"):
+        results = index.search(query, k=limit, mode=mode, ranking=ranking)
+    return jsonify({"query": query, "results": results})
+
+def batch_sentences():
+    """
+    The sentences of a /translate/batch request, or an error response (parsed once per request,
+    since the rate limiter sizes the request by them before the view runs).
+    """
+    if "batch" not in g:
+        g.batch = _parse_batch()
+    return g.batch
+
+def _parse_batch():
+    # Oversized bodies are rejected (413) while they are read, before anything is split
+    request.max_content_length = BATCH_MAX_UPLOAD_BYTES
+    if "file" in request.files:
         try:
-            full_sentence_en = translator.translate(working_sentence_kn, src="kn", dest="en").text
-        except Exception as e:
-            full_sentence_en = f"Error: {e}"
-
-        save_history_entry(sentence, "idiom_detected", "exact_multiple", 
-                           ", ".join([r['matched_phrase'] for r in detected_results]), full_sentence_en)
-
-        return jsonify({
-            "status": "idiom_detected",
-            "match_type": "exact_multiple",
-            "literal_meaning_en": literal_meaning_en,
-            "results_list": detected_results,
-            "full_sentence_kannada": working_sentence_kn,
-            "full_sentence_english": full_sentence_en
-        })
-
-    # 5. Fuzzy Match Pass (Using Cache)
-    best_match_idiom = None
-    highest_score = 0
-    best_match_phrase = ""
-    sentence_tokens = sentence.split()
-
-    for idiom_obj in all_idioms_sorted:
-        idiom_phrase = idiom_obj['idiom'].strip()
-        idiom_tokens = idiom_phrase.split()
-        if not idiom_tokens or len(idiom_tokens) > len(sentence_tokens): continue
-
-        for i in range(len(sentence_tokens) - len(idiom_tokens) + 1):
-            window_phrase = " ".join(sentence_tokens[i : i + len(idiom_tokens)])
-            score = fuzz.token_sort_ratio(idiom_phrase, window_phrase)
-            if score > highest_score:
-                highest_score = score
-                best_match_idiom = idiom_obj
-                best_match_phrase = window_phrase
-
-    if highest_score >= FUZZY_MATCH_CONFIDENCE and best_match_idiom:
-        idiom_dict = best_match_idiom.copy()
-        kannada_expl = idiom_dict.get("explanation_kannada") or ""
-        
-        # Translate missing parts
-        if not idiom_dict.get("explanation_english") and kannada_expl:
-             try: idiom_dict["explanation_english"] = translator.translate(kannada_expl, src="kn", dest="en").text
-             except: idiom_dict["explanation_english"] = "---"
-        
-        full_sentence_kn = sentence.replace(best_match_phrase, kannada_expl)
-        try: full_sentence_en = translator.translate(full_sentence_kn, src="kn", dest="en").text
-        except: full_sentence_en = "Translation Error"
-
-        save_history_entry(sentence, "idiom_detected", "fuzzy_single", idiom_dict['idiom'], full_sentence_en, highest_score)
-
-        return jsonify({
-            "status": "idiom_detected",
-            "match_type": "fuzzy_single",
-            "confidence": highest_score,
-            "literal_meaning_en": literal_meaning_en,
-            "results_list": [{
-                "result": idiom_dict,
-                "idiom_english_translation": idiom_dict.get('idiom'), # Simplified for brevity
-                "matched_phrase": best_match_phrase
-            }],
-            "full_sentence_kannada": full_sentence_kn,
-            "full_sentence_english": full_sentence_en
-        })
-
-    # 6. No Idiom Found
-    save_history_entry(sentence, "no_idiom_detected", "", "", literal_meaning_en)
-    
-    literal_meaning_kn = sentence
-    if lang == "en":
-        try: literal_meaning_kn = translator.translate(sentence, src="en", dest="kn").text
-        except: pass
-
-    return jsonify({
-        "status": "no_idiom_detected",
-        "literal_meaning_en": literal_meaning_en,
-        "literal_meaning_kn": literal_meaning_kn,
-        "normal_translation": literal_meaning_en
-    })
+            text = request.files["file"].read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return jsonify({"error": "File must be UTF-8 text"}), 400
+        return split_sentences(text)
+    data = request.get_json(silent=True) or {}
+    if isinstance(data.get("sentences"), list):
+        return [s.strip() for s in data["sentences"] if isinstance(s, str) and s.strip()]
+    if isinstance(data.get("text"), str):
+        return split_sentences(data["text"])
+    return jsonify({"error": "Invalid request"}), 400
+
+def batch_cost():
+    """Tokens a batch costs: one per sentence translated (one for a batch that is turned away as invalid)."""
+    sentences = batch_sentences()
+    if not isinstance(sentences, list) or len(sentences) > BATCH_MAX_SENTENCES:
+        return 1
+    return max(1, len(sentences))
+
+@main_bp.route("/translate/batch", methods=["POST"])
+@rate_limited("translate_batch", cost=batch_cost)
+def translate_batch():
+    """Translates a list of sentences or an uploaded text file, streaming NDJSON in input order."""
+    sentences = batch_sentences()
+    if not isinstance(sentences, list):
+        return sentences
+
+    if not sentences:
+        return jsonify({"error": "Empty batch"}), 400
+    if len(sentences) > BATCH_MAX_SENTENCES:
+        return jsonify({"error": f"Batch limited to {BATCH_MAX_SENTENCES} sentences"}), 400
+
+    email = session.get('email', 'anonymous')
+    matcher = get_idiom_matcher()
+
+    def generate():
+        history_rows = []
+        try:
+            for chunk_start in range(0, len(sentences), BATCH_CHUNK_SIZE):
+                chunk = sentences[chunk_start:chunk_start + BATCH_CHUNK_SIZE]
+                plans = [plan_translation(s, matcher) for s in chunk]
+
+                # One fan-out per chunk; translate_many sends repeated strings once
+                jobs = {(i, key): triple for i, plan in enumerate(plans) for key, triple in plan["jobs"].items()}
+                translated = translate_many(jobs)
+
+                per_plan = [{} for _ in plans]
+                for (i, key), value in translated.items():
+                    per_plan[i][key] = value
+
+                for i, plan in enumerate(plans):
+                    response, history = finish_translation(plan, per_plan[i])
+                    history_rows.append(dict(history, confidence=history.get("confidence"), email=email,
+                                             original_sentence=plan["sentence"], timestamp=datetime.now()))
+                    response["index"] = chunk_start + i
+                    response["sentence"] = plan["sentence"]
+                    yield json.dumps(response, ensure_ascii=False) + "\n"
+        finally:
+            # Whatever was translated gets recorded, even if the client went away mid-stream
+            save_history_entries(history_rows)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 def save_history_entry(original, status, match_type, idiom, translation, confidence=None):
     """Helper to save history to DB"""
-    try:
-        new_entry = History(
-            email=session.get('email', 'anonymous'),
-            original_sentence=original,
-            status=status,
-            match_type=match_type,
-            idiom=idiom,
-            confidence=confidence,
-            translation=translation,
-            timestamp=datetime.now()
-        )
-        db.session.add(new_entry)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        logging.error(f"DB Error: {e}")
+    save_history_entries([history_row(original, status, match_type, idiom, translation, confidence)])
+
+def history_row(original, status, match_type, idiom, translation, confidence=None):
+    return {
+        "email": session.get('email', 'anonymous'),
+        "original_sentence": original,
+        "status": status,
+        "match_type": match_type,
+        "idiom": idiom,
+        "confidence": confidence,
+        "translation": translation,
+        "timestamp": datetime.now()
+    }
+
+def save_history_entries(rows):
+    """Hands rows to the write-behind writer, or bulk inserts them right away in sync mode"""
+    if not rows:
+        return
+    with span("history_save"):
+        writer = current_app.extensions.get("history_writer")
+        if writer:
+            for row in rows:
+                writer.submit(row)
+            return
+        try:
+            db.session.execute(db.insert(History), rows)
+            record_rollup(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"DB Error: {e}")
 
 # =================== UTILITY ROUTES ====================
 
 @main_bp.route("/synthesize", methods=["GET"])
+@feature_required("tts")
+@rate_limited("synthesize")
 def synthesize_speech():
-    text = request.args.get("text")
+    text = (request.args.get("text") or "").strip()
     lang = request.args.get("lang", "kn")
     if not text: return jsonify({"error": "No text"}), 400
+
+    # The key only depends on the request, so revalidations never touch the disk or gTTS
+    synthesizer = make_synthesizer()
+    etag = AUDIO_CACHE.key(text, lang, synthesizer.name)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        return audio_cache_headers(response, etag)
     try:
-        tts = gTTS(text=text, lang=lang)
-        mp3_fp = io.BytesIO()
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
-        return send_file(mp3_fp, mimetype="audio/mpeg", download_name="speech.mp3")
+        _, path, _ = AUDIO_CACHE.get_or_create(text, lang, synthesizer)
+        response = send_file(path, mimetype="audio/mpeg", download_name="speech.mp3", conditional=True,
+                             etag=False, max_age=AUDIO_MAX_AGE)
+        return audio_cache_headers(response, etag)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def audio_cache_headers(response, etag):
+    response.set_etag(etag)
+    # The cache file's mtime tracks last use, not content changes; the ETag is the validator
+    response.headers.pop("Last-Modified", None)
+    response.cache_control.public = True
+    response.cache_control.max_age = AUDIO_MAX_AGE
+    return response
+
 @main_bp.route("/feedback", methods=["POST"])
 def feedback():
     if not session.get("user_logged_in"):
@@ -341,34 +405,106 @@ def suggest_idiom():
         return jsonify({"error": str(e)}), 500
 
 @main_bp.route("/recognize_speech", methods=["POST"])
+@feature_required("speech")
+@rate_limited("recognize_speech")
 def recognize_speech():
+    """
+    Transcribes an uploaded recording segment by segment.
+    ?stream=1 streams NDJSON segments as they are recognized, then a final {"done": true, "text": ...} line.
+    """
+    # Oversized uploads are rejected (413) while the form is parsed, before they are spooled
+    request.max_content_length = SPEECH_MAX_UPLOAD_BYTES
     if "audio" not in request.files: return jsonify({"error": "No audio"}), 400
     file = request.files["audio"]
     if file.filename == "": return jsonify({"error": "No file"}), 400
 
-    r = sr.Recognizer()
     try:
-        audio = AudioSegment.from_file(file)
-        wav_io = io.BytesIO()
-        audio.export(wav_io, format="wav")
-        wav_io.seek(0)
-        with sr.AudioFile(wav_io) as source:
-            data = r.record(source)
-        text = r.recognize_google(data, language="kn-IN")
-        return jsonify({"text": text})
+        segments = transcribe(open_audio(file.stream))
+    except AudioTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("stream") in ("1", "true"):
+        # Take the upload off the request, or request.close() shuts it before the stream is read
+        upload = file.stream
+        file.stream = io.BytesIO()
+
+        def generate():
+            texts = []
+            try:
+                for segment in segments:
+                    if segment.get("text"):
+                        texts.append(segment["text"])
+                    yield json.dumps(segment, ensure_ascii=False) + "\n"
+                yield json.dumps({"done": True, "text": " ".join(texts)}, ensure_ascii=False) + "\n"
+            except ValueError as e:
+                yield json.dumps({"done": True, "error": str(e), "text": " ".join(texts)}, ensure_ascii=False) + "\n"
+            finally:
+                segments.close()
+                upload.close()
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    try:
+        results = list(segments)
+    except AudioTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    text = " ".join(s["text"] for s in results if s.get("text"))
+    errors = [s["error"] for s in results if "error" in s]
+    if not text and errors:
+        return jsonify({"error": errors[0]}), 500
+    return jsonify({"text": text, "segments": results})
+
+# =================== METRICS ====================
+
+@main_bp.route("/metrics", methods=["GET"])
+@feature_required("metrics")
+def metrics():
+    # Prometheus text format; stage timings, request latency, external calls and cache stats for this worker
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def cache_metric_samples():
+    samples = stats_samples("pad_cache", RESULT_CACHE.stats(), "Cache statistics", cache="result")
+    samples += stats_samples("pad_cache", TRANSLATION_CACHE.stats(), "Cache statistics", cache="translation")
+    samples += stats_samples("pad_cache", AUDIO_CACHE.stats(), "Cache statistics", cache="audio")
+    info = preprocess.cache_info()
+    lookups = info.hits + info.misses
+    samples += stats_samples("pad_cache", {
+        "hits": info.hits, "misses": info.misses, "memory_entries": info.currsize,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }, "Cache statistics", cache="preprocess")
+    writer = current_app.extensions.get("history_writer")
+    if writer:
+        samples += stats_samples("pad_history_writer", writer.stats(), "Write-behind history writer")
+    dispatcher = current_app.extensions.get("mail_dispatcher")
+    if dispatcher:
+        samples += stats_samples("pad_mail_dispatcher", dispatcher.stats(), "Background OTP mail sender")
+    limiter = current_app.extensions.get("rate_limiter")
+    if limiter:
+        for endpoint, stats in limiter.stats().items():
+            samples += stats_samples("pad_rate_limit", stats, "Admission control", endpoint=endpoint)
+    return samples
+
+METRICS.add_collector(cache_metric_samples)
 
 # =================== PUBLIC HISTORY ====================
 
 @main_bp.route('/history', methods=['GET'])
 def get_public_history():
-    items = History.query.order_by(History.timestamp.desc()).all()
-    return jsonify([i.to_dict() for i in items])
+    # ?limit=&cursor= plus optional email/status/match_type filters
+    try:
+        items, next_cursor = history_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [i.to_dict() for i in items], "next_cursor": next_cursor})
 
 @main_bp.route('/clear_history', methods=['POST'])
 def clear_public_history():
     db.session.query(History).delete()
+    clear_rollup()
     db.session.commit()
     return jsonify({"message": "Cleared"})
 
@@ -377,10 +513,34 @@ def clear_public_history():
 @main_bp.route('/admin')
 @admin_required
 def admin_dashboard():
-    history = History.query.order_by(History.timestamp.desc()).all()
+    # History is paged in by the template from /admin/history; the summary comes from the rollup
     suggestions = Suggestion.query.all()
     feedback_items = Feedback.query.order_by(Feedback.timestamp.desc()).all()
-    return render_template('admin.html', history=history, suggestions=suggestions, feedback=[f.to_dict() for f in feedback_items])
+    return render_template('admin.html', suggestions=suggestions, feedback=[f.to_dict() for f in feedback_items],
+                           stats=history_stats())
+
+@main_bp.route('/admin/stats', methods=['GET'])
+@admin_required
+def admin_stats():
+    # ?days= (default 30): volume per day, match-type split, average confidence, top idioms
+    try:
+        days = int(request.args.get('days', HISTORY_STATS_DAYS))
+    except ValueError:
+        return jsonify({"error": "Invalid days"}), 400
+    try:
+        stats = history_stats(days)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats)
+
+@main_bp.route('/admin/history', methods=['GET'])
+@admin_required
+def admin_history_page():
+    try:
+        items, next_cursor = history_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [i.to_dict() for i in items], "next_cursor": next_cursor})
 
 @main_bp.route('/admin/approve_idiom', methods=['POST'])
 @admin_required
@@ -396,23 +556,31 @@ def approve_idiom():
             
             # Translate Logic
             try: 
-                gen_en = Translator().translate(clean_kn, src='kn', dest='en').text
+                gen_en = translate_text(clean_kn, 'kn', 'en')
             except: 
                 gen_en = "Translation unavailable"
 
-            existing = Idiom.query.filter_by(idiom=clean_idiom).first()
-            if existing:
-                existing.explanation_kannada = clean_kn
-                existing.explanation_english = gen_en
+            idiom_row = Idiom.query.filter_by(idiom=clean_idiom).first()
+            if idiom_row:
+                idiom_row.explanation_kannada = clean_kn
+                idiom_row.explanation_english = gen_en
             else:
-                new_idiom = Idiom(idiom=clean_idiom, explanation_english=gen_en, explanation_kannada=clean_kn)
-                db.session.add(new_idiom)
+                idiom_row = Idiom(idiom=clean_idiom, explanation_english=gen_en, explanation_kannada=clean_kn)
+                db.session.add(idiom_row)
 
             db.session.delete(suggestion)
+            # Other workers poll this version and reload when it moves
+            version = bump_idiom_version()
             db.session.commit()
+
+            # Precompute translations so /translate hits the translation cache (phrases are looked up normalized)
+            warm_idiom_translations(normalize_text(clean_idiom), clean_kn)
             
-            # REFRESH CACHE
-            refresh_idiom_cache()
+            # UPDATE CACHE in place (falls back to a full reload if we missed other changes)
+            idiom_dict = idiom_row.to_dict()
+            if upsert_cached_idiom(idiom_dict, version):
+                # Cached results from the previous version stay valid unless this idiom could match them
+                RESULT_CACHE.carry_forward(version - 1, version, affected_by_idiom(idiom_dict))
 
     except Exception as e:
         db.session.rollback()
@@ -429,25 +597,79 @@ def reject_idiom():
         db.session.commit()
     return redirect(url_for('main.admin_dashboard'))
 
+@main_bp.route('/admin/delete_idiom', methods=['POST'])
+@admin_required
+def delete_idiom():
+    idiom_txt = (request.form.get('idiom') or '').strip()
+    if not idiom_txt: return redirect(url_for('main.admin_dashboard'))
+
+    try:
+        idiom_row = Idiom.query.filter_by(idiom=idiom_txt).first()
+        if idiom_row:
+            idiom_dict = idiom_row.to_dict()
+            db.session.delete(idiom_row)
+            version = bump_idiom_version()
+            db.session.commit()
+
+            # Tombstone it in the matcher (falls back to a full reload if we missed other changes)
+            if delete_cached_idiom(idiom_txt, version):
+                # Only sentences the idiom could have matched are planned differently without it
+                RESULT_CACHE.carry_forward(version - 1, version, affected_by_idiom(idiom_dict))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Delete idiom error: {e}")
+
+    return redirect(url_for('main.admin_dashboard'))
+
+@main_bp.route('/admin/prerender_audio', methods=['POST'])
+@admin_required
+@feature_required("tts")
+def prerender_audio():
+    # Renders every idiom and its explanations into the audio cache in the background
+    if not AUDIO_PRERENDER.start(idiom_audio_jobs(get_cached_idioms())):
+        logging.info("Audio pre-render already running")
+    return redirect(url_for('main.admin_dashboard'))
+
+@main_bp.route('/admin/prerender_audio', methods=['GET'])
+@admin_required
+def prerender_audio_status():
+    return jsonify({**AUDIO_PRERENDER.get_status(), "cache": AUDIO_CACHE.stats()})
+
+@main_bp.route('/admin/import_idioms', methods=['POST'])
+@admin_required
+def import_idioms():
+    # Streams a TSV/CSV of idioms into the table in the background; progress at GET /admin/import_idioms
+    request.max_content_length = IMPORT_MAX_UPLOAD_BYTES
+    file = request.files.get("file")
+    if not file or file.filename == "":
+        return redirect(url_for('main.admin_dashboard'))
+
+    # The import outlives this request, so it reads its own copy of the upload
+    fd, path = tempfile.mkstemp(prefix="idiom-import-")
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(file.stream, out)
+    if not IDIOM_IMPORT.start(current_app._get_current_object(), path, file.filename):
+        os.remove(path)
+        logging.info("Idiom import already running")
+    return redirect(url_for('main.admin_dashboard'))
+
+@main_bp.route('/admin/import_idioms', methods=['GET'])
+@admin_required
+def import_idioms_status():
+    return jsonify(IDIOM_IMPORT.get_status())
+
 @main_bp.route('/admin/export/tsv', methods=['GET'])
 @admin_required
 def export_tsv():
-    # EXPORT AS TSV (Tab Separated) as requested
-    items = History.query.all()
-    if not items: return "Empty history", 404
-    
-    data = [i.to_dict() for i in items]
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=sorted(list(data[0].keys())), delimiter='\t')
-    writer.writeheader()
-    writer.writerows(data)
-    
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/tab-separated-values',
-        as_attachment=True,
-        download_name='translation_history.tsv'
-    )
+    # EXPORT AS TSV (Tab Separated) as requested, streamed in chunks
+    # Optional: ?start=&end= date range, email/status/match_type filters, gzip=1
+    try:
+        query = history_export_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not query.limit(1).first(): return "Empty history", 404
+
+    return stream_export(iter_tsv(query), 'text/tab-separated-values', 'translation_history.tsv')
 # Add these to routes.py
 
 @main_bp.route('/admin/clear_history', methods=['POST'])
@@ -455,6 +677,7 @@ def export_tsv():
 def clear_admin_history():
     try:
         db.session.query(History).delete()
+        clear_rollup()
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -464,15 +687,21 @@ def clear_admin_history():
 @main_bp.route('/admin/export/json', methods=['GET'])
 @admin_required
 def download_admin_history_json():
-    history_items = History.query.all()
-    history_list = [item.to_dict() for item in history_items]
-    
-    json_bytes = io.BytesIO(
-        json.dumps(history_list, ensure_ascii=False, indent=2).encode('utf-8')
+    try:
+        query = history_export_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return stream_export(iter_json(query), 'application/json', 'translation_history.json')
+
+def stream_export(chunks, mimetype, filename):
+    """Streams an export as a download, gzipped on the fly when ?gzip=1"""
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = gzip_stream(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
-    return send_file(
-        json_bytes,
-        mimetype='application/json',
-        as_attachment=True,
-        download_name='translation_history.json'
-    )
\ No newline at end of file
@@ -14,6 +14,14 @@ CREATE TABLE idioms (
     explanation_kannada TEXT
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
+-- 1b. Idiom cache version (one row, bumped on every idiom change; workers poll it)
+CREATE TABLE idiom_version (
+    id INT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+INSERT INTO idiom_version (id, version) VALUES (1, 0);
+
 -- 2. Table for History (Matches app.py History model)
 -- Added the 'email' column
 CREATE TABLE history (
@@ -25,7 +33,31 @@ CREATE TABLE history (
     idiom VARCHAR(255),
     confidence INT,
     translation TEXT,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    -- Keyset pagination on (timestamp, id), optionally filtered by email/status/match_type
+    INDEX ix_history_timestamp_id (timestamp, id),
+    INDEX ix_history_email_timestamp_id (email, timestamp, id),
+    INDEX ix_history_status_timestamp_id (status, timestamp, id),
+    INDEX ix_history_match_type_timestamp_id (match_type, timestamp, id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Existing databases: add the history indexes in place
+-- ALTER TABLE history
+--     ADD INDEX ix_history_timestamp_id (timestamp, id),
+--     ADD INDEX ix_history_email_timestamp_id (email, timestamp, id),
+--     ADD INDEX ix_history_status_timestamp_id (status, timestamp, id),
+--     ADD INDEX ix_history_match_type_timestamp_id (match_type, timestamp, id);
+
+-- 2b. Daily History rollup for the admin stats (one row per day, idiom, match type).
+-- Existing databases: create it, then backfill with `flask rebuild-history-rollup`
+CREATE TABLE history_rollup (
+    day DATE NOT NULL,
+    idiom VARCHAR(255) NOT NULL,
+    match_type VARCHAR(50) NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    confidence_sum BIGINT NOT NULL DEFAULT 0,
+    confidence_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, idiom, match_type)
 ) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
 -- 3. Table for Suggestions (Matches app.py Suggestion model)
@@ -0,0 +1,153 @@
+# search_index.py
+import numpy as np
+from preprocess import normalize_text
+
+SEARCH_MODES = ("auto", "prefix", "substring")
+SEARCH_MAX_RESULTS = 50
+SEARCH_RANKINGS = ("popularity", "length")
+# Never part of a key, so no match can run from one idiom into the next
+_SEPARATOR = "\x00"
+# Above this many matching suffixes, dedupe with a bitmap instead of sorting them, and
+# remember the answer: only very short queries get there, and there are few of those
+_BIG_BLOCK = 4096
+_MEMO_SIZE = 4096
+
+
+def search_key(text):
+    return normalize_text(text).casefold()
+
+
+def suffix_array(codes):
+    """
+    Suffix array of an integer array, by prefix doubling: each round sorts suffixes by
+    their first 2h characters using the ranks of the first h, so it is one numpy argsort
+    per doubling (about log2 of the longest repeated substring).
+    """
+    n = len(codes)
+    # Ranks start at 1 so "past the end" (0) sorts before every character, as in str comparisons
+    rank = np.unique(codes, return_inverse=True)[1].astype(np.int64) + 1
+    h = 1
+    while True:
+        following = np.zeros(n, dtype=np.int64)
+        following[:n - h] = rank[h:]
+        key = rank * (n + 2) + following
+        sa = np.argsort(key, kind="stable")
+        ordered = key[sa]
+        rank = np.empty(n, dtype=np.int64)
+        rank[sa] = np.concatenate(([1], 1 + np.cumsum(ordered[1:] != ordered[:-1])))
+        if rank[sa[-1]] == n or h >= n:
+            return sa.astype(np.int32)
+        h *= 2
+
+
+class IdiomSearchIndex:
+    """
+    Prefix and substring lookup over the cached idioms.
+    Every idiom key is joined into one string and indexed with a suffix array, so a
+    substring query is two binary searches that give one contiguous block of suffixes;
+    a prefix query is the same block keeping only suffixes that start an idiom.
+    Idioms are numbered in rank order, so the top k of a block are its k smallest distinct numbers.
+    """
+
+    def __init__(self, idioms, popularity=None):
+        self.popularity = popularity = popularity or {}
+        self.source = idioms  # the get_cached_idioms() list this was built from
+        self.idioms = idioms
+        n = len(idioms)
+        keys = [search_key(obj["idiom"]) for obj in idioms]
+        self.uses = np.array([popularity.get(key, 0) for key in keys], dtype=np.int64)
+        lengths = np.array([len(key) for key in keys], dtype=np.int64)
+        index = np.arange(n)
+
+        # order[ranking][position] = idiom; rank_of[ranking][idiom] = position
+        self._order = {
+            "popularity": np.lexsort((index, lengths, -self.uses)),
+            "length": np.lexsort((index, -self.uses, lengths)),
+        }
+        self._rank_of = {}
+        for ranking, order in self._order.items():
+            rank_of = np.empty(n, dtype=np.int32)
+            rank_of[order] = np.arange(n, dtype=np.int32)
+            self._rank_of[ranking] = rank_of
+
+        self.text = _SEPARATOR.join(keys) + _SEPARATOR
+        starts = np.zeros(n, dtype=np.int64)
+        if n:
+            starts[1:] = np.cumsum(lengths[:-1] + 1)
+        codes = np.frombuffer(self.text.encode("utf-32-le"), dtype=np.uint32)
+        self._sa = suffix_array(codes) if n else np.zeros(0, dtype=np.int32)
+        owner = np.searchsorted(starts, self._sa, side="right") - 1
+        self._at_start = starts[owner] == self._sa
+        self._owner = owner.astype(np.int32)
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.idioms)
+
+    def _block(self, key):
+        """[lo, hi) of the suffixes that start with key."""
+        text, sa, m = self.text, self._sa, len(key)
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = int(sa[mid])
+            if text[p:p + m] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = int(sa[mid])
+            if text[p:p + m] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def _top(self, lo, hi, k, ranking, prefix_only):
+        owners = self._owner[lo:hi]
+        if prefix_only:
+            owners = owners[self._at_start[lo:hi]]
+        ranks = self._rank_of[ranking][owners]
+        if len(ranks) > _BIG_BLOCK:
+            seen = np.zeros(len(self.idioms), dtype=bool)
+            seen[ranks] = True
+            top = np.flatnonzero(seen)[:k]
+        else:
+            top = np.unique(ranks)[:k]
+        return self._order[ranking][top].tolist()
+
+    def search(self, query, k=10, mode="auto", ranking="popularity"):
+        """
+        Up to k idioms containing query (after normalization), best first.
+        mode: "prefix", "substring", or "auto" (prefix matches, then other substring matches).
+        ranking: "popularity" (most detected in History first) or "length" (shortest first).
+        """
+        key = search_key(query)
+        if not key or _SEPARATOR in key or not len(self.idioms):
+            return []
+        k = min(k, SEARCH_MAX_RESULTS)
+        lo, hi = self._block(key)
+        if hi - lo > _BIG_BLOCK:
+            found = self._memo.get((key, mode, ranking))
+            if found is None:
+                if len(self._memo) >= _MEMO_SIZE:
+                    self._memo.clear()
+                found = self._memo[(key, mode, ranking)] = self._find(lo, hi, SEARCH_MAX_RESULTS, mode, ranking)
+            found = found[:k]
+        else:
+            found = self._find(lo, hi, k, mode, ranking)
+        return [dict(self.idioms[i], uses=int(self.uses[i])) for i in found]
+
+    def _find(self, lo, hi, k, mode, ranking):
+        if lo == hi:
+            return []
+        if mode == "substring":
+            return self._top(lo, hi, k, ranking, prefix_only=False)
+        found = self._top(lo, hi, k, ranking, prefix_only=True)
+        if mode == "auto" and len(found) < k:
+            taken = set(found)
+            more = self._top(lo, hi, k + len(found), ranking, prefix_only=False)
+            found += [i for i in more if i not in taken][:k - len(found)]
+        return found
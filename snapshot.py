@@ -0,0 +1,112 @@
+# snapshot.py
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+import numpy as np
+from matcher import ArrayAhoCorasick, FuzzyIndex, IdiomMatcher, _Segment, match_priority
+
+# File layout: MAGIC | header offset, header length (2 x uint64) | aligned array sections | JSON header.
+# Bump FORMAT_VERSION whenever the layout or the matcher's array format changes.
+MAGIC = b"PADSNAP\0"
+FORMAT_VERSION = 3
+_PREFIX = struct.Struct("<8sQQ")
+_ALIGN = 8
+
+
+def write_snapshot(path, idioms, idiom_version):
+    """
+    Compiles idiom dicts into a snapshot at path: the records in match priority order
+    plus the prebuilt automaton and fuzzy index. Returns the number of idioms written.
+    The file is swapped in atomically, so workers that already mapped the old one are unaffected.
+    """
+    idioms = sorted(idioms, key=match_priority)
+    # Pids are positions in the sorted list, so the loader can rebuild the entries from the records alone
+    segment = _Segment(list(enumerate(idioms)))
+    grams_by_group, fuzzy_arrays = segment.fuzzy_index.to_arrays()
+
+    arrays = {f"ac_{name}": a for name, a in segment.automaton.to_arrays().items()}
+    arrays.update((f"fz_{name}", a) for name, a in fuzzy_arrays.items())
+    arrays["records"] = np.frombuffer(json.dumps({
+        "idioms": idioms,
+        "keys": segment.fuzzy_index.keys,
+        "grams": grams_by_group,
+    }, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+    tmp_path = f"{path}.tmp"
+    sections = {}
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * _PREFIX.size)
+        for name, array in arrays.items():
+            f.write(b"\0" * (-f.tell() % _ALIGN))
+            sections[name] = [array.dtype.str, f.tell(), len(array)]
+            f.write(np.ascontiguousarray(array).tobytes())
+        header = json.dumps({
+            "format": FORMAT_VERSION,
+            "idiom_version": idiom_version,
+            "count": len(idioms),
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+            "sections": sections,
+        }).encode("utf-8")
+        header_offset = f.tell()
+        f.write(header)
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, header_offset, len(header)))
+    os.replace(tmp_path, path)
+    return len(idioms)
+
+
+class IdiomSnapshot:
+    """
+    A read-only, memory-mapped snapshot. The page cache is shared by every worker
+    mapping the same file; the automaton and the fuzzy index postings run as views into it.
+    Raises ValueError for files that aren't a readable snapshot of this format.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, header_offset, header_len = _PREFIX.unpack_from(self._mm, 0)
+            if magic != MAGIC:
+                raise ValueError("not an idiom snapshot")
+            self.header = json.loads(self._mm[header_offset:header_offset + header_len])
+        except (struct.error, ValueError) as e:
+            raise ValueError(f"Unreadable idiom snapshot {path}: {e}")
+        if self.header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Idiom snapshot {path} has format {self.header.get('format')}, expected {FORMAT_VERSION}")
+        for name, (dtype, offset, count) in self.header["sections"].items():
+            if offset + count * np.dtype(dtype).itemsize > header_offset:
+                raise ValueError(f"Idiom snapshot {path} is truncated (section {name})")
+
+    @property
+    def idiom_version(self):
+        return self.header["idiom_version"]
+
+    @property
+    def count(self):
+        return self.header["count"]
+
+    def array(self, name):
+        dtype, offset, count = self.header["sections"][name]
+        return np.frombuffer(self._mm, dtype=dtype, count=count, offset=offset)
+
+    def matcher(self):
+        """
+        Builds an IdiomMatcher around the prebuilt base segment. The automaton, fuzzy postings,
+        pid and key-length arrays stay in the mapping; each process still parses its own copy of
+        the records (idiom dicts, fuzzy keys and n-gram lists) and its own dict of posting slices.
+        """
+        records = json.loads(self.array("records").tobytes())
+        idioms = records["idioms"]
+        automaton = ArrayAhoCorasick({
+            name[3:]: self.array(name) for name in self.header["sections"] if name.startswith("ac_")
+        })
+        fuzzy_index = FuzzyIndex.from_arrays(
+            ((int(pid), key) for pid, key in records["keys"].items()),
+            {int(n): grams for n, grams in records["grams"].items()},
+            {name[3:]: self.array(name) for name in self.header["sections"] if name.startswith("fz_")},
+        )
+        return IdiomMatcher.from_segment(idioms, _Segment.prebuilt(range(len(idioms)), automaton, fuzzy_index))
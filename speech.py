@@ -0,0 +1,376 @@
+# speech.py
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from metrics import external_call
+
+SPEECH_MAX_UPLOAD_BYTES = int(os.getenv("PAD_SPEECH_MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+SPEECH_MAX_SECONDS = float(os.getenv("PAD_SPEECH_MAX_SECONDS", 10 * 60))
+SPEECH_SAMPLE_RATE = int(os.getenv("PAD_SPEECH_SAMPLE_RATE", 16000))
+# Silence splitting: frames quieter than SILENCE_DBFS for SILENCE_MS end a segment
+SPEECH_SILENCE_DBFS = float(os.getenv("PAD_SPEECH_SILENCE_DBFS", -40))
+SPEECH_SILENCE_MS = int(os.getenv("PAD_SPEECH_SILENCE_MS", 500))
+# Google rejects long clips, so segments are cut here even without a pause
+SPEECH_MAX_SEGMENT_SECONDS = float(os.getenv("PAD_SPEECH_MAX_SEGMENT_SECONDS", 30))
+SPEECH_WORKERS = int(os.getenv("PAD_SPEECH_WORKERS", 4))
+
+# "google" for speech_recognition's Google Web Speech API, "stub" for the offline StubRecognizer
+RECOGNIZER_BACKEND = os.getenv("PAD_RECOGNIZER_BACKEND", "google")
+
+_READ_BLOCK = 64 * 1024
+_FRAME_MS = 30
+# Silence kept around each segment so words aren't clipped
+_PAD_MS = 150
+
+
+class AudioTooLarge(ValueError):
+    """The upload is longer than SPEECH_MAX_SECONDS (or bigger than SPEECH_MAX_UPLOAD_BYTES)."""
+
+
+class GoogleRecognizer:
+    name = "google"
+
+    def __init__(self, language="kn-IN"):
+        self.language = language
+
+    def recognize(self, pcm, sample_rate):
+        """Transcribes 16-bit mono PCM bytes. Returns "" when no speech was recognized."""
+        import speech_recognition as sr  # loaded on first use, see features.py
+        try:
+            return sr.Recognizer().recognize_google(sr.AudioData(pcm, sample_rate, 2), language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class StubRecognizer:
+    """Offline stand-in for GoogleRecognizer. Returns '[speech N.Ns]' after an optional delay."""
+    name = "stub"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def recognize(self, pcm, sample_rate):
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[speech {len(pcm) / 2 / sample_rate:.1f}s]"
+
+
+def make_recognizer():
+    if RECOGNIZER_BACKEND == "stub":
+        return StubRecognizer()
+    return GoogleRecognizer()
+
+
+class AsyncGoogleRecognizer:
+    """
+    The async serving mode's recognizer: speech_recognition builds and parses the Google
+    request, a shared httpx.AsyncClient sends it.
+    """
+    name = "google"
+
+    def __init__(self, client, language="kn-IN"):
+        self.client = client
+        self.language = language
+
+    async def recognize(self, pcm, sample_rate):
+        import speech_recognition as sr  # loaded on first use, see features.py
+        from speech_recognition.recognizers.google import ENDPOINT, OutputParser, create_request_builder
+        builder = create_request_builder(endpoint=ENDPOINT, language=self.language)
+        audio = sr.AudioData(pcm, sample_rate, 2)
+        # FLAC encoding shells out to the flac binary, so it runs off the event loop
+        body = await asyncio.get_running_loop().run_in_executor(None, builder.build_data, audio)
+        r = await self.client.post(builder.build_url(), data=body, headers=builder.build_headers(audio))
+        if r.status_code != 200:
+            raise sr.RequestError(f"recognition request failed: {r.reason_phrase}")
+        try:
+            return OutputParser(show_all=False, with_confidence=False).parse(r.text)
+        except sr.UnknownValueError:
+            return ""
+
+
+class AsyncStubRecognizer(StubRecognizer):
+    async def recognize(self, pcm, sample_rate):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return f"[speech {len(pcm) / 2 / sample_rate:.1f}s]"
+
+
+def make_async_recognizer(client):
+    if RECOGNIZER_BACKEND == "stub":
+        return AsyncStubRecognizer()
+    return AsyncGoogleRecognizer(client)
+
+
+class _Resampler:
+    """Streaming linear-interpolation resampler; carries its position across chunks."""
+
+    def __init__(self, src_rate, dst_rate):
+        self.step = src_rate / dst_rate
+        self.pos = 0.0
+        self.tail = None
+
+    def __call__(self, samples):
+        if self.step == 1.0 or not len(samples):
+            return samples
+        buf = samples if self.tail is None else np.concatenate(([self.tail], samples))
+        last = len(buf) - 1
+        t = np.arange(self.pos, last + 1e-9, self.step) if last >= self.pos else np.array([])
+        self.tail = buf[-1]
+        self.pos = (t[-1] + self.step - last) if len(t) else self.pos - last
+        return np.interp(t, np.arange(len(buf)), buf).astype(np.float32)
+
+
+def _pcm_from_wav(stream, sample_rate):
+    try:
+        wav = wave.open(stream, "rb")
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Unreadable WAV file: {e}")
+    width, channels, rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+    if width not in (1, 2, 4):
+        raise ValueError(f"Unsupported WAV sample width: {width * 8} bits")
+    if wav.getnframes() / rate > SPEECH_MAX_SECONDS:
+        raise AudioTooLarge(f"Audio longer than {SPEECH_MAX_SECONDS:.0f}s")
+
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[width]
+    scale = float(2 ** (8 * width - 1))
+    resample = _Resampler(rate, sample_rate)
+    frames_per_read = max(1, _READ_BLOCK // (width * channels))
+
+    def chunks():
+        with wav:
+            while True:
+                data = wav.readframes(frames_per_read)
+                if not data:
+                    return
+                samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+                if width == 1:
+                    samples -= 128  # 8-bit WAV is unsigned
+                # Downmix to mono and scale to 16-bit
+                samples = samples.reshape(-1, channels).mean(axis=1) * (32768 / scale)
+                yield resample(samples)
+    return chunks()
+
+
+def _pcm_from_ffmpeg(stream, sample_rate):
+    ffmpeg = shutil.which("ffmpeg") or shutil.which("avconv")
+    if not ffmpeg:
+        raise ValueError("Only WAV uploads are supported on this server (ffmpeg is not installed)")
+    proc = subprocess.Popen(
+        [ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+
+    def feed():
+        # Runs beside the reader so neither pipe fills up and deadlocks
+        try:
+            while True:
+                data = stream.read(_READ_BLOCK)
+                if not data:
+                    break
+                proc.stdin.write(data)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def chunks():
+        feeder = threading.Thread(target=feed, name="ffmpeg-feed", daemon=True)
+        feeder.start()
+        try:
+            while True:
+                data = proc.stdout.read(_READ_BLOCK)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32)
+            if proc.wait() != 0:
+                raise ValueError("Could not decode the audio file")
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            feeder.join()
+    return chunks()
+
+
+def open_audio(stream, sample_rate=SPEECH_SAMPLE_RATE):
+    """
+    Validates an upload and returns an iterator of mono float32 sample chunks (16-bit scale) at sample_rate.
+    WAV is read directly; anything else is decoded by an ffmpeg pipe. Either way only one chunk is in memory.
+    """
+    head = stream.read(12)
+    stream.seek(0)
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        chunks = _pcm_from_wav(stream, sample_rate)
+    else:
+        chunks = _pcm_from_ffmpeg(stream, sample_rate)
+
+    def guarded():
+        # Catches long non-WAV files (and lying WAV headers) as they decode
+        limit = SPEECH_MAX_SECONDS * sample_rate
+        seen = 0
+        for chunk in chunks:
+            seen += len(chunk)
+            if seen > limit:
+                chunks.close()
+                raise AudioTooLarge(f"Audio longer than {SPEECH_MAX_SECONDS:.0f}s")
+            yield chunk
+    return guarded()
+
+
+def split_on_silence(chunks, sample_rate=SPEECH_SAMPLE_RATE, silence_dbfs=SPEECH_SILENCE_DBFS,
+                     silence_ms=SPEECH_SILENCE_MS, max_segment_seconds=SPEECH_MAX_SEGMENT_SECONDS):
+    """
+    Yields (start_seconds, end_seconds, int16 samples) for each stretch of speech, as soon as
+    the pause after it is heard. Nothing longer than one segment is buffered.
+    """
+    frame = sample_rate * _FRAME_MS // 1000
+    silence_frames = max(1, silence_ms // _FRAME_MS)
+    pad_frames = min(silence_frames, _PAD_MS // _FRAME_MS)
+    max_frames = max(1, int(max_segment_seconds * 1000 // _FRAME_MS))
+    # RMS threshold in 16-bit units
+    threshold = 32768 * 10 ** (silence_dbfs / 20)
+
+    current = []        # frames of the segment being built
+    start_frame = 0     # index of current[0]
+    silent_run = 0
+    has_speech = False
+    frame_index = 0
+    leftover = np.zeros(0, dtype=np.float32)
+
+    def emit(frames, first):
+        samples = np.clip(np.concatenate(frames), -32768, 32767).astype(np.int16)
+        return first * _FRAME_MS / 1000, (first + len(frames)) * _FRAME_MS / 1000, samples
+
+    def frames_of(chunk):
+        nonlocal leftover
+        buf = np.concatenate((leftover, chunk)) if len(leftover) else chunk
+        n = len(buf) // frame
+        leftover = buf[n * frame:]
+        if n:
+            framed = buf[:n * frame].reshape(n, frame)
+            loud = np.sqrt(np.mean(framed * framed, axis=1)) > threshold
+            yield from zip(framed, loud.tolist())
+
+    for chunk in chunks:
+        for samples, loud in frames_of(chunk):
+            current.append(samples)
+            frame_index += 1
+            if loud:
+                has_speech = True
+                silent_run = 0
+            else:
+                silent_run += 1
+
+            if not has_speech:
+                # Leading silence: keep just enough to pad the start of the next segment
+                if len(current) > pad_frames:
+                    drop = len(current) - pad_frames
+                    current = current[drop:]
+                    start_frame += drop
+            elif silent_run >= silence_frames or len(current) >= max_frames:
+                keep = len(current) - max(silent_run - pad_frames, 0)
+                yield emit(current[:keep], start_frame)
+                current = []
+                start_frame = frame_index
+                silent_run = 0
+                has_speech = False
+
+    if len(leftover):
+        current.append(leftover)
+        rms = np.sqrt(np.mean(leftover * leftover))
+        has_speech = has_speech or rms > threshold
+        silent_run = 0 if rms > threshold else silent_run
+    if has_speech:
+        keep = len(current) - max(silent_run - pad_frames, 0)
+        yield emit(current[:keep], start_frame)
+
+
+# Shared by all requests so the number of in-flight recognizer calls stays bounded
+_POOL = ThreadPoolExecutor(max_workers=SPEECH_WORKERS, thread_name_prefix="recognize")
+
+
+def _recognize(recognizer, samples, sample_rate):
+    with external_call("speech"):
+        return recognizer.recognize(samples.tobytes(), sample_rate)
+
+
+def _segment_result(index, start, end, future):
+    segment = {"index": index, "start": round(start, 2), "end": round(end, 2)}
+    error = future.exception()
+    if error:
+        logging.error(f"Speech segment {index} failed: {error}")
+        segment["error"] = str(error)
+    else:
+        segment["text"] = future.result()
+    return segment
+
+
+def transcribe(chunks, recognizer=None, sample_rate=SPEECH_SAMPLE_RATE, **split_options):
+    """
+    Recognizes speech segments concurrently and yields
+    {"index", "start", "end", "text"} (or "error") in order, each as soon as it and all earlier ones are done.
+    At most 2 x SPEECH_WORKERS segments are in flight, so memory stays bounded for long uploads.
+    """
+    recognizer = recognizer or make_recognizer()
+    in_flight = deque()
+    result = _segment_result
+
+    try:
+        for index, (start, end, samples) in enumerate(split_on_silence(chunks, sample_rate, **split_options)):
+            in_flight.append((index, start, end, _POOL.submit(_recognize, recognizer, samples, sample_rate)))
+            while in_flight and (in_flight[0][3].done() or len(in_flight) >= 2 * SPEECH_WORKERS):
+                yield result(*in_flight.popleft())
+        while in_flight:
+            yield result(*in_flight.popleft())
+    finally:
+        # Client went away or decoding failed: don't leave queued work behind
+        for *_, future in in_flight:
+            future.cancel()
+
+
+async def transcribe_async(chunks, recognizer, sample_rate=SPEECH_SAMPLE_RATE, **split_options):
+    """
+    transcribe() for the event loop: decoding and silence splitting run in a worker thread one
+    segment at a time, recognition calls are awaited concurrently (same 2 x SPEECH_WORKERS bound).
+    """
+    loop = asyncio.get_running_loop()
+    segments = split_on_silence(chunks, sample_rate, **split_options)
+    in_flight = deque()
+
+    async def recognize(samples):
+        with external_call("speech"):
+            return await recognizer.recognize(samples.tobytes(), sample_rate)
+
+    try:
+        index = 0
+        while True:
+            item = await loop.run_in_executor(None, next, segments, None)
+            if item is None:
+                break
+            start, end, samples = item
+            in_flight.append((index, start, end, asyncio.ensure_future(recognize(samples))))
+            index += 1
+            while in_flight and (in_flight[0][3].done() or len(in_flight) >= 2 * SPEECH_WORKERS):
+                await asyncio.wait([in_flight[0][3]])
+                yield _segment_result(*in_flight.popleft())
+        while in_flight:
+            await asyncio.wait([in_flight[0][3]])
+            yield _segment_result(*in_flight.popleft())
+    finally:
+        for *_, task in in_flight:
+            task.cancel()
+        try:
+            segments.close()
+        except ValueError:
+            pass  # still running in its worker thread; it stops with the upload
@@ -39,7 +39,84 @@
     inputBox.addEventListener('input', () => {
       clearTimeout(typingTimer);
       typingTimer = setTimeout(translate, 500);
+      clearTimeout(suggestTimer);
+      suggestTimer = setTimeout(suggestIdioms, 150);
     });
+    inputBox.addEventListener('keydown', e => {
+      if (e.key === 'Escape') hideSuggestions();
+    });
+
+    // ========== IDIOM AUTOCOMPLETE ==========
+    // Suggests idioms matching the last word or two before the caret. Each keystroke cancels
+    // the request still in flight, so only the latest query's answer is ever shown.
+    const suggestionBox = document.getElementById('idiom-suggestions');
+    let suggestTimer;
+    let suggestController = null;
+
+    function hideSuggestions() {
+      suggestionBox.classList.add('hidden');
+      suggestionBox.innerHTML = '';
+    }
+
+    async function fetchSuggestions(query, signal) {
+      const params = new URLSearchParams({ q: query, limit: 8 });
+      const res = await fetch(`/idioms/search?${params}`, { signal });
+      if (!res.ok) return [];
+      return (await res.json()).results;
+    }
+
+    async function suggestIdioms() {
+      if (suggestController) suggestController.abort();
+      const caret = inputBox.selectionStart;
+      const before = inputBox.value.slice(0, caret);
+      const words = before.split(/\s+/);
+      const lastWord = words[words.length - 1];
+      if (!lastWord) return hideSuggestions();
+
+      suggestController = new AbortController();
+      const signal = suggestController.signal;
+      try {
+        // Two words first, so "ಕೈ ಕೊ" narrows to "ಕೈ ಕೊಡು"; the word alone if that finds nothing
+        let query = words.slice(-2).join(' ').trim();
+        let results = await fetchSuggestions(query, signal);
+        if (!results.length && query !== lastWord) {
+          query = lastWord;
+          results = await fetchSuggestions(query, signal);
+        }
+        if (!results.length) return hideSuggestions();
+        showSuggestions(results, caret - query.length, caret);
+      } catch (e) {
+        if (e.name !== 'AbortError') hideSuggestions();
+      }
+    }
+
+    function showSuggestions(results, start, end) {
+      suggestionBox.innerHTML = '';
+      for (const item of results) {
+        const option = document.createElement('button');
+        option.type = 'button';
+        option.className = 'block w-full text-left px-3 py-2 hover:bg-blue-50';
+        const idiom = document.createElement('span');
+        idiom.className = 'kannada-font font-semibold';
+        idiom.textContent = item.idiom;
+        const meaning = document.createElement('span');
+        meaning.className = 'kannada-font text-sm text-slate-500 ml-2';
+        meaning.textContent = item.explanation_kannada || '';
+        option.append(idiom, meaning);
+        option.addEventListener('click', () => {
+          const text = inputBox.value;
+          inputBox.value = text.slice(0, start) + item.idiom + text.slice(end);
+          const caret = start + item.idiom.length;
+          inputBox.setSelectionRange(caret, caret);
+          inputBox.focus();
+          hideSuggestions();
+          clearTimeout(typingTimer);
+          translate();
+        });
+        suggestionBox.appendChild(option);
+      }
+      suggestionBox.classList.remove('hidden');
+    }
 
     
     // ========== UPDATED TRANSLATE FUNCTION  ==========
@@ -167,16 +244,11 @@
     // ========== END OF UPDATED FUNCTION ==========
     // ===================================================================
 
-    async function loadHistory() {
-      try {
-        const res = await fetch('http://127.0.0.1:5000/history');
-        const history = await res.json();
-        let html = "";
-        if (history.length === 0) {
-          html = `<p class="text-slate-500 text-center">Your history is empty.</p>`;
-        } else {
-          history.reverse().forEach(entry => {
-            html += `<div class="p-3 border rounded-lg bg-slate-50 flex items-start space-x-2">
+    // History is paged newest-first; the "Load more" button follows next_cursor
+    let historyCursor = null;
+
+    function historyEntryHtml(entry) {
+      return `<div class="p-3 border rounded-lg bg-slate-50 flex items-start space-x-2">
               <input type="checkbox" class="history-checkbox mt-1" value="${entry.timestamp}">
               <div>
                 <p class="text-xs text-slate-400 mb-1">${entry.timestamp}</p>
@@ -184,10 +256,32 @@
                 <p class="text-slate-600">➡️ ${entry.translation}</p>
               </div>
             </div>`;
-          });
+    }
+
+    async function loadHistory(more = false) {
+      try {
+        const params = new URLSearchParams({ limit: 50 });
+        if (more && historyCursor) params.set('cursor', historyCursor);
+        const res = await fetch(`http://127.0.0.1:5000/history?${params}`);
+        const page = await res.json();
+        const container = document.getElementById('history');
+        document.getElementById('history-more')?.remove();
+
+        let html = page.items.map(historyEntryHtml).join("");
+        if (!more && page.items.length === 0) {
+          html = `<p class="text-slate-500 text-center">Your history is empty.</p>`;
+        }
+        if (page.next_cursor) {
+          html += `<button id="history-more" onclick="loadHistory(true)" class="w-full text-blue-600 hover:underline py-2">Load more</button>`;
+        }
+        historyCursor = page.next_cursor;
+
+        if (more) {
+          container.insertAdjacentHTML('beforeend', html);
+        } else {
+          container.innerHTML = html;
+          toggleModal('history-modal', true);
         }
-        document.getElementById('history').innerHTML = html;
-        toggleModal('history-modal', true);
       } catch {
         alert('Could not load history.');
       }
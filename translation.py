@@ -0,0 +1,362 @@
+# translation.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import external_call
+
+TRANSLATION_CACHE_PATH = os.getenv("PAD_TRANSLATION_CACHE_PATH", "translation_cache.sqlite3")
+TRANSLATION_CACHE_TTL = int(os.getenv("PAD_TRANSLATION_CACHE_TTL", 30 * 24 * 60 * 60))
+TRANSLATION_CACHE_MEMORY_SIZE = int(os.getenv("PAD_TRANSLATION_CACHE_MEMORY_SIZE", 5000))
+TRANSLATION_CACHE_DISK_SIZE = int(os.getenv("PAD_TRANSLATION_CACHE_DISK_SIZE", 200000))
+
+# "google" for googletrans, "stub" for the offline StubTranslator
+TRANSLATOR_BACKEND = os.getenv("PAD_TRANSLATOR_BACKEND", "google")
+TRANSLATION_POOL_SIZE = int(os.getenv("PAD_TRANSLATION_POOL_SIZE", 8))
+TRANSLATION_CALL_TIMEOUT = float(os.getenv("PAD_TRANSLATION_CALL_TIMEOUT", 5))
+TRANSLATION_DEADLINE = float(os.getenv("PAD_TRANSLATION_DEADLINE", 10))
+
+
+class StubTranslator:
+    """Offline stand-in for googletrans.Translator. Returns '[dest] text' after an optional delay."""
+
+    class Result:
+        def __init__(self, text, src, dest):
+            self.text = text
+            self.src = src
+            self.dest = dest
+
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on or set()
+
+    def translate(self, text, dest="en", src="auto"):
+        if self.delay:
+            time.sleep(self.delay)
+        if text in self.fail_on:
+            raise RuntimeError(f"Stub translator refused '{text}'")
+        return self.Result(f"[{dest}] {text}", src, dest)
+
+
+def make_translator():
+    if TRANSLATOR_BACKEND == "stub":
+        return StubTranslator()
+    # Imported here so the stub backend (and import time) never pays for googletrans
+    from googletrans import Translator
+    return Translator(timeout=TRANSLATION_CALL_TIMEOUT)
+
+
+class TranslationCache:
+    """
+    Two-tier cache for (text, src, dest) -> translation.
+    An in-process LRU sits in front of a SQLite file that survives restarts.
+    """
+
+    def __init__(self, path, ttl, memory_size, disk_size):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_evict = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _db(self):
+        # Opened lazily so importing this module never touches the disk
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " text TEXT NOT NULL, src TEXT NOT NULL, dest TEXT NOT NULL,"
+                " translation TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (text, src, dest))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_translations_accessed ON translations (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get(self, text, src, dest):
+        key = (text, src, dest)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT translation, created_at FROM translations WHERE text=? AND src=? AND dest=?", key
+                ).fetchone()
+                if row and row[1] + self.ttl > now:
+                    db.execute("UPDATE translations SET accessed_at=? WHERE text=? AND src=? AND dest=?",
+                               (now,) + key)
+                    db.commit()
+                    self._remember(key, row[0], row[1] + self.ttl)
+                    self.counters["disk_hits"] += 1
+                    return row[0]
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache read failed: {e}")
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, text, src, dest, translation):
+        self.set_many([((text, src, dest), translation)])
+
+    def set_many(self, items):
+        """Stores [((text, src, dest), translation), ...] with a single commit."""
+        now = time.time()
+        with self._lock:
+            for key, translation in items:
+                self._remember(key, translation, now + self.ttl)
+            self.counters["stores"] += len(items)
+            try:
+                db = self._db()
+                db.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                               [key + (translation, now, now) for key, translation in items])
+                self._writes_since_evict += len(items)
+                # Counting rows on every write is wasteful; trim in batches
+                if self._writes_since_evict >= max(1, self.disk_size // 100):
+                    self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache write failed: {e}")
+
+    def _evict(self, db, now):
+        self._writes_since_evict = 0
+        expired = db.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl,)).rowcount
+        (count,) = db.execute("SELECT COUNT(*) FROM translations").fetchone()
+        overflow = count - self.disk_size
+        if overflow > 0:
+            db.execute(
+                "DELETE FROM translations WHERE rowid IN"
+                " (SELECT rowid FROM translations ORDER BY accessed_at LIMIT ?)", (overflow,)
+            )
+        self.counters["evictions"] += expired + max(overflow, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            try:
+                self._db().execute("DELETE FROM translations")
+                self._db().commit()
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache clear failed: {e}")
+
+
+TRANSLATION_CACHE = TranslationCache(
+    TRANSLATION_CACHE_PATH, TRANSLATION_CACHE_TTL, TRANSLATION_CACHE_MEMORY_SIZE, TRANSLATION_CACHE_DISK_SIZE
+)
+
+
+def translate_text(text, src, dest, translator=None):
+    """
+    Cached replacement for Translator().translate(text, src, dest).text.
+    Raises like googletrans does on failure; failures are never cached.
+    """
+    cached = TRANSLATION_CACHE.get(text, src, dest)
+    if cached is not None:
+        return cached
+    translator = translator or make_translator()
+    with external_call("translate"):
+        result = translator.translate(text, src=src, dest=dest).text
+    TRANSLATION_CACHE.set(text, src, dest, result)
+    return result
+
+
+def warm_idiom_translations(idiom, explanation_kannada, translator=None):
+    """Precomputes the translations /translate needs for an idiom so the hot path hits the cache."""
+    translator = translator or make_translator()
+    for text in (idiom, explanation_kannada):
+        if not text:
+            continue
+        try:
+            translate_text(text, "kn", "en", translator)
+        except Exception as e:
+            logging.error(f"Could not precompute translation for '{text}': {e}")
+
+
+# Shared by all requests so the number of in-flight googletrans calls stays bounded
+_POOL = ThreadPoolExecutor(max_workers=TRANSLATION_POOL_SIZE, thread_name_prefix="translate")
+_local = threading.local()
+
+
+def _pooled_translate(text, src, dest, started, translator_factory):
+    started[(text, src, dest)] = time.monotonic()
+    # One translator per worker thread keeps its HTTP connection alive between calls
+    translator = getattr(_local, "translator", None)
+    if translator is None or getattr(_local, "factory", None) is not translator_factory:
+        translator = translator_factory()
+        _local.translator = translator
+        _local.factory = translator_factory
+    # The caller already missed the cache, so go straight to the translator
+    with external_call("translate"):
+        result = translator.translate(text, src=src, dest=dest).text
+    TRANSLATION_CACHE.set(text, src, dest, result)
+    return result
+
+
+def translate_many(jobs, call_timeout=None, deadline=None, translator_factory=None):
+    """
+    Runs {key: (text, src, dest)} translations concurrently.
+    Returns {key: translation}, or the exception for calls that failed or ran out of time.
+    Identical requests are only sent once.
+    """
+    call_timeout = call_timeout or TRANSLATION_CALL_TIMEOUT
+    deadline = deadline or TRANSLATION_DEADLINE
+    translator_factory = translator_factory or make_translator
+
+    outcomes = {}
+    started = {}
+    futures = {}
+    for triple in set(jobs.values()):
+        cached = TRANSLATION_CACHE.get(*triple)
+        if cached is not None:
+            outcomes[triple] = cached
+        else:
+            futures[_POOL.submit(_pooled_translate, *triple, started, translator_factory)] = triple
+
+    give_up_at = time.monotonic() + deadline
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for future in list(pending):
+            t0 = started.get(futures[future])
+            if t0 is not None and now - t0 >= call_timeout:
+                pending.discard(future)
+                outcomes[futures[future]] = TimeoutError(f"Translation took longer than {call_timeout}s")
+        if not pending or now >= give_up_at:
+            break
+        # Wake up for the next completion, the next per-call expiry or the deadline
+        expiries = [started[futures[f]] + call_timeout for f in pending if futures[f] in started]
+        wake_at = min(expiries + [give_up_at, now + call_timeout])
+        done, pending = wait(pending, timeout=max(wake_at - now, 0.001), return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            outcomes[futures[future]] = error if error else future.result()
+
+    for future in pending:
+        future.cancel()
+        outcomes[futures[future]] = TimeoutError(f"Translation missed the {deadline}s request deadline")
+
+    return {key: outcomes[triple] for key, triple in jobs.items()}
+
+
+# --- Async serving mode (asgi.py) ---
+
+class AsyncGoogleTranslator:
+    """
+    Sends googletrans' own RPC request through a shared httpx.AsyncClient and lets
+    googletrans parse the reply, so results match the sync Translator exactly.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def translate(self, text, dest="en", src="auto"):
+        from googletrans import Translator, urls  # loaded on first use, see features.py
+        from googletrans.client import RPC_ID
+        from googletrans.constants import DEFAULT_CLIENT_SERVICE_URLS, DEFAULT_USER_AGENT
+
+        r = await self.client.post(
+            urls.TRANSLATE_RPC.format(host=DEFAULT_CLIENT_SERVICE_URLS[0]),
+            params={"rpcids": RPC_ID, "bl": "boq_translate-webserver_20201207.13_p0",
+                    "soc-app": 1, "soc-platform": 1, "soc-device": 1, "rt": "c"},
+            data={"f.req": Translator._build_rpc_request(None, text, dest, src)},
+            headers={"User-Agent": DEFAULT_USER_AGENT, "Referer": "https://translate.google.com"},
+        )
+        if r.status_code != 200:
+            raise Exception(f'Unexpected status code "{r.status_code}" from Google Translate')
+
+        class Fetched(Translator):
+            # Translator.translate() with the HTTP call already done
+            def __init__(self):
+                pass
+
+            def _translate(self, text, dest, src):
+                return r.text, r
+        return Fetched().translate(text, dest=dest, src=src)
+
+
+class AsyncStubTranslator(StubTranslator):
+    async def translate(self, text, dest="en", src="auto"):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if text in self.fail_on:
+            raise RuntimeError(f"Stub translator refused '{text}'")
+        return self.Result(f"[{dest}] {text}", src, dest)
+
+
+def make_async_translator(client):
+    if TRANSLATOR_BACKEND == "stub":
+        return AsyncStubTranslator()
+    return AsyncGoogleTranslator(client)
+
+
+async def translate_many_async(jobs, translator, call_timeout=None, deadline=None, run_sync=None):
+    """
+    translate_many() for the event loop: same inputs, outputs and timeouts, no thread per call.
+    The translation cache is SQLite behind a lock, so its reads and writes go through
+    run_sync(fn, *args) (e.g. AsyncApp.run_sync; the loop's default executor if None).
+    """
+    call_timeout = call_timeout or TRANSLATION_CALL_TIMEOUT
+    deadline = deadline or TRANSLATION_DEADLINE
+    if run_sync is None:
+        loop = asyncio.get_running_loop()
+        run_sync = lambda fn, *args: loop.run_in_executor(None, fn, *args)
+
+    async def call(text, src, dest):
+        with external_call("translate"):
+            result = (await asyncio.wait_for(translator.translate(text, src=src, dest=dest), call_timeout)).text
+        await run_sync(TRANSLATION_CACHE.set, text, src, dest, result)
+        return result
+
+    triples = set(jobs.values())
+    # One trip to the pool for every lookup
+    cached = await run_sync(lambda: {triple: TRANSLATION_CACHE.get(*triple) for triple in triples})
+    outcomes = {}
+    tasks = {}
+    for triple in triples:
+        if cached[triple] is not None:
+            outcomes[triple] = cached[triple]
+        else:
+            tasks[triple] = asyncio.ensure_future(call(*triple))
+
+    if tasks:
+        _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        for task in pending:
+            task.cancel()
+    for triple, task in tasks.items():
+        if not task.done() or task.cancelled():
+            outcomes[triple] = TimeoutError(f"Translation missed the {deadline}s request deadline")
+        elif isinstance(task.exception(), asyncio.TimeoutError):
+            outcomes[triple] = TimeoutError(f"Translation took longer than {call_timeout}s")
+        else:
+            outcomes[triple] = task.exception() or task.result()
+
+    return {key: outcomes[triple] for key, triple in jobs.items()}
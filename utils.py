@@ -1,31 +1,226 @@
 # utils.py
 import logging
+from flask import current_app
 from extensions import db
-from models import Idiom
+from models import Idiom, IdiomVersion
+from matcher import IdiomMatcher
+from metrics import span
+from search_index import IdiomSearchIndex, search_key
+from history_rollup import idiom_counts
+from snapshot import IdiomSnapshot, write_snapshot
 import os
+import threading
+import time
 from datetime import datetime
 
+IDIOM_VERSION_POLL_SECONDS = float(os.getenv("PAD_IDIOM_VERSION_POLL_SECONDS", 5))
+# After a failed poll or reload, wait twice as long each time (up to this) before touching the DB again
+IDIOM_REFRESH_MAX_BACKOFF = float(os.getenv("PAD_IDIOM_REFRESH_MAX_BACKOFF", 60))
+# Precompiled idiom snapshot (see `flask build-idiom-snapshot`); empty to always load from the DB
+IDIOM_SNAPSHOT_PATH = os.getenv("PAD_IDIOM_SNAPSHOT_PATH", "idioms.snapshot")
+# How stale the History popularity behind /idioms/search ranking may get before a rebuild
+SEARCH_POPULARITY_TTL = float(os.getenv("PAD_SEARCH_POPULARITY_TTL", 600))
+
 # GLOBAL CACHE
-IDIOM_CACHE = []
+IDIOM_MATCHER = IdiomMatcher([])
+IDIOM_VERSION = None          # idiom_version.version the cache reflects (None = never loaded)
+_idiom_pair = (IDIOM_MATCHER, IDIOM_VERSION)   # pinned matcher and its version, swapped as one
+_cache_lock = threading.RLock()   # one poll/reload/in-place change at a time
+_next_version_check = 0.0
+_refresh_failures = 0
+IDIOM_SEARCH_INDEX = None     # IdiomSearchIndex over the cached idioms, rebuilt in the background
+_search_built_at = 0.0
+_search_lock = threading.Lock()
+_search_rebuilding = False
+
+def current_idiom_version():
+    return db.session.execute(db.select(IdiomVersion.version).where(IdiomVersion.id == 1)).scalar() or 0
+
+def bump_idiom_version():
+    """Increments the shared idiom version inside the caller's transaction and returns it"""
+    result = db.session.execute(
+        db.update(IdiomVersion).where(IdiomVersion.id == 1).values(version=IdiomVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(IdiomVersion(id=1, version=1))
+        db.session.flush()
+    return current_idiom_version()
+
+def load_idiom_snapshot(version):
+    """The matcher from the precompiled snapshot, or None if it is missing or doesn't match the DB."""
+    if not IDIOM_SNAPSHOT_PATH or not os.path.exists(IDIOM_SNAPSHOT_PATH):
+        return None
+    try:
+        snapshot = IdiomSnapshot(IDIOM_SNAPSHOT_PATH)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring idiom snapshot: {e}")
+        return None
+    # The count catches rows added behind the app's back (e.g. straight from schema.sql)
+    count = Idiom.query.count() if snapshot.idiom_version == version else None
+    if snapshot.idiom_version != version or snapshot.count != count:
+        logging.info(f"Idiom snapshot is stale ({snapshot.count} idioms at version {snapshot.idiom_version}, "
+                     f"DB at version {version}); loading from the DB.")
+        return None
+    return snapshot.matcher()
+
+def build_idiom_snapshot(path=None):
+    """Compiles the idioms table into a snapshot file. Returns (version, count)."""
+    version = current_idiom_version()
+    count = write_snapshot(path or IDIOM_SNAPSHOT_PATH, [idiom.to_dict() for idiom in Idiom.query.all()], version)
+    return version, count
+
+def _schedule_version_check(ok):
+    """Next poll in IDIOM_VERSION_POLL_SECONDS after a success, later and later after failures."""
+    global _next_version_check, _refresh_failures
+    _refresh_failures = 0 if ok else _refresh_failures + 1
+    delay = min(IDIOM_REFRESH_MAX_BACKOFF, IDIOM_VERSION_POLL_SECONDS * 2 ** _refresh_failures)
+    _next_version_check = time.monotonic() + delay
+
+def _publish(matcher, version):
+    """Installs the matcher and the version it reflects (caller holds _cache_lock)."""
+    global IDIOM_MATCHER, IDIOM_VERSION, _idiom_pair
+    IDIOM_MATCHER, IDIOM_VERSION = matcher, version
+    _idiom_pair = (matcher.pinned(), version)
 
 def refresh_idiom_cache():
-    """Fetches all idioms, converts to dicts, sorts, and stores in RAM."""
-    global IDIOM_CACHE
+    """Fetches all idioms, converts to dicts, sorts, and stores in RAM. Returns False if it failed."""
+    with _cache_lock:
+        try:
+            with span("idiom_cache_refresh"):
+                # Read the version first: a change landing mid-load just triggers another reload
+                version = current_idiom_version()
+                matcher = load_idiom_snapshot(version)
+                source = "snapshot"
+                if matcher is None:
+                    all_idioms = Idiom.query.all()
+                    # Convert to list of dicts; the matcher sorts them longest first
+                    matcher = IdiomMatcher([idiom.to_dict() for idiom in all_idioms])
+                    source = "database"
+        except Exception as e:
+            logging.error(f"Failed to refresh cache: {e}")
+            _schedule_version_check(False)
+            return False
+        _publish(matcher, version)
+        _schedule_version_check(True)
+        logging.info(f"Cache refreshed! Loaded {len(IDIOM_MATCHER)} idioms (version {version}) from the {source}.")
+        return True
+
+def sync_idiom_cache():
+    """
+    Reloads when another worker changed the idioms. Polls the version row at most every few
+    seconds, and only one thread does it: the others keep serving the matcher they have
+    (or wait for it, before the first load) instead of each reloading.
+    """
+    if time.monotonic() < _next_version_check:
+        return
+    if not _cache_lock.acquire(blocking=IDIOM_VERSION is None):
+        return
     try:
-        all_idioms = Idiom.query.all()
-        # Convert to list of dicts
-        IDIOM_CACHE = [idiom.to_dict() for idiom in all_idioms]
-        # Sort by length (longest first)
-        IDIOM_CACHE.sort(key=lambda x: len(x['idiom']), reverse=True)
-        logging.info(f"Cache refreshed! Loaded {len(IDIOM_CACHE)} idioms.")
-    except Exception as e:
-        logging.error(f"Failed to refresh cache: {e}")
+        # Someone else may have polled or reloaded while this thread waited
+        if time.monotonic() < _next_version_check:
+            return
+        try:
+            version = current_idiom_version()
+        except Exception as e:
+            logging.error(f"Failed to read idiom version: {e}")
+            _schedule_version_check(False)
+            return
+        if version != IDIOM_VERSION:
+            refresh_idiom_cache()
+        else:
+            _schedule_version_check(True)
+    finally:
+        _cache_lock.release()
+
+def _apply_cache_change(version, change):
+    """
+    Applies a local change in place, unless changes from other workers were missed.
+    Returns True when applied in place, i.e. version - 1 differs from version by this change alone.
+    """
+    with _cache_lock:
+        if IDIOM_VERSION is None or version != IDIOM_VERSION + 1:
+            refresh_idiom_cache()
+            return False
+        change(IDIOM_MATCHER)
+        _publish(IDIOM_MATCHER, version)
+        return True
+
+def upsert_cached_idiom(idiom_dict, version):
+    """Adds/updates one idiom in the matcher after a commit that bumped the version to `version`."""
+    return _apply_cache_change(version, lambda matcher: matcher.upsert(idiom_dict))
+
+def delete_cached_idiom(idiom, version):
+    """Drops one idiom from the matcher after a commit that bumped the version to `version`."""
+    return _apply_cache_change(version, lambda matcher: matcher.delete(idiom))
 
 def get_cached_idioms():
-    global IDIOM_CACHE
-    if not IDIOM_CACHE:
-        refresh_idiom_cache()
-    return IDIOM_CACHE
+    return get_idiom_matcher().idioms
+
+def get_idiom_matcher():
+    sync_idiom_cache()
+    return IDIOM_MATCHER
+
+def load_idiom_popularity():
+    """How often each idiom was detected, from the History rollup, keyed by search_key()."""
+    popularity = {}
+    for idiom, count in idiom_counts().items():
+        key = search_key(idiom)
+        popularity[key] = popularity.get(key, 0) + count
+    return popularity
+
+def build_idiom_search_index():
+    global IDIOM_SEARCH_INDEX, _search_built_at
+    idioms = get_cached_idioms()
+    try:
+        popularity = load_idiom_popularity()
+    except Exception as e:
+        logging.error(f"Failed to load idiom popularity: {e}")
+        # Keep ranking by the last counts we had
+        popularity = IDIOM_SEARCH_INDEX.popularity if IDIOM_SEARCH_INDEX else None
+    with span("idiom_search_build"):
+        index = IdiomSearchIndex(idioms, popularity)
+    IDIOM_SEARCH_INDEX, _search_built_at = index, time.monotonic()
+    return index
+
+def get_idiom_search_index():
+    """
+    The search index for the cached idioms. Built on first use; after that, a change to the
+    idioms (or stale popularity) rebuilds it on a background thread while the old one keeps answering.
+    """
+    global _search_rebuilding
+    idioms = get_cached_idioms()
+    index = IDIOM_SEARCH_INDEX
+    if index is None:
+        with _search_lock:
+            return IDIOM_SEARCH_INDEX or build_idiom_search_index()
+    if index.source is idioms and time.monotonic() - _search_built_at < SEARCH_POPULARITY_TTL:
+        return index
+    with _search_lock:
+        if _search_rebuilding:
+            return index
+        _search_rebuilding = True
+    app = current_app._get_current_object()
+
+    def rebuild():
+        global _search_rebuilding
+        try:
+            with app.app_context():
+                build_idiom_search_index()
+        except Exception as e:
+            logging.error(f"Failed to rebuild idiom search index: {e}")
+        finally:
+            _search_rebuilding = False
+    threading.Thread(target=rebuild, name="idiom-search-index", daemon=True).start()
+    return index
+
+def get_idiom_matcher_and_version():
+    """
+    (matcher, version) read as one pair, with the matcher pinned to exactly the idioms of that
+    version (None if they never loaded). Anything built from the matcher can be cached under
+    the version without an approve landing in between mixing old idioms with a new version.
+    """
+    sync_idiom_cache()
+    return _idiom_pair
 
 
 def datetimeformat(value):